@@ -0,0 +1,149 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Dict, Optional
+
+from result_journal import normalize_question
+
+CACHE_MODES = ("read", "write", "off")
+# Other names accepted for a mode
+CACHE_MODE_ALIASES = {"refresh": "write"}
+
+
+class AnswerCache:
+    """Persistent on-disk cache of completed research answers.
+
+    Entries are keyed on the normalized question plus a context dict, expire
+    after ttl_seconds and are evicted least recently used beyond max_bytes.
+    Modes: "read" serves and stores, "write" (alias "refresh") only stores, "off" does neither.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        context: Dict,
+        mode: str = "read",
+        ttl_seconds: float = 7 * 24 * 3600,
+        max_bytes: int = 512 * 1024 * 1024
+    ):
+        mode = CACHE_MODE_ALIASES.get(mode, mode)
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown cache mode: {mode}")
+        self.path = path
+        self.context = context
+        self.mode = mode
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = None
+        if mode != "off":
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS answers ("
+                "key TEXT PRIMARY KEY, payload TEXT NOT NULL, size INTEGER NOT NULL, "
+                "created_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS answers_last_access ON answers (last_access)")
+            self._conn.commit()
+
+    @property
+    def reads(self) -> bool:
+        return self.mode == "read"
+
+    @property
+    def writes(self) -> bool:
+        return self.mode in ("read", "write")
+
+    def key(self, question: str) -> str:
+        """Cache key for a question under this cache's context."""
+        material = json.dumps([normalize_question(question), self.context], sort_keys=True)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def get(self, question: str) -> Optional[Dict]:
+        """Return the cached result for a question, or None on a miss or expired entry."""
+        if not self.reads:
+            return None
+        key = self.key(question)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload, created_at FROM answers WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            payload, created_at = row
+            if now - created_at > self.ttl_seconds:
+                self._conn.execute("DELETE FROM answers WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE answers SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        return json.loads(payload)
+
+    def put(self, question: str, result: Dict):
+        """Store a completed result and evict least recently used entries over the size cap."""
+        if not self.writes:
+            return
+        payload = json.dumps(result, ensure_ascii=False)
+        size = len(payload.encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answers (key, payload, size, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (self.key(question), payload, size, now, now),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """Drop expired entries, then least recently used ones until under max_bytes."""
+        self._conn.execute("DELETE FROM answers WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM answers").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._conn.execute(
+            "SELECT key, size FROM answers ORDER BY last_access ASC"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM answers WHERE key = ?", (key,))
+            total -= size
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+def cached_result(question: str, cached: Dict, lookup_time: float) -> Dict:
+    """Build a result for a cache hit.
+
+    The hit costs no tokens; the original run's time and tokens are kept as
+    saved_time / saved_tokens so reports can show what the cache saved.
+    """
+    original = cached["metrics"]
+    return {
+        "question": question,
+        "status": cached["status"],
+        "error": None,
+        "metrics": {
+            "time_to_first_token": lookup_time,
+            "total_time": lookup_time,
+            "tokens_in": 0,
+            "tokens_out": 0,
+            "total_tokens": 0,
+            "response_text": original["response_text"],
+            "citations": original["citations"],
+            "cache_hit": True,
+            "saved_time": original["total_time"],
+            "saved_tokens": original["total_tokens"],
+        }
+    }
@@ -1,169 +1,631 @@
+import io
 import os
-import csv
-import json
+import sys
 import time
+import asyncio
+import argparse
+import concurrent.futures
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Dict, Iterable, List, Optional, Tuple
 from azure.ai.projects import AIProjectClient
 from azure.identity import DefaultAzureCredential
 from azure.ai.agents import AgentsClient
-from azure.ai.agents.models import DeepResearchTool, MessageRole, ThreadMessage
+from azure.ai.agents.aio import AgentsClient as AsyncAgentsClient
+from azure.identity.aio import DefaultAzureCredential as AsyncDefaultAzureCredential
+from azure.ai.agents.models import DeepResearchTool
 from dotenv import load_dotenv
+# Helpers shared by the research runners live in ../common
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+from poll_scheduler import PollScheduler, FixedPollScheduler, create_poll_scheduler
+from answer_cache import AnswerCache, CACHE_MODE_ALIASES, CACHE_MODES, cached_result
+from question_dedup import DEFAULT_THRESHOLD, group_near_duplicates, save_dedup_report
+from rate_limiter import RateLimiter, create_rate_limiter
+from thread_provisioner import ThreadProvisioner, create_thread_provisioner
+from phase_timing import PhaseTimer, write_phase_table
+from cost_order import ORDER_MODES, CostEstimator, order_questions, write_estimate_summary
+from run_submit import CREATE_MODES, CombinedCreate
+from question_reader import iter_questions
+from result_writer import ResultWriter, write_text
+from result_spool import ResultSpool
+from result_journal import (
+    JOURNAL_FILENAME,
+    ResultJournal,
+    compact_journal,
+    read_journal_ordered,
+    summarize_result,
+)
+from sharding import Shard, merge_shard_results, parse_shard, select_shard, write_shard_manifest
+from retry_policy import RetryPolicy, create_retry_policy
+from question_runner import Attempt, run_question, run_question_async
+from batch_deadline import DEADLINE_REACHED, BatchDeadline, create_batch_deadline
+from connection_cache import create_connection_cache, with_connection
+from preflight import PROJECT_SCOPE, AsyncSharedTokenCredential, SharedTokenCredential, run_preflight
+from agent_registry import create_agent_registry, get_or_create_agent
+from token_budget import ADMIT, BUDGET_EXHAUSTED, WAIT, TokenBudget, create_token_budget
+from graceful_shutdown import GracefulShutdown, create_graceful_shutdown, print_incomplete
 
 
 # Load environment variables from .env file
 load_dotenv()
 
+AGENT_INSTRUCTIONS = "You are a helpful Agent that assists in researching topics.  You will be provided a question to answer that you must do your best to answer without asking for clarity.  Just answer it."
 
 def read_questions(file_path: str) -> List[str]:
-    """Read questions from JSON or CSV file."""
-    questions = []
-    if file_path.endswith('.json'):
-        with open(file_path, 'r', encoding='utf-8') as f:
-            questions = json.load(f)
-    else:
-        # Fallback to CSV reading
-        with open(file_path, 'r', encoding='utf-8') as f:
-            reader = csv.reader(f)
-            for row in reader:
-                if row:  # Skip empty rows
-                    questions.append(row[0])
-    return questions
+    """Read all questions from a JSONL, JSON or CSV file into a list.
+    
+    Use question_reader.iter_questions to stream large files instead.
+    """
+    return list(iter_questions(file_path))
+
+def build_result(
+    question: str,
+    run,
+    start_time: float,
+    time_to_first_token: Optional[float],
+    response_text: str,
+    citations: List[Dict]
+) -> Dict:
+    """Build the result dictionary for a finished run."""
+    # Calculate metrics
+    total_time = time.time() - start_time
+    
+    # Get token usage (if available from run)
+    tokens_in = getattr(run.usage, 'prompt_tokens', 0) if hasattr(run, 'usage') else 0
+    tokens_out = getattr(run.usage, 'completion_tokens', 0) if hasattr(run, 'usage') else 0
+    total_tokens = tokens_in + tokens_out
+    
+    return {
+        "question": question,
+        "status": run.status,
+        "error": str(run.last_error) if run.status == "failed" else None,
+        "metrics": {
+            "time_to_first_token": time_to_first_token,
+            "total_time": total_time,
+            "tokens_in": tokens_in,
+            "tokens_out": tokens_out,
+            "total_tokens": total_tokens,
+            "response_text": response_text,
+            "citations": citations,
+            "cache_hit": False
+        }
+    }
+
+def build_error_result(question: str, error: Exception, start_time: float) -> Dict:
+    """Build the result dictionary for a question that raised an exception."""
+    return {
+        "question": question,
+        "status": "error",
+        "error": str(error),
+        "metrics": {
+            "time_to_first_token": None,
+            "total_time": time.time() - start_time,
+            "tokens_in": 0,
+            "tokens_out": 0,
+            "total_tokens": 0,
+            "response_text": "",
+            "citations": [],
+            "cache_hit": False
+        }
+    }
+
+def build_skipped_result(question: str, reason: str) -> Dict:
+    """Build the result dictionary for a question that was never started."""
+    result = build_error_result(question, Exception(reason), time.time())
+    result["status"] = "skipped"
+    result["metrics"]["skip_reason"] = reason
+    return result
+
+def budget_skipped_result(question: str, batch_deadline: Optional[BatchDeadline]) -> Dict:
+    """Result for a question the exhausted token budget never started; it no longer shares the deadline's time."""
+    skipped = build_skipped_result(question, BUDGET_EXHAUSTED)
+    if batch_deadline:
+        batch_deadline.settle(skipped)
+    return skipped
+
+def lookup_cached_result(question: str, answer_cache: Optional[AnswerCache]) -> Optional[Dict]:
+    """Return a cache-hit result for the question, or None when there is no usable cache entry."""
+    if answer_cache is None:
+        return None
+    lookup_start = time.time()
+    cached = answer_cache.get(question)
+    if cached is None:
+        return None
+    return cached_result(question, cached, time.time() - lookup_start)
+
+def attempt_result(question: str, attempt: Attempt) -> Dict:
+    """Build the result dictionary for one attempt at a question (see question_runner.py)."""
+    if attempt.error is not None:
+        return build_error_result(question, attempt.error, attempt.start_time)
+    result = build_result(
+        question, attempt.run, attempt.start_time, attempt.time_to_first_token, attempt.response_text, attempt.citations
+    )
+    result["metrics"]["requeues"] = attempt.requeues
+    if attempt.stream_metrics:
+        result["metrics"].update(attempt.stream_metrics)
+    if attempt.cap_error:
+        result["status"] = "cancelled"
+        result["error"] = attempt.cap_error
+    return result
+
+def start_under_deadline(index: int, batch_deadline: BatchDeadline) -> Optional[float]:
+    """Monotonic time by which a question starting now must finish, or None to leave it unstarted."""
+    timeout = batch_deadline.start()
+    if timeout is None:
+        print(f"Not starting question {index}: too little time is left before the batch deadline")
+        return None
+    print(f"Question {index} may take up to {timeout:.0f}s to meet the batch deadline")
+    return time.monotonic() + timeout
+
+def process_question(
+    question: str,
+    index: int,
+    total: Optional[int],
+    agents_client: AgentsClient,
+    agent_id: str,
+    output_base_path: str,
+    poll_scheduler: Optional[PollScheduler] = None,
+    stream: bool = False,
+    answer_cache: Optional[AnswerCache] = None,
+    rate_limiter: Optional[RateLimiter] = None,
+    retry_policy: Optional[RetryPolicy] = None,
+    thread_provisioner: Optional[ThreadProvisioner] = None,
+    combined_create: Optional[CombinedCreate] = None,
+    token_budget: Optional[TokenBudget] = None,
+    result_writer: Optional[ResultWriter] = None,
+    batch_deadline: Optional[BatchDeadline] = None
+) -> Dict:
+    """Run a single research question to completion, save its markdown file and return its result.
+    
+    The optional helpers are those of process_batch_research (see README.md).
+    """
+    poll_scheduler = poll_scheduler or FixedPollScheduler()
+    retry_policy = retry_policy or RetryPolicy(max_attempts=1)
+    print(f"\nProcessing question {index}/{total or '?'}:")
+    print(f"Question: {question}")
+    
+    cached = lookup_cached_result(question, answer_cache)
+    if cached is not None:
+        print(f"Cache hit for question {index}")
+        save_markdown_result(cached, output_base_path, index, result_writer)
+        if token_budget:
+            token_budget.settle(cached)
+        if batch_deadline:
+            batch_deadline.settle(cached)
+        return cached
+    
+    question_deadline = None
+    if batch_deadline:
+        question_deadline = start_under_deadline(index, batch_deadline)
+        if question_deadline is None:
+            skipped = build_skipped_result(question, DEADLINE_REACHED)
+            if token_budget:
+                token_budget.settle(skipped)
+            return skipped
+    
+    start_time = time.time()
+    phase_timer = PhaseTimer()
+    attempt, attempts = run_question(
+        question, index, agents_client, agent_id, poll_scheduler, retry_policy, stream, rate_limiter,
+        thread_provisioner, combined_create, phase_timer, token_budget, question_deadline
+    )
+    result = attempt_result(question, attempt)
+    result["metrics"]["total_time"] = time.time() - start_time
+    result["metrics"]["attempts"] = attempts
+    result["metrics"]["failure_class"] = attempt.failure
+    result["metrics"]["attempt_failures"] = attempt.failures
+    result["metrics"]["phases"] = phase_timer.durations
+    if answer_cache is not None and result["status"] == "completed":
+        answer_cache.put(question, result)
+    
+    # Save individual markdown file
+    if result["status"] != "error":
+        with phase_timer.phase("render"):
+            save_markdown_result(result, output_base_path, index, result_writer)
+    if token_budget:
+        token_budget.settle(result)
+    if batch_deadline:
+        batch_deadline.settle(result)
+    
+    return result
+
+def wait_for_budget(
+    token_budget: Optional[TokenBudget],
+    pending: Dict[concurrent.futures.Future, int],
+    spool: ResultSpool
+) -> bool:
+    """Block until token_budget admits another question, collecting finished questions meanwhile.
+    
+    Returns False once the budget is exhausted; always True without a budget.
+    """
+    if token_budget is None:
+        return True
+    while True:
+        decision = token_budget.admit()
+        if decision != WAIT:
+            return decision == ADMIT
+        done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+            spool.add(pending.pop(future), future.result())
+
+def shard_questions(questions: Iterable[str], shard: Optional[Shard]) -> Tuple[Iterable[str], List[int]]:
+    """Keep the questions in shard and return them with their 1-based positions in the full input.
+    
+    The positions list fills in as a streamed input is read; a list input
+    stays a list so its total is still known. Without a shard every question
+    is kept.
+    """
+    input_indices: List[int] = []
+    
+    def selected():
+        for input_index, question in select_shard(questions, shard):
+            input_indices.append(input_index)
+            yield question
+    
+    if isinstance(questions, list):
+        return list(selected()), input_indices
+    return selected(), input_indices
+
+def save_batch_results(output_base_path: str):
+    """Write batch_results.json and .md in input order by streaming back over the journal."""
+    compact_journal(output_base_path, ordered=True)
+    save_consolidated_markdown(read_journal_ordered(os.path.join(output_base_path, JOURNAL_FILENAME)), output_base_path)
+
+def report_incomplete(spool: ResultSpool, output_base_path: str):
+    """After a shutdown, list the questions left incomplete and save them as a question file to rerun."""
+    path = spool.write_incomplete(output_base_path)
+    print_incomplete(spool.incomplete, f"They are saved in {path}; rerun them with --file {path}")
+
+def select_representatives(
+    questions: Iterable[str],
+    output_base_path: str,
+    dedup_threshold: Optional[float]
+) -> Tuple[Iterable[str], Optional[List[str]], Optional[List[Dict]]]:
+    """Group near-duplicate questions and return the ones to run, all questions and the groups.
+    
+    Grouping needs every question up front, so a streamed input is read into a
+    list here. Without a threshold questions are passed through untouched and
+    the last two values are None.
+    """
+    if not dedup_threshold:
+        return questions, None, None
+    questions = list(questions)
+    groups = group_near_duplicates(questions, dedup_threshold)
+    save_dedup_report(groups, questions, output_base_path, dedup_threshold)
+    if len(groups) < len(questions):
+        print(f"Grouped {len(questions)} questions into {len(groups)} runs "
+              f"(similarity >= {dedup_threshold}); see dedup_groups.md")
+    return [questions[g["representative"]] for g in groups], questions, groups
 
 def process_batch_research(
-    questions: List[str],
+    questions: Iterable[str],
     agents_client: AgentsClient,
     agent_id: str,
-    output_base_path: str
+    output_base_path: str,
+    concurrency: int = 1,
+    poll_scheduler: Optional[PollScheduler] = None,
+    stream: bool = False,
+    answer_cache: Optional[AnswerCache] = None,
+    dedup_threshold: Optional[float] = None,
+    rate_limiter: Optional[RateLimiter] = None,
+    retry_policy: Optional[RetryPolicy] = None,
+    shard: Optional[Shard] = None,
+    thread_provisioner: Optional[ThreadProvisioner] = None,
+    create_mode: str = "separate",
+    order: str = "input",
+    cost_estimator: Optional[CostEstimator] = None,
+    token_budget: Optional[TokenBudget] = None,
+    shutdown: Optional[GracefulShutdown] = None,
+    batch_deadline: Optional[BatchDeadline] = None
 ) -> List[Dict]:
-    """Process a batch of research questions and track metrics."""
-    results = []
+    """Process a batch of research questions and track metrics.
+    
+    Returns result summaries in input order; the optional parameters are described in README.md.
+    """
+    questions, input_indices = shard_questions(questions, shard)
+    questions, all_questions, groups = select_representatives(questions, output_base_path, dedup_threshold)
+    if batch_deadline:
+        expected = poll_scheduler.expected_duration() if poll_scheduler else None
+        batch_deadline.plan(len(questions) if isinstance(questions, list) else None, expected)
+    dispatch, predictions = order_questions(questions, order, cost_estimator)
+    total = len(dispatch) if isinstance(dispatch, list) else None
+    retry_policy = retry_policy or create_retry_policy(total)
+    combined_create = CombinedCreate(create_mode)
+    if shutdown:
+        shutdown.on_request(retry_policy.stop)
+    
+    # Result files and journal entries are written on a background thread; leaving
+    # the block drains its queue before the journal is closed
+    with ResultJournal(output_base_path) as journal, ResultWriter() as result_writer:
+        spool = ResultSpool(journal, result_writer, input_indices, predictions, groups, all_questions, shutdown)
+        if concurrency <= 1:
+            for i, question in dispatch:
+                if shutdown and shutdown.requested.is_set():
+                    spool.mark_incomplete(i, question)
+                    continue
+                if not wait_for_budget(token_budget, {}, spool):
+                    spool.add(i, budget_skipped_result(question, batch_deadline))
+                    continue
+                spool.add(i, process_question(
+                    question, i, total, agents_client, agent_id, output_base_path,
+                    poll_scheduler, stream, answer_cache, rate_limiter, retry_policy,
+                    thread_provisioner, combined_create, token_budget, result_writer, batch_deadline
+                ))
+        else:
+            print(f"Running with up to {concurrency} questions in flight")
+            with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+                # Only a window of questions is submitted ahead of the workers, so a
+                # streamed input is never read much further than it is processed
+                pending: Dict[concurrent.futures.Future, int] = {}
+                for i, question in dispatch:
+                    if shutdown and shutdown.requested.is_set():
+                        spool.mark_incomplete(i, question)
+                        continue
+                    if not wait_for_budget(token_budget, pending, spool):
+                        spool.add(i, budget_skipped_result(question, batch_deadline))
+                        continue
+                    future = executor.submit(
+                        process_question,
+                        question,
+                        i,
+                        total,
+                        agents_client,
+                        agent_id,
+                        output_base_path,
+                        poll_scheduler,
+                        stream,
+                        answer_cache,
+                        rate_limiter,
+                        retry_policy,
+                        thread_provisioner,
+                        combined_create,
+                        token_budget,
+                        result_writer,
+                        batch_deadline,
+                    )
+                    pending[future] = i
+                    if len(pending) >= 2 * concurrency:
+                        done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                        for future in done:
+                            spool.add(pending.pop(future), future.result())
+                for future in concurrent.futures.as_completed(pending):
+                    spool.add(pending[future], future.result())
+    # Return summaries in input order so they match the input file
+    results = spool.summaries()
+    if shutdown and shutdown.requested.is_set():
+        report_incomplete(spool, output_base_path)
     
-    for i, question in enumerate(questions, 1):
-        print(f"\nProcessing question {i}/{len(questions)}:")
+    if retry_policy.retries_used:
+        print(f"Retried {retry_policy.retries_used} transient failures")
+    if token_budget:
+        print(token_budget.summary())
+    if batch_deadline:
+        print(batch_deadline.summary())
+    save_batch_results(output_base_path)
+    
+    return results
+
+async def process_question_async(
+    question: str,
+    index: int,
+    total: Optional[int],
+    agents_client: AsyncAgentsClient,
+    agent_id: str,
+    output_base_path: str,
+    semaphore: asyncio.Semaphore,
+    poll_scheduler: Optional[PollScheduler] = None,
+    answer_cache: Optional[AnswerCache] = None,
+    rate_limiter: Optional[RateLimiter] = None,
+    retry_policy: Optional[RetryPolicy] = None,
+    thread_provisioner: Optional[ThreadProvisioner] = None,
+    combined_create: Optional[CombinedCreate] = None,
+    token_budget: Optional[TokenBudget] = None,
+    result_writer: Optional[ResultWriter] = None,
+    batch_deadline: Optional[BatchDeadline] = None
+) -> Dict:
+    """Async counterpart of process_question; holds a semaphore slot while a run is in flight.
+    
+    The slot is released while waiting to retry, so backoff never idles capacity.
+    """
+    poll_scheduler = poll_scheduler or FixedPollScheduler()
+    retry_policy = retry_policy or RetryPolicy(max_attempts=1)
+    async with semaphore:
+        print(f"\nProcessing question {index}/{total or '?'}:")
         print(f"Question: {question}")
         
-        # Create a new thread for each question to avoid conflicts
-        thread = agents_client.threads.create()
-        thread_id = thread.id
-        print(f"Created new thread for question {i}, ID: {thread_id}")
+        cached = lookup_cached_result(question, answer_cache)
+        if cached is not None:
+            print(f"Cache hit for question {index}")
+            save_markdown_result(cached, output_base_path, index, result_writer)
+            if token_budget:
+                token_budget.settle(cached)
+            if batch_deadline:
+                batch_deadline.settle(cached)
+            return cached
         
-        # Initialize metrics
-        start_time = time.time()
-        time_to_first_token = None
-        response_text = ""
-        citations = []
-        
-        try:
-            # Create message
-            message = agents_client.messages.create(
-                thread_id=thread_id,
-                role="user",
-                content=question,
-            )
-            
-            # Create and monitor run
-            run = agents_client.runs.create(thread_id=thread_id, agent_id=agent_id)
-            run_id = run.id
-            # Add timeout and heartbeat settings for polling
-            timeout = int(os.getenv("BATCH_TIMEOUT_SECONDS", "300"))  # max seconds to wait per question
-            heartbeat_interval = 10  # seconds between progress logs
-            loop_seconds = 0
+        # The question's share of the batch deadline is taken once it holds a slot
+        question_deadline = None
+        if batch_deadline:
+            question_deadline = start_under_deadline(index, batch_deadline)
+            if question_deadline is None:
+                skipped = build_skipped_result(question, DEADLINE_REACHED)
+                if token_budget:
+                    token_budget.settle(skipped)
+                return skipped
     
-            # Poll for completion
-            while run.status in ("queued", "in_progress"):
-                time.sleep(1)
-                loop_seconds += 1
-                if loop_seconds % heartbeat_interval == 0:
-                    print(f"Still processing question {i}, elapsed {loop_seconds}s")
-                if loop_seconds >= timeout:
-                    print(f"Timeout after {timeout}s for question {i}, aborting run.")
-                    # Cancel the run that timed out
-                    try:
-                        agents_client.runs.cancel(thread_id=thread_id, run_id=run_id)
-                        print(f"Run {run_id} canceled")
-                    except Exception as cancel_error:
-                        print(f"Error canceling run: {str(cancel_error)}")
-                    break
-                # update run status
-                run = agents_client.runs.get(thread_id=thread_id, run_id=run_id)
-            
-            # Get response after completion
-            if run.status == "completed":
-                # Get latest response
-                response = agents_client.messages.get_last_message_by_role(
-                    thread_id=thread_id,
-                    role=MessageRole.AGENT,
-                )
-                
-                if response and response.text_messages:
-                    if time_to_first_token is None:
-                        time_to_first_token = time.time() - start_time
-                    response_text = "\n".join(t.text.value for t in response.text_messages)
-                    
-                    # Collect citations
-                    if response.url_citation_annotations:
-                        citations = [
-                            {"title": ann.url_citation.title, "url": ann.url_citation.url}
-                            for ann in response.url_citation_annotations
-                        ]
-            
-            # Calculate metrics
-            total_time = time.time() - start_time
-            
-            # Get token usage (if available from run)
-            tokens_in = getattr(run.usage, 'prompt_tokens', 0) if hasattr(run, 'usage') else 0
-            tokens_out = getattr(run.usage, 'completion_tokens', 0) if hasattr(run, 'usage') else 0
-            total_tokens = tokens_in + tokens_out
-            
-            # Save result with metrics
-            result = {
-                "question": question,
-                "status": run.status,
-                "error": str(run.last_error) if run.status == "failed" else None,
-                "metrics": {
-                    "time_to_first_token": time_to_first_token,
-                    "total_time": total_time,
-                    "tokens_in": tokens_in,
-                    "tokens_out": tokens_out,
-                    "total_tokens": total_tokens,
-                    "response_text": response_text,
-                    "citations": citations
-                }
-            }
-            results.append(result)
-            
-            # Save individual markdown file
-            save_markdown_result(result, output_base_path, i)
-            
-        except Exception as e:
-            print(f"Error processing question {i}: {str(e)}")
-            total_time = time.time() - start_time
-            results.append({
-                "question": question,
-                "status": "error",
-                "error": str(e),
-                "metrics": {
-                    "time_to_first_token": None,
-                    "total_time": total_time,
-                    "tokens_in": 0,
-                    "tokens_out": 0,
-                    "total_tokens": 0,
-                    "response_text": "",
-                    "citations": []
-                }
-            })
+    start_time = time.time()
+    phase_timer = PhaseTimer()
+    attempt, attempts = await run_question_async(
+        question, index, agents_client, agent_id, poll_scheduler, retry_policy, rate_limiter,
+        thread_provisioner, combined_create, phase_timer, token_budget, question_deadline, semaphore
+    )
+    result = attempt_result(question, attempt)
+    result["metrics"]["total_time"] = time.time() - start_time
+    result["metrics"]["attempts"] = attempts
+    result["metrics"]["failure_class"] = attempt.failure
+    result["metrics"]["attempt_failures"] = attempt.failures
+    result["metrics"]["phases"] = phase_timer.durations
+    if answer_cache is not None and result["status"] == "completed":
+        answer_cache.put(question, result)
+    if result["status"] != "error":
+        with phase_timer.phase("render"):
+            save_markdown_result(result, output_base_path, index, result_writer)
+    if token_budget:
+        token_budget.settle(result)
+    if batch_deadline:
+        batch_deadline.settle(result)
     
-    save_consolidated_markdown(results, output_base_path)
+    return result
+
+async def wait_for_budget_async(
+    token_budget: Optional[TokenBudget],
+    pending: Dict[asyncio.Task, int],
+    spool: ResultSpool
+) -> bool:
+    """Async counterpart of wait_for_budget."""
+    if token_budget is None:
+        return True
+    while True:
+        decision = token_budget.admit()
+        if decision != WAIT:
+            return decision == ADMIT
+        done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            spool.add(pending.pop(task), task.result())
+
+async def process_batch_research_async(
+    questions: Iterable[str],
+    agents_client: AsyncAgentsClient,
+    agent_id: str,
+    output_base_path: str,
+    concurrency: int = 100,
+    poll_scheduler: Optional[PollScheduler] = None,
+    answer_cache: Optional[AnswerCache] = None,
+    dedup_threshold: Optional[float] = None,
+    rate_limiter: Optional[RateLimiter] = None,
+    retry_policy: Optional[RetryPolicy] = None,
+    shard: Optional[Shard] = None,
+    thread_provisioner: Optional[ThreadProvisioner] = None,
+    create_mode: str = "separate",
+    order: str = "input",
+    cost_estimator: Optional[CostEstimator] = None,
+    token_budget: Optional[TokenBudget] = None,
+    shutdown: Optional[GracefulShutdown] = None,
+    batch_deadline: Optional[BatchDeadline] = None
+) -> List[Dict]:
+    """Async counterpart of process_batch_research for an azure.ai.agents.aio client; runs are polled."""
+    questions, input_indices = shard_questions(questions, shard)
+    questions, all_questions, groups = select_representatives(questions, output_base_path, dedup_threshold)
+    if batch_deadline:
+        expected = poll_scheduler.expected_duration() if poll_scheduler else None
+        batch_deadline.plan(len(questions) if isinstance(questions, list) else None, expected)
+    dispatch, predictions = order_questions(questions, order, cost_estimator)
+    total = len(dispatch) if isinstance(dispatch, list) else None
+    retry_policy = retry_policy or create_retry_policy(total)
+    combined_create = CombinedCreate(create_mode)
+    if shutdown:
+        shutdown.on_request(retry_policy.stop)
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    print(f"Running async engine with up to {concurrency} questions in flight")
+    
+    with ResultJournal(output_base_path) as journal, ResultWriter() as result_writer:
+        spool = ResultSpool(journal, result_writer, input_indices, predictions, groups, all_questions, shutdown)
+        pending: Dict[asyncio.Task, int] = {}
+        for i, question in dispatch:
+            if shutdown and shutdown.requested.is_set():
+                spool.mark_incomplete(i, question)
+                continue
+            if not await wait_for_budget_async(token_budget, pending, spool):
+                spool.add(i, budget_skipped_result(question, batch_deadline))
+                continue
+            task = asyncio.create_task(process_question_async(
+                question, i, total, agents_client, agent_id, output_base_path, semaphore,
+                poll_scheduler, answer_cache, rate_limiter, retry_policy, thread_provisioner,
+                combined_create, token_budget, result_writer, batch_deadline
+            ))
+            pending[task] = i
+            if len(pending) >= 2 * max(1, concurrency):
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    spool.add(pending.pop(task), task.result())
+        if pending:
+            await asyncio.wait(pending)
+            for task, i in pending.items():
+                spool.add(i, task.result())
+    results = spool.summaries()
+    if shutdown and shutdown.requested.is_set():
+        report_incomplete(spool, output_base_path)
+    
+    if retry_policy.retries_used:
+        print(f"Retried {retry_policy.retries_used} transient failures")
+    if token_budget:
+        print(token_budget.summary())
+    if batch_deadline:
+        print(batch_deadline.summary())
+    save_batch_results(output_base_path)
     
     return results
 
-def save_markdown_result(result: Dict, base_path: str, index: int):
-    """Save individual research result as markdown."""
+async def run_batch_research_async(
+    questions: Iterable[str],
+    agent_id: str,
+    output_base_path: str,
+    concurrency: int,
+    poll_scheduler: Optional[PollScheduler] = None,
+    answer_cache: Optional[AnswerCache] = None,
+    dedup_threshold: Optional[float] = None,
+    rate_limiter: Optional[RateLimiter] = None,
+    retry_policy: Optional[RetryPolicy] = None,
+    shard: Optional[Shard] = None,
+    thread_provisioner: Optional[ThreadProvisioner] = None,
+    create_mode: str = "separate",
+    order: str = "input",
+    cost_estimator: Optional[CostEstimator] = None,
+    token_budget: Optional[TokenBudget] = None,
+    shutdown: Optional[GracefulShutdown] = None,
+    batch_deadline: Optional[BatchDeadline] = None,
+    credential: Optional[SharedTokenCredential] = None
+) -> List[Dict]:
+    """Open an async Agents client for the project and run the async batch engine.
+    
+    The client shares credential's tokens when given, and is wrapped with rate_limiter and then shutdown.
+    """
+    async_credential = AsyncSharedTokenCredential(credential) if credential else AsyncDefaultAzureCredential()
+    async with async_credential:
+        async with AsyncAgentsClient(
+            endpoint=os.environ["PROJECT_ENDPOINT_RELX_LEGAL"],
+            credential=async_credential,
+        ) as agents_client:
+            if rate_limiter is not None:
+                agents_client = rate_limiter.wrap_async(agents_client)
+            if shutdown is not None:
+                agents_client = shutdown.wrap_async(agents_client)
+            return await process_batch_research_async(
+                questions=questions,
+                agents_client=agents_client,
+                agent_id=agent_id,
+                output_base_path=output_base_path,
+                concurrency=concurrency,
+                poll_scheduler=poll_scheduler,
+                answer_cache=answer_cache,
+                dedup_threshold=dedup_threshold,
+                rate_limiter=rate_limiter,
+                retry_policy=retry_policy,
+                shard=shard,
+                thread_provisioner=thread_provisioner,
+                create_mode=create_mode,
+                order=order,
+                cost_estimator=cost_estimator,
+                token_budget=token_budget,
+                shutdown=shutdown,
+                batch_deadline=batch_deadline
+            )
+
+def save_markdown_result(result: Dict, base_path: str, index: int, result_writer: Optional[ResultWriter] = None):
+    """Save individual research result as markdown, written by result_writer's thread when given."""
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     filename = f"{base_path}/research_{index:03d}_{timestamp}.md"
     
-    with open(filename, "w", encoding="utf-8") as f:
+    with io.StringIO() as f:
         f.write("# Research Result\n\n")
         f.write(f"**Generated on:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
         f.write(f"**Question:** {result['question']}\n")
@@ -175,10 +637,23 @@ def save_markdown_result(result: Dict, base_path: str, index: int):
         f.write("## Metrics\n")
         metrics = result['metrics']
         f.write(f"- Time to First Token: {metrics['time_to_first_token']} seconds\n")
+        if metrics.get('inter_token_latency') is not None:
+            f.write(f"- Inter-token Latency: {metrics['inter_token_latency']:.3f} seconds\n")
         f.write(f"- Total Time: {metrics['total_time']:.2f} seconds\n")
         f.write(f"- Tokens In: {metrics['tokens_in']}\n")
         f.write(f"- Tokens Out: {metrics['tokens_out']}\n")
-        f.write(f"- Total Tokens: {metrics['total_tokens']}\n\n")
+        f.write(f"- Total Tokens: {metrics['total_tokens']}\n")
+        if metrics.get('cache_hit'):
+            f.write(f"- Cache Hit: saved {metrics['saved_time']:.2f} seconds and {metrics['saved_tokens']} tokens\n")
+        if metrics.get('requeues'):
+            f.write(f"- Requeued After Rate Limit: {metrics['requeues']} times\n")
+        if metrics.get('attempts', 1) > 1:
+            f.write(f"- Attempts: {metrics['attempts']}\n")
+        if metrics.get('attempt_failures'):
+            f.write(f"- Attempt Failures: {'; '.join(metrics['attempt_failures'])}\n")
+        if metrics.get('phases'):
+            f.write("- Phases: " + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in metrics['phases'].items()) + "\n")
+        f.write("\n")
         
         if metrics['response_text']:
             f.write("## Response\n")
@@ -188,10 +663,20 @@ def save_markdown_result(result: Dict, base_path: str, index: int):
             f.write("\n\n## References\n")
             for i, citation in enumerate(metrics['citations'], 1):
                 f.write(f"{i}. [{citation['title']}]({citation['url']})\n")
+        text = f.getvalue()
+    
+    if result_writer is not None:
+        result_writer.write_text(filename, text)
+    else:
+        write_text(filename, text)
 
-def save_consolidated_markdown(results: List[Dict], base_path: str):
-    """Save consolidated results as markdown."""
+def save_consolidated_markdown(results: Iterable[Dict], base_path: str):
+    """Save consolidated results as markdown.
+    
+    results may be a stream (such as read_journal_ordered); only their summaries are kept while writing.
+    """
     filename = f"{base_path}/batch_results.md"
+    results = [summarize_result(r) for r in results]
     
     with open(filename, "w", encoding="utf-8") as f:
         f.write("# Batch Research Results\n\n")
@@ -202,15 +687,39 @@ def save_consolidated_markdown(results: List[Dict], base_path: str):
         total_time = sum(r['metrics']['total_time'] for r in results if r['metrics']['total_time'] is not None)
         total_tokens = sum(r['metrics']['total_tokens'] for r in results if r['metrics']['total_tokens'] is not None)
         success_count = sum(1 for r in results if r['status'] == 'completed')
+        cache_hits = [r for r in results if r['metrics'].get('cache_hit')]
         
         f.write("## Summary Statistics\n")
         f.write(f"- Total Processing Time: {total_time:.2f} seconds\n")
         f.write(f"- Total Tokens Used: {total_tokens}\n")
-        f.write(f"- Success Rate: {success_count}/{len(results)} ({success_count/len(results)*100:.1f}%)\n\n")
+        f.write(f"- Success Rate: {success_count}/{len(results)} ({success_count/max(len(results), 1)*100:.1f}%)\n")
+        retry_count = sum(r['metrics'].get('attempts', 1) - 1 for r in results if not r['metrics'].get('duplicate_of'))
+        if retry_count:
+            f.write(f"- Retries of Transient Failures: {retry_count}\n")
+        requeue_count = sum(r['metrics'].get('requeues') or 0 for r in results)
+        if requeue_count:
+            f.write(f"- Runs Requeued After Rate Limits: {requeue_count}\n")
+        budget_skips = sum(1 for r in results if r['metrics'].get('skip_reason') == BUDGET_EXHAUSTED)
+        if budget_skips:
+            f.write(f"- Skipped After the Token Budget Ran Out: {budget_skips}\n")
+        deadline_skips = sum(1 for r in results if r['metrics'].get('skip_reason') == DEADLINE_REACHED)
+        if deadline_skips:
+            f.write(f"- Skipped Near the Batch Deadline: {deadline_skips}\n")
+        duplicate_count = sum(1 for r in results if r['metrics'].get('duplicate_of'))
+        if duplicate_count:
+            f.write(f"- Near-duplicates Answered Without a Run: {duplicate_count}\n")
+        if cache_hits:
+            saved_time = sum(r['metrics']['saved_time'] or 0 for r in cache_hits)
+            saved_tokens = sum(r['metrics']['saved_tokens'] or 0 for r in cache_hits)
+            f.write(f"- Cache Hits: {len(cache_hits)}/{len(results)} "
+                    f"(saved {saved_time:.2f} seconds and {saved_tokens} tokens)\n")
+        f.write("\n")
+        write_phase_table(f, results)
+        write_estimate_summary(f, results)
         
         f.write("## Individual Results\n\n")
         for i, result in enumerate(results, 1):
-            f.write(f"### {i}. {result['question'][:100]}...\n")
+            f.write(f"### {result.get('input_index', i)}. {result['question'][:100]}...\n")
             f.write(f"**Status:** {result['status']}\n")
             if result['error']:
                 f.write(f"**Error:** {result['error']}\n")
@@ -219,62 +728,243 @@ def save_consolidated_markdown(results: List[Dict], base_path: str):
             f.write("**Metrics:**\n")
             f.write(f"- Time to First Token: {metrics['time_to_first_token']} seconds\n")
             f.write(f"- Total Time: {metrics['total_time']:.2f} seconds\n")
+            if metrics.get('predicted_time') is not None:
+                f.write(f"- Predicted Time: {metrics['predicted_time']:.2f} seconds\n")
             f.write(f"- Tokens: {metrics['tokens_in']} in, {metrics['tokens_out']} out, {metrics['total_tokens']} total\n")
+            if metrics.get('attempts', 1) > 1:
+                f.write(f"- Attempts: {metrics['attempts']}\n")
+            if metrics.get('attempt_failures'):
+                f.write(f"- Attempt Failures: {'; '.join(metrics['attempt_failures'])}\n")
+            if metrics.get('cache_hit'):
+                f.write("- Served from answer cache\n")
+            if metrics.get('duplicate_of'):
+                f.write(f"- Answer shared with near-duplicate (similarity {metrics['similarity']:.2f}): {metrics['duplicate_of'][:100]}\n")
             f.write("\n---\n\n")
 
-def main():
-    """Main function to process batch research questions."""
+def create_answer_cache(mode: str) -> AnswerCache:
+    """Open the answer cache for this agent configuration.
+    
+    Answers are only reused for the same model deployment, deep research model
+    and agent instructions. Location, TTL and size cap come from ANSWER_CACHE_*
+    environment variables.
+    """
+    context = {
+        "model": os.environ["MODEL_DEPLOYMENT_NAME"],
+        "deep_research_model": os.environ["DEEP_RESEARCH_MODEL_DEPLOYMENT_NAME"],
+        "instructions": AGENT_INSTRUCTIONS,
+    }
+    return AnswerCache(
+        path=os.getenv("ANSWER_CACHE_FILE", "answer_cache.sqlite"),
+        context=context,
+        mode=mode,
+        ttl_seconds=float(os.getenv("ANSWER_CACHE_TTL_HOURS", "168")) * 3600,
+        max_bytes=int(float(os.getenv("ANSWER_CACHE_MAX_MB", "512")) * 1024 * 1024),
+    )
+
+def merge_main(argv: List[str]):
+    """Merge the output directories of a sharded batch into one set of results."""
+    parser = argparse.ArgumentParser(prog="batch_research.py merge",
+                                     description="Merge the results of shards run with --shard")
+    parser.add_argument("shard_dirs", nargs="+", help="Output directory of each shard")
+    parser.add_argument("--output", type=str, help="Directory for the merged results (default: merged_results_<timestamp>)")
+    args = parser.parse_args(argv)
+    
+    output_dir = args.output or f"merged_results_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    os.makedirs(output_dir, exist_ok=True)
+    merge_shard_results(args.shard_dirs, output_dir)
+    compact_journal(output_dir)
+    save_consolidated_markdown(read_journal_ordered(os.path.join(output_dir, JOURNAL_FILENAME)), output_dir)
+    print(f"Merged results saved in {output_dir}/")
+
+def main(argv: Optional[List[str]] = None):
+    """Main function to process batch research questions, or merge shards with `merge`."""
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["merge"]:
+        merge_main(argv[1:])
+        return
     try:
-        # Initialize Azure clients
-        project_client = AIProjectClient(
-            endpoint=os.environ["PROJECT_ENDPOINT_RELX_LEGAL"],
-            credential=DefaultAzureCredential(),
-        )
+        parser = argparse.ArgumentParser(description="Batch Research - process a file of research questions")
+        parser.add_argument("--file", type=str, default="data/SampleQuestionsDeepResearch_2.json",
+                            help="Input file of questions (JSONL, JSON or CSV)")
+        parser.add_argument("--concurrency", type=int, default=int(os.getenv("BATCH_CONCURRENCY", "1")),
+                            help="Number of questions to keep in flight at once (default: 1)")
+        parser.add_argument("--engine", choices=["threads", "async"], default="threads",
+                            help="Dispatch with a thread pool (default) or the asyncio engine")
+        parser.add_argument("--poll-mode", choices=["adaptive", "fixed"], default=os.getenv("POLL_MODE", "adaptive"),
+                            help="Poll run status adaptively from past run durations (default) or at a fixed interval")
+        parser.add_argument("--stream", action="store_true",
+                            help="Stream run events instead of polling (reports real time to first token); "
+                                 "only with --engine threads, as the async engine always polls")
+        parser.add_argument("--cache-mode", choices=[*CACHE_MODES, *CACHE_MODE_ALIASES],
+                            default=os.getenv("ANSWER_CACHE_MODE", "off"),
+                            help="Answer cache: serve hits and store misses (read), store answers without serving "
+                                 "them (write, alias refresh) or disable it (off, the default)")
+        parser.add_argument("--dedup", action="store_true",
+                            help="Run one question per group of near-duplicates and copy its answer to the others "
+                                 "(reads the whole input before the first run)")
+        parser.add_argument("--dedup-threshold", type=float,
+                            default=float(os.environ["DEDUP_THRESHOLD"]) if os.getenv("DEDUP_THRESHOLD") else None,
+                            help=f"Similarity (0-1) at which --dedup treats questions as near-duplicates "
+                                 f"(default: {DEFAULT_THRESHOLD})")
+        parser.add_argument("--shard", type=parse_shard,
+                            help="Run only shard i of N (e.g. 2/4), a stable hash partition of the questions")
+        parser.add_argument("--create-mode", choices=CREATE_MODES, default=os.getenv("RUN_CREATE_MODE", "separate"),
+                            help="Start each question with separate thread, message and run calls (separate, default) "
+                                 "or with one create_thread_and_run call (combined)")
+        parser.add_argument("--prewarm-threads", type=int, default=None,
+                            help="Empty threads to keep created ahead of time, 0 to disable "
+                                 "(default: PREWARM_THREADS, or the concurrency with --create-mode separate)")
+        parser.add_argument("--order", choices=ORDER_MODES, default=os.getenv("QUESTION_ORDER", "input"),
+                            help="Dispatch questions in input order (default), longest-first to shorten the batch "
+                                 "or shortest-first for early results, by cost predicted from past journals")
         
-        # Get Bing connection
-        conn_id = project_client.connections.get(name=os.environ["BING_CONNECTED_RESOURCE_NAME"]).id
+        parser.add_argument("--max-total-tokens", type=int,
+                            default=int(os.environ["MAX_TOTAL_TOKENS"]) if os.getenv("MAX_TOTAL_TOKENS") else None,
+                            help="Stop starting questions before the batch's projected spend exceeds this many tokens")
+        parser.add_argument("--max-tokens-per-question", type=int,
+                            default=int(os.environ["MAX_TOKENS_PER_QUESTION"]) if os.getenv("MAX_TOKENS_PER_QUESTION") else None,
+                            help="Cancel a run once it reports more than this many tokens")
+        parser.add_argument("--deadline", default=os.getenv("BATCH_DEADLINE"),
+                            help="Finish the whole batch by this time: seconds, a duration like 1h30m, HH:MM "
+                                 "or an ISO time. Each question gets a share of the time left as its timeout")
         
-        # Initialize Deep Research tool
-        deep_research_tool = DeepResearchTool(
-            bing_grounding_connection_id=conn_id,
-            deep_research_model=os.environ["DEEP_RESEARCH_MODEL_DEPLOYMENT_NAME"],
+        args = parser.parse_args(argv)
+        dedup_threshold = (args.dedup_threshold or DEFAULT_THRESHOLD) if args.dedup else None
+        if args.stream and args.engine == "async":
+            parser.error("--stream is only supported with --engine threads")
+        # The deadline is counted from now, so agent setup comes out of the batch's time
+        batch_deadline = create_batch_deadline(args.deadline, args.concurrency)
+        
+        # Initialize Azure clients; both share one token per scope
+        endpoint = os.environ["PROJECT_ENDPOINT_RELX_LEGAL"]
+        credential = SharedTokenCredential(DefaultAzureCredential())
+        project_client = AIProjectClient(
+            endpoint=endpoint,
+            credential=credential,
         )
+        # Bing connection ids are cached on disk (CONNECTION_CACHE_FILE / CONNECTION_CACHE_TTL_SECONDS)
+        connection_cache = create_connection_cache(endpoint)
         
         # Create output directory
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         output_dir = f"research_results_{timestamp}"
         os.makedirs(output_dir, exist_ok=True)
         
-        # Read questions from JSON file
-        questions = read_questions("data/SampleQuestionsDeepResearch_2.json")
-        print(f"Loaded {len(questions)} questions from JSON")
+        # Questions are streamed from the input file as they are dispatched
+        questions = iter_questions(args.file)
+        print(f"Reading questions from {args.file}")
+        if batch_deadline:
+            # Sharing the time left needs the number of questions, so the input is read up front
+            questions = list(questions)
+        if args.shard:
+            write_shard_manifest(output_dir, args.shard, args.file)
+            print(f"Running shard {args.shard}")
         
         with project_client:
             with project_client.agents as agents_client:
-                # Create agent
-                agent = agents_client.create_agent(
-                    model=os.environ["MODEL_DEPLOYMENT_NAME"],
-                    name="batch-research-agent",
-                    instructions="You are a helpful Agent that assists in researching topics.  You will be provided a question to answer that you must do your best to answer without asking for clarity.  Just answer it.",
-                    tools=deep_research_tool.definitions,
-                )
-                print(f"Created agent, ID: {agent.id}")
+                # Every Agents call made by this batch is paced by one shared dispatcher
+                rate_limiter = create_rate_limiter()
+                agents_client = rate_limiter.wrap(agents_client)
+                
+                agent_registry = create_agent_registry()
+                
+                def setup_agent(conn_id: str):
+                    # Reuse the registered agent for this model, instructions and tools
+                    # (AGENT_REGISTRY_FILE); a new one is only created when they change
+                    deep_research_tool = DeepResearchTool(
+                        bing_grounding_connection_id=conn_id,
+                        deep_research_model=os.environ["DEEP_RESEARCH_MODEL_DEPLOYMENT_NAME"],
+                    )
+                    return get_or_create_agent(
+                        agents_client,
+                        agent_registry,
+                        model=os.environ["MODEL_DEPLOYMENT_NAME"],
+                        name="batch-research-agent",
+                        instructions=AGENT_INSTRUCTIONS,
+                        tools=deep_research_tool.definitions,
+                    )
                 
+                # The token is fetched while the connection is resolved and the agent looked up
+                preflight = run_preflight({
+                    "credential": lambda: credential.get_token(PROJECT_SCOPE),
+                    "agent": lambda: with_connection(
+                        connection_cache, project_client, os.environ["BING_CONNECTED_RESOURCE_NAME"], setup_agent
+                    ),
+                })
+                agent, owns_agent = preflight["agent"]
+                
+                answer_cache = create_answer_cache(args.cache_mode)
+                # Threads are pre-created in the background so no question waits on threads.create
+                # (only the separate create mode and --stream need them by default)
+                thread_provisioner = create_thread_provisioner(
+                    agents_client, args.prewarm_threads,
+                    default_size=args.concurrency if args.create_mode == "separate" or args.stream else 0
+                )
                 try:
+                    poll_scheduler = create_poll_scheduler(args.poll_mode, key="batch_research")
+                    cost_estimator = CostEstimator.from_journals() if args.order != "input" else None
+                    token_budget = create_token_budget(args.max_total_tokens, args.max_tokens_per_question)
+                    # SIGINT/SIGTERM stop dispatch and cancel the runs in flight instead of killing the batch
+                    shutdown = create_graceful_shutdown()
+                    
                     # Process questions
-                    results = process_batch_research(
-                        questions=questions,
-                        agents_client=agents_client,
-                        agent_id=agent.id,
-                        output_base_path=output_dir
-                    )
+                    with shutdown:
+                        if args.engine == "async":
+                            results = asyncio.run(run_batch_research_async(
+                                questions=questions,
+                                agent_id=agent.id,
+                                output_base_path=output_dir,
+                                concurrency=args.concurrency,
+                                poll_scheduler=poll_scheduler,
+                                answer_cache=answer_cache,
+                                dedup_threshold=dedup_threshold,
+                                rate_limiter=rate_limiter,
+                                shard=args.shard,
+                                thread_provisioner=thread_provisioner,
+                                create_mode=args.create_mode,
+                                order=args.order,
+                                cost_estimator=cost_estimator,
+                                token_budget=token_budget,
+                                shutdown=shutdown,
+                                batch_deadline=batch_deadline,
+                                credential=credential
+                            ))
+                        else:
+                            results = process_batch_research(
+                                questions=questions,
+                                agents_client=shutdown.wrap(agents_client),
+                                agent_id=agent.id,
+                                output_base_path=output_dir,
+                                concurrency=args.concurrency,
+                                poll_scheduler=poll_scheduler,
+                                stream=args.stream,
+                                answer_cache=answer_cache,
+                                dedup_threshold=dedup_threshold,
+                                rate_limiter=rate_limiter,
+                                shard=args.shard,
+                                thread_provisioner=thread_provisioner,
+                                create_mode=args.create_mode,
+                                order=args.order,
+                                cost_estimator=cost_estimator,
+                                token_budget=token_budget,
+                                shutdown=shutdown,
+                                batch_deadline=batch_deadline
+                            )
                     
-                    print(f"\nProcessing complete. Results saved in {output_dir}/")
+                    status = "stopped" if shutdown.requested.is_set() else "complete"
+                    print(f"\nProcessing {status}. Results saved in {output_dir}/")
                     
                 finally:
                     # Cleanup
-                    agents_client.delete_agent(agent.id)
-                    print("Agent cleaned up")
+                    if thread_provisioner:
+                        thread_provisioner.close()
+                    answer_cache.close()
+                    if owns_agent:
+                        agents_client.delete_agent(agent.id)
+                        print("Agent cleaned up")
+        
+        if shutdown.requested.is_set():
+            sys.exit(shutdown.exit_code)
         
     except Exception as e:
         print(f"Error in main: {str(e)}")
@@ -0,0 +1,120 @@
+import os
+import glob
+from typing import IO, Dict, Iterable, List, Optional, Tuple
+
+from result_journal import question_key, read_journal
+
+ORDER_MODES = ("input", "longest-first", "shortest-first")
+DEFAULT_HISTORY_GLOB = "research_results_*/batch_results.jsonl"
+
+
+class CostEstimator:
+    """Predicts how many seconds a question will take from past results.
+
+    A question that was run before is predicted at the mean of its past
+    durations. Any other question is predicted by a least-squares line of
+    duration against question length, fitted on all past results. With no
+    history there is nothing to fit: estimate() falls back to the question
+    length as a relative cost, and predict() returns None.
+    """
+
+    def __init__(self, history: Iterable[Tuple[str, float]] = ()):
+        durations: Dict[str, List[float]] = {}
+        lengths: List[float] = []
+        seconds: List[float] = []
+        for question, duration in history:
+            durations.setdefault(question_key(question), []).append(duration)
+            lengths.append(len(question))
+            seconds.append(duration)
+        self.samples = len(seconds)
+        self._by_key = {key: sum(values) / len(values) for key, values in durations.items()}
+        self._intercept = sum(seconds) / len(seconds) if seconds else 0.0
+        self._slope = 0.0
+        if len(set(lengths)) > 1:
+            mean_length = sum(lengths) / len(lengths)
+            covariance = sum((x - mean_length) * (y - self._intercept) for x, y in zip(lengths, seconds))
+            variance = sum((x - mean_length) ** 2 for x in lengths)
+            # A negative fit is noise for this workload; fall back to the mean duration
+            self._slope = max(0.0, covariance / variance)
+            self._intercept -= self._slope * mean_length
+
+    @property
+    def fitted(self) -> bool:
+        return self.samples > 0
+
+    def predict(self, question: str) -> Optional[float]:
+        """Predicted seconds for question, or None without history."""
+        if not self.fitted:
+            return None
+        known = self._by_key.get(question_key(question))
+        if known is not None:
+            return known
+        return max(0.0, self._intercept + self._slope * len(question))
+
+    def estimate(self, question: str) -> float:
+        """Relative cost used for ordering: the prediction, or the question length without history."""
+        predicted = self.predict(question)
+        return float(len(question)) if predicted is None else predicted
+
+    @classmethod
+    def from_journals(cls, pattern: Optional[str] = None) -> "CostEstimator":
+        """Fit on the completed runs in every journal matching pattern (default: COST_HISTORY_GLOB).
+
+        Cache hits and near-duplicates are skipped, since no run was timed for them.
+        """
+        pattern = pattern or os.getenv("COST_HISTORY_GLOB", DEFAULT_HISTORY_GLOB)
+
+        def history():
+            for path in sorted(glob.glob(pattern)):
+                for result in read_journal(path):
+                    metrics = result.get("metrics") or {}
+                    if (result.get("status") == "completed" and metrics.get("total_time")
+                            and not metrics.get("cache_hit") and not metrics.get("duplicate_of")):
+                        yield result["question"], metrics["total_time"]
+
+        estimator = cls(history())
+        print(f"Cost estimator fitted on {estimator.samples} past results from {pattern}")
+        return estimator
+
+
+def order_questions(
+    questions: Iterable[str],
+    mode: str = "input",
+    estimator: Optional[CostEstimator] = None
+) -> Tuple[Iterable[Tuple[int, str]], Dict[int, float]]:
+    """Return (index, question) pairs in dispatch order and the predicted seconds per index.
+
+    index is the question's 1-based position in questions, so results can be
+    put back in input order. "input" keeps questions lazy and predicts
+    nothing. The other modes read every question and sort by estimated cost,
+    most expensive first (shortest makespan under concurrency) or cheapest
+    first (results arrive sooner); ties keep input order.
+    """
+    if mode == "input":
+        return enumerate(questions, 1), {}
+    if mode not in ORDER_MODES:
+        raise ValueError(f"Unknown question order: {mode}")
+    questions = list(questions)
+    estimator = estimator or CostEstimator()
+    costs = {i: estimator.estimate(q) for i, q in enumerate(questions, 1)}
+    order = sorted(costs, key=costs.get, reverse=(mode == "longest-first"))
+    predictions = {i: estimator.predict(questions[i - 1]) for i in order} if estimator.fitted else {}
+    print(f"Dispatching {len(questions)} questions {mode}")
+    return [(i, questions[i - 1]) for i in order], predictions
+
+
+def write_estimate_summary(f: IO[str], results: List[Dict]):
+    """Write how predicted durations compared with actual ones (nothing when no predictions were made)."""
+    pairs = [
+        (r["metrics"]["predicted_time"], r["metrics"]["total_time"]) for r in results
+        if r["metrics"].get("predicted_time") is not None and r["status"] == "completed"
+        and not r["metrics"].get("cache_hit") and not r["metrics"].get("duplicate_of")
+    ]
+    if not pairs:
+        return
+    errors = [actual - predicted for predicted, actual in pairs]
+    f.write("## Cost Estimates\n")
+    f.write(f"- Questions with a prediction: {len(pairs)}\n")
+    f.write(f"- Mean absolute error: {sum(abs(e) for e in errors) / len(errors):.2f} seconds\n")
+    f.write(f"- Mean error (actual - predicted): {sum(errors) / len(errors):.2f} seconds\n")
+    f.write("\n")
@@ -0,0 +1,202 @@
+import re
+import math
+import json
+import random
+import hashlib
+from datetime import datetime
+from typing import Dict, List, Set, Tuple
+
+from result_journal import normalize_question
+
+# Default similarity at or above which two questions share one run
+DEFAULT_THRESHOLD = 0.9
+
+
+def normalized_text(question: str) -> str:
+    """Question with case, punctuation and extra whitespace removed."""
+    text = re.sub(r"[^\w\s]", "", normalize_question(question))
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def shingles(question: str, size: int = 4) -> Set[str]:
+    """Character shingles of a question with case, punctuation and extra whitespace removed."""
+    text = normalized_text(question)
+    if len(text) <= size:
+        return {text}
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+def key_terms(question: str) -> Set[str]:
+    """Numbers and capitalized words inside a sentence: the names, places, dates and amounts a question is about.
+
+    Two questions that differ in any of these ("New York" and "New Jersey",
+    2023 and 2024) ask different things however similar the rest of the
+    text is. The first word of a sentence is skipped since it is capitalized
+    anyway, and so is "I".
+    """
+    terms = set()
+    sentence_start = True
+    for token in question.split():
+        word = re.sub(r"[\W_]+", "", re.sub(r"['’]s$", "", token.rstrip(".,;:!?)\"'”")))
+        if word and (any(c.isdigit() for c in word) or (word[0].isupper() and not sentence_start and word != "I")):
+            terms.add(word.lower())
+        sentence_start = token.endswith((".", "?", "!", ":"))
+    return terms
+
+
+def jaccard(a: Set[str], b: Set[str]) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class MinHasher:
+    """MinHash signatures with banded locality-sensitive hashing.
+
+    Questions whose signatures collide in at least one band become candidate
+    pairs; candidates are then confirmed with the exact Jaccard similarity of
+    their shingle sets, so the bands only have to be loose enough not to miss
+    pairs above the threshold.
+    """
+
+    def __init__(self, bands: int = 16, rows: int = 4, seed: int = 1):
+        self.bands = bands
+        self.rows = rows
+        self.num_perm = bands * rows
+        rng = random.Random(seed)
+        # Each permutation is simulated by XOR-ing the shingle hash with a random 64-bit mask
+        self._masks = [rng.getrandbits(64) for _ in range(self.num_perm)]
+
+    def signature(self, shingle_set: Set[str]) -> List[int]:
+        hashes = [
+            int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big")
+            for s in shingle_set
+        ]
+        return [min(map(mask.__xor__, hashes)) for mask in self._masks]
+
+    @classmethod
+    def for_threshold(cls, threshold: float, bands: int = 10) -> "MinHasher":
+        """Pick rows per band so pairs a little below threshold still usually collide.
+
+        With b bands of r rows the collision probability rises steeply around
+        (1/b) ** (1/r); that point is placed at 85% of the threshold.
+        """
+        target = min(max(threshold * 0.85, 0.05), 0.95)
+        rows = max(1, round(math.log(1 / bands) / math.log(target)))
+        return cls(bands=bands, rows=rows)
+
+    def band_keys(self, signature: List[int]) -> List[tuple]:
+        return [
+            (band, tuple(signature[band * self.rows:(band + 1) * self.rows]))
+            for band in range(self.bands)
+        ]
+
+
+def group_near_duplicates(questions: List[str], threshold: float = DEFAULT_THRESHOLD) -> List[Dict]:
+    """Group each question with the earlier question it nearly duplicates, if any.
+
+    Returns one group per distinct question, in input order:
+    {"representative": index, "members": [indices], "similarities": [scores]}.
+    """
+    hasher = MinHasher.for_threshold(threshold)
+    shingle_sets = [shingles(q) for q in questions]
+    word_sets = [set(normalized_text(q).split()) for q in questions]
+    term_sets = [key_terms(q) for q in questions]
+
+    def similarity(i: int, j: int) -> float:
+        if term_sets[i] != term_sets[j]:
+            return 0.0
+        return min(jaccard(shingle_sets[i], shingle_sets[j]), jaccard(word_sets[i], word_sets[j]))
+
+    # Band key -> representatives whose signatures share that band
+    buckets: Dict[tuple, List[int]] = {}
+    groups: List[Dict] = []
+    group_of: Dict[int, Dict] = {}
+    for i, shingle_set in enumerate(shingle_sets):
+        band_keys = hasher.band_keys(hasher.signature(shingle_set))
+        candidates = sorted({r for band_key in band_keys for r in buckets.get(band_key, [])})
+        best, best_score = None, 0.0
+        for representative in candidates:
+            score = similarity(i, representative)
+            if score >= threshold and score > best_score:
+                best, best_score = representative, score
+        if best is not None:
+            group_of[best]["members"].append(i)
+            group_of[best]["similarities"].append(round(best_score, 3))
+            continue
+        group = {"representative": i, "members": [i], "similarities": [1.0]}
+        groups.append(group)
+        group_of[i] = group
+        for band_key in band_keys:
+            buckets.setdefault(band_key, []).append(i)
+    return groups
+
+
+def fan_out_result(group: Dict, questions: List[str], result: Dict) -> List[Tuple[int, Dict]]:
+    """Expand the result for a group's representative to (position, result) for every member.
+
+    Other members get a copy of it under their own question, marked with
+    duplicate_of and zero tokens (and no phase timings) so totals are not
+    double counted.
+    """
+    representative = group["representative"]
+    expanded = []
+    for member, similarity in zip(group["members"], group["similarities"]):
+        if member == representative:
+            expanded.append((member, result))
+            continue
+        metrics = dict(result["metrics"])
+        metrics.pop("phases", None)
+        metrics.update({
+            "tokens_in": 0,
+            "tokens_out": 0,
+            "total_tokens": 0,
+            "duplicate_of": questions[representative],
+            "similarity": similarity,
+        })
+        expanded.append((member, {**result, "question": questions[member], "metrics": metrics}))
+    return expanded
+
+
+def fan_out_results(groups: List[Dict], questions: List[str], results: List[Dict]) -> List[Dict]:
+    """Expand one result per group back to one result per input question, in input order.
+
+    results[k] is the result for groups[k]'s representative (see fan_out_result).
+    """
+    expanded: List[Dict] = [None] * len(questions)
+    for group, result in zip(groups, results):
+        for member, member_result in fan_out_result(group, questions, result):
+            expanded[member] = member_result
+    return expanded
+
+
+def save_dedup_report(groups: List[Dict], questions: List[str], base_path: str, threshold: float):
+    """Write the groups formed by the dedup stage as dedup_groups.md and dedup_groups.json."""
+    duplicates = [g for g in groups if len(g["members"]) > 1]
+    with open(f"{base_path}/dedup_groups.json", "w", encoding="utf-8") as f:
+        json.dump({
+            "threshold": threshold,
+            "groups": [
+                {
+                    "representative": questions[g["representative"]],
+                    "members": [
+                        {"index": m + 1, "question": questions[m], "similarity": s}
+                        for m, s in zip(g["members"], g["similarities"])
+                    ],
+                }
+                for g in duplicates
+            ],
+        }, f, indent=2)
+
+    with open(f"{base_path}/dedup_groups.md", "w", encoding="utf-8") as f:
+        f.write("# Near-Duplicate Question Groups\n\n")
+        f.write(f"**Generated on:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+        f.write(f"**Similarity Threshold:** {threshold}\n")
+        f.write(f"**Questions:** {len(questions)}, **Runs Needed:** {len(groups)}\n\n")
+        for n, group in enumerate(duplicates, 1):
+            f.write(f"## Group {n}\n")
+            f.write(f"**Representative:** {questions[group['representative']]}\n\n")
+            for member, similarity in zip(group["members"], group["similarities"]):
+                if member != group["representative"]:
+                    f.write(f"- ({similarity:.2f}) {questions[member]}\n")
+            f.write("\n")
@@ -0,0 +1,74 @@
+import os
+import json
+from typing import Dict, List, Optional, Tuple
+
+from graceful_shutdown import GracefulShutdown
+from question_dedup import fan_out_result
+from result_journal import ResultJournal, summarize_result
+from result_writer import ResultWriter
+
+INCOMPLETE_FILENAME = "incomplete_questions.jsonl"
+
+
+class ResultSpool:
+    """Streams a batch's finished results to its journal and keeps only summaries in memory.
+
+    The journal is in completion order; read_journal_ordered reads it back in input order.
+    """
+
+    def __init__(
+        self,
+        journal: ResultJournal,
+        result_writer: ResultWriter,
+        input_indices: List[int],
+        predictions: Optional[Dict[int, float]] = None,
+        groups: Optional[List[Dict]] = None,
+        all_questions: Optional[List[str]] = None,
+        shutdown: Optional[GracefulShutdown] = None
+    ):
+        self.journal = journal
+        self.result_writer = result_writer
+        self.input_indices = input_indices
+        self.predictions = predictions or {}
+        self.groups = groups
+        self.all_questions = all_questions
+        self.shutdown = shutdown
+        self.incomplete: List[Tuple[int, str]] = []
+        self._summaries: Dict[int, Dict] = {}
+
+    def add(self, index: int, result: Dict):
+        """Spool the result for the question at index, its 1-based position among the questions run."""
+        if self.shutdown is not None and self.shutdown.requested.is_set() and result["status"] != "completed":
+            self.mark_incomplete(index, result["question"])
+            return
+        predicted_time = self.predictions.get(index)
+        if predicted_time is not None:
+            result["metrics"]["predicted_time"] = predicted_time
+        if self.groups is None:
+            members = [(index - 1, result)]
+        else:
+            members = fan_out_result(self.groups[index - 1], self.all_questions, result)
+        for position, member in members:
+            member["input_index"] = self.input_indices[position]
+            self.result_writer.append_journal(self.journal, member)
+            self._summaries[member["input_index"]] = summarize_result(member)
+
+    def mark_incomplete(self, index: int, question: str):
+        """Record that the question at index (and its near-duplicates) was not run to completion."""
+        if self.groups is None:
+            self.incomplete.append((self.input_indices[index - 1], question))
+            return
+        for position in self.groups[index - 1]["members"]:
+            self.incomplete.append((self.input_indices[position], self.all_questions[position]))
+
+    def write_incomplete(self, base_path: str) -> str:
+        """Write the incomplete questions, in input order, as a JSONL question file and return its path."""
+        path = os.path.join(base_path, INCOMPLETE_FILENAME)
+        with open(path, "w", encoding="utf-8") as f:
+            for input_index, question in sorted(self.incomplete):
+                f.write(json.dumps({"question": question, "input_index": input_index}, ensure_ascii=False) + "\n")
+        return path
+
+    def summaries(self) -> List[Dict]:
+        """Summaries of every spooled result, in input order."""
+        return [self._summaries[i] for i in sorted(self._summaries)]
@@ -104,15 +104,18 @@ def process_batch_research(
             # Add timeout and heartbeat settings for polling
             timeout = int(os.getenv("BATCH_TIMEOUT_SECONDS", "300"))  # max seconds to wait per question
             heartbeat_interval = 10  # seconds between progress logs
-            loop_seconds = 0
+            # Measured on the monotonic clock so slow runs.get calls count towards the timeout
+            started = time.monotonic()
+            next_heartbeat = heartbeat_interval
     
             # Poll for completion
             while run.status in ("queued", "in_progress"):
                 time.sleep(1)
-                loop_seconds += 1
-                if loop_seconds % heartbeat_interval == 0:
-                    print(f"Still processing question {i}, elapsed {loop_seconds}s")
-                if loop_seconds >= timeout:
+                elapsed = time.monotonic() - started
+                if elapsed >= next_heartbeat:
+                    print(f"Still processing question {i}, elapsed {elapsed:.0f}s")
+                    next_heartbeat += heartbeat_interval
+                if elapsed >= timeout:
                     print(f"Timeout after {timeout}s for question {i}, aborting run.")
                     # Cancel the run that timed out
                     try:
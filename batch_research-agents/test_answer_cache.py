@@ -0,0 +1,112 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+
+import answer_cache
+from answer_cache import AnswerCache, cached_result
+
+CONTEXT = {"agent": "asst_1", "model": "o3-deep-research"}
+
+
+class Clock:
+    """Stands in for time.time so entries can be aged without sleeping."""
+
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(answer_cache.time, "time", clock)
+    return clock
+
+
+def result(question, text="An answer"):
+    return {
+        "question": question,
+        "status": "completed",
+        "metrics": {"response_text": text, "citations": [], "total_time": 120.0, "total_tokens": 9000},
+    }
+
+
+def cache_path():
+    return os.path.join(tempfile.mkdtemp(), "cache", "answers.sqlite")
+
+
+def test_hits_ignore_case_and_whitespace_but_not_context():
+    path = cache_path()
+    cache = AnswerCache(path, CONTEXT)
+    cache.put("What is the capital of France?", result("What is the capital of France?", "Paris"))
+    assert cache.get("  what is the capital of   france? ")["metrics"]["response_text"] == "Paris"
+    assert AnswerCache(path, {**CONTEXT, "model": "other"}).get("What is the capital of France?") is None
+
+    # Entries persist across instances
+    cache.close()
+    assert AnswerCache(path, CONTEXT).get("What is the capital of France?") is not None
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = AnswerCache(cache_path(), CONTEXT, ttl_seconds=3600)
+    cache.put("Question", result("Question"))
+    clock.now += 3599
+    assert cache.get("Question") is not None
+    clock.now += 2
+    assert cache.get("Question") is None
+    # The expired entry was dropped, not just hidden
+    clock.now -= 2
+    assert cache.get("Question") is None
+
+
+def test_least_recently_used_entries_are_evicted_over_max_bytes(clock):
+    entry_size = len(answer_cache.json.dumps(result("Question 1"), ensure_ascii=False).encode("utf-8"))
+    cache = AnswerCache(cache_path(), CONTEXT, max_bytes=int(entry_size * 2.5))
+    cache.put("Question 1", result("Question 1"))
+    clock.now += 1
+    cache.put("Question 2", result("Question 2"))
+    clock.now += 1
+    # Reading question 1 makes question 2 the least recently used
+    assert cache.get("Question 1") is not None
+    clock.now += 1
+    cache.put("Question 3", result("Question 3"))
+
+    assert cache.get("Question 1") is not None
+    assert cache.get("Question 2") is None
+    assert cache.get("Question 3") is not None
+
+
+def test_modes():
+    path = cache_path()
+    AnswerCache(path, CONTEXT).put("Question", result("Question", "Old"))
+
+    # write (or refresh) stores fresh answers without serving cached ones
+    refresh = AnswerCache(path, CONTEXT, mode="refresh")
+    assert refresh.mode == "write"
+    assert refresh.get("Question") is None
+    refresh.put("Question", result("Question", "New"))
+    assert AnswerCache(path, CONTEXT).get("Question")["metrics"]["response_text"] == "New"
+
+    off_path = cache_path()
+    off = AnswerCache(off_path, CONTEXT, mode="off")
+    off.put("Question", result("Question"))
+    assert off.get("Question") is None
+    assert not os.path.exists(off_path)
+
+    with pytest.raises(ValueError):
+        AnswerCache(path, CONTEXT, mode="sometimes")
+
+
+def test_cache_hit_result_costs_no_tokens():
+    hit = cached_result("Question?", result("Question"), lookup_time=0.01)
+    assert hit["metrics"]["cache_hit"]
+    assert hit["metrics"]["total_tokens"] == 0
+    assert hit["metrics"]["saved_tokens"] == 9000
+    assert hit["metrics"]["saved_time"] == 120.0
+    assert hit["metrics"]["response_text"] == "An answer"
@@ -1,3 +1,7 @@
+import os
+import json
+import tempfile
+
 from batch_research import main as batch_main
 from batch_research import read_questions
 
@@ -11,16 +15,14 @@ def test_main():
     print(f"2. {questions[1]}")
     print("\nStarting processing...\n")
     
-    # Override the read_questions function to return only our test questions
-    def mock_read_questions(_):
-        return questions
-    
-    # Replace the original read_questions in the batch_research module
-    import batch_research
-    batch_research.read_questions = mock_read_questions
-    
-    # Run the main function with our modified read_questions
-    batch_main()
+    # main streams questions from --file, so give it a file holding only our test questions
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        question_file = os.path.join(tmp_dir, "test_questions.jsonl")
+        with open(question_file, "w", encoding="utf-8") as f:
+            for question in questions:
+                f.write(json.dumps({"question": question}) + "\n")
+        
+        batch_main(["--file", question_file])
 
 if __name__ == "__main__":
     test_main()
@@ -0,0 +1,66 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+
+from question_dedup import fan_out_results, group_near_duplicates, key_terms
+
+
+def members(groups):
+    return [group["members"] for group in groups]
+
+
+def test_trivially_different_copies_share_a_run():
+    questions = [
+        "What are the main drivers of inflation in the euro area?",
+        "what are the main drivers of inflation in the euro area",
+        "Summarize recent research on coral reef bleaching.",
+        "  What are the main  drivers of inflation in the euro area?!  ",
+    ]
+    assert members(group_near_duplicates(questions)) == [[0, 1, 3], [2]]
+
+
+def test_different_numbers_or_names_are_not_grouped():
+    questions = [
+        "What was the GDP growth rate of France in 2023?",
+        "What was the GDP growth rate of France in 2024?",
+        "What was the GDP growth rate of Spain in 2023?",
+        "How large is the population of New York?",
+        "How large is the population of New Jersey?",
+    ]
+    assert members(group_near_duplicates(questions)) == [[0], [1], [2], [3], [4]]
+
+
+def test_key_terms_skip_sentence_starts():
+    assert key_terms("What did Apple report in Q3 2024? Which segment grew?") == {"apple", "q3", "2024"}
+
+
+def test_grouping_is_not_transitive():
+    # The middle question is close to both others, but the first and last are not close to each other
+    questions = [
+        "What were the main causes of the decline of the silk road trade routes in late antiquity",
+        "What were the main causes of the decline of the silk road trade routes in late antiquity and medieval times",
+        "What were the main causes of the decline of the silk road trade routes in late antiquity and medieval times across central asia overall",
+    ]
+    groups = group_near_duplicates(questions, threshold=0.75)
+    assert members(groups) == [[0, 1], [2]]
+    assert groups[0]["similarities"][1] >= 0.75
+
+
+def test_fan_out_copies_the_answer_without_double_counting_tokens():
+    questions = ["Question one?", "question one", "Question two?"]
+    groups = [
+        {"representative": 0, "members": [0, 1], "similarities": [1.0, 0.95]},
+        {"representative": 2, "members": [2], "similarities": [1.0]},
+    ]
+    results = [
+        {"question": questions[0], "status": "completed", "metrics": {"response_text": "One", "total_tokens": 100, "phases": {}}},
+        {"question": questions[2], "status": "completed", "metrics": {"response_text": "Two", "total_tokens": 50}},
+    ]
+    expanded = fan_out_results(groups, questions, results)
+    assert [r["question"] for r in expanded] == questions
+    assert expanded[1]["metrics"]["response_text"] == "One"
+    assert expanded[1]["metrics"]["total_tokens"] == 0
+    assert expanded[1]["metrics"]["duplicate_of"] == questions[0]
+    assert "phases" not in expanded[1]["metrics"]
+    assert expanded[0]["metrics"]["total_tokens"] == 100
@@ -0,0 +1,394 @@
+import time
+import random
+import asyncio
+import functools
+import itertools
+import threading
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional
+
+from azure.core.exceptions import HttpResponseError
+from azure.ai.agents.models import (
+    MessageTextContent,
+    MessageTextDetails,
+    MessageTextUrlCitationAnnotation,
+    MessageTextUrlCitationDetails,
+    RunCompletionUsage,
+    RunError,
+    RunStep,
+    RunStepCompletionUsage,
+    RunStepMessageCreationDetails,
+    RunStepMessageCreationReference,
+    ThreadMessage,
+    ThreadRun,
+)
+
+LatencySampler = Callable[[random.Random], float]
+
+# SDK operations the fake service answers, named the way rate_limiter.py names calls
+OPERATIONS = (
+    "threads.create",
+    "threads.delete",
+    "messages.create",
+    "messages.get_last_message_by_role",
+    "runs.create",
+    "runs.get",
+    "runs.cancel",
+    "run_steps.list",
+    "create_thread_and_run",
+)
+RUN_STARTING_OPERATIONS = ("runs.create", "create_thread_and_run")
+
+
+def parse_latency(spec: str) -> LatencySampler:
+    """Build a latency sampler (seconds) from a spec string.
+
+    "0.2" is a fixed delay, "uniform:LOW,HIGH" is uniform, "exp:MEAN" is
+    exponential and "lognormal:MEDIAN,SIGMA" is log-normal, which matches the
+    long tail of real deep-research runs best.
+    """
+    kind, _, params = spec.partition(":")
+    try:
+        if not params:
+            value = float(kind)
+            return lambda rng: value
+        values = [float(p) for p in params.split(",")]
+        if kind == "uniform":
+            low, high = values
+            return lambda rng: rng.uniform(low, high)
+        if kind == "exp":
+            mean, = values
+            return lambda rng: rng.expovariate(1 / mean) if mean > 0 else 0.0
+        if kind == "lognormal":
+            median, sigma = values
+            return lambda rng: rng.lognormvariate(0, sigma) * median
+    except ValueError:
+        pass
+    raise ValueError(f"Invalid latency spec {spec!r}; expected SECONDS, uniform:LOW,HIGH, exp:MEAN or lognormal:MEDIAN,SIGMA")
+
+
+class _FakeResponse:
+    """Just enough of an HTTP response for HttpResponseError and retry_after_seconds."""
+
+    def __init__(self, status_code: int, reason: str, headers: Dict[str, str]):
+        self.status_code = status_code
+        self.reason = reason
+        self.headers = headers
+
+    def text(self, encoding: Optional[str] = None) -> str:
+        return ""
+
+
+class FakeAgentsService:
+    """In-memory stand-in for the Agents service behind FakeAgentsClient and AsyncFakeAgentsClient.
+
+    Latencies are sampled from the given specs and the rates inject run
+    failures, 429s and 500s (see README.md). Calls are counted per operation
+    in calls. Streaming runs are not simulated.
+    """
+
+    def __init__(
+        self,
+        call_latency: str = "0.05",
+        queue_time: str = "exp:0.2",
+        run_time: str = "lognormal:1,0.5",
+        failure_rate: float = 0.0,
+        run_throttle_rate: float = 0.0,
+        throttle_rate: float = 0.0,
+        error_rate: float = 0.0,
+        max_active_runs: int = 0,
+        retry_after: float = 1.0,
+        tokens_in: int = 2000,
+        tokens_out: int = 4000,
+        answer_chars: int = 4000,
+        citations: int = 5,
+        steps_per_run: int = 4,
+        seed: Optional[int] = None
+    ):
+        self.call_latency = parse_latency(call_latency)
+        self.queue_time = parse_latency(queue_time)
+        self.run_time = parse_latency(run_time)
+        self.failure_rate = failure_rate
+        self.run_throttle_rate = run_throttle_rate
+        self.throttle_rate = throttle_rate
+        self.error_rate = error_rate
+        self.max_active_runs = max_active_runs
+        self.retry_after = retry_after
+        self.tokens_in = tokens_in
+        self.tokens_out = tokens_out
+        self.answer_text = ("Simulated research answer. " * (answer_chars // 27 + 1))[:answer_chars]
+        self.citations = citations
+        self.steps_per_run = max(1, steps_per_run)
+        self.calls: Counter = Counter()
+        self.throttled = 0
+        self.errors = 0
+        self.runs_started = 0
+        self._rng = random.Random(seed)
+        self._ids = itertools.count(1)
+        self._threads: Dict[str, Dict[str, Any]] = {}
+        self._runs: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def total_calls(self) -> int:
+        return sum(self.calls.values())
+
+    def latency(self, operation: str) -> float:
+        """Count a call to operation and return how long it should take."""
+        with self._lock:
+            self.calls[operation] += 1
+            return max(0.0, self.call_latency(self._rng))
+
+    def execute(self, operation: str, *args, **kwargs) -> Any:
+        """Answer operation, raising an injected HTTP error instead when one is drawn."""
+        with self._lock:
+            draw = self._rng.random()
+            if draw < self.throttle_rate or (
+                operation in RUN_STARTING_OPERATIONS and self._run_capacity_reached()
+            ):
+                self.throttled += 1
+                raise HttpResponseError(
+                    message="Rate limit is exceeded. Try again later.",
+                    response=_FakeResponse(429, "Too Many Requests", {"Retry-After": str(self.retry_after)}),
+                )
+            if draw < self.throttle_rate + self.error_rate:
+                self.errors += 1
+                raise HttpResponseError(
+                    message="The server had an error while processing your request.",
+                    response=_FakeResponse(500, "Internal Server Error", {}),
+                )
+            handler = getattr(self, "_" + operation.replace(".", "_"))
+            return handler(*args, **kwargs)
+
+    def _new_id(self, prefix: str) -> str:
+        return f"{prefix}_{next(self._ids):08d}"
+
+    def _run_capacity_reached(self) -> bool:
+        if not self.max_active_runs:
+            return False
+        now = time.monotonic()
+        active = sum(1 for run in self._runs.values() if run["cancelled_at"] is None and run["ends_at"] > now)
+        return active >= self.max_active_runs
+
+    def _run_status(self, run: Dict[str, Any]) -> str:
+        now = time.monotonic()
+        if run["cancelled_at"] is not None and run["cancelled_at"] < run["ends_at"]:
+            return "cancelled"
+        if now < run["started_at"]:
+            return "queued"
+        if now < run["ends_at"]:
+            return "in_progress"
+        return run["outcome"]
+
+    def _run_model(self, run_id: str) -> ThreadRun:
+        """A fresh ThreadRun snapshot, like the one the SDK deserializes on every call."""
+        run = self._runs[run_id]
+        status = self._run_status(run)
+        model = ThreadRun(
+            id=run_id, thread_id=run["thread_id"], agent_id=run["agent_id"], status=status,
+            instructions="", tools=[], created_at=0, expires_at=None, started_at=None,
+            completed_at=None, cancelled_at=None, failed_at=None, model="fake-deep-research",
+            incomplete_details=None, usage=None, temperature=None, top_p=None,
+            max_prompt_tokens=None, max_completion_tokens=None, truncation_strategy=None,
+            tool_choice=None, response_format=None, tool_resources=None,
+            parallel_tool_calls=False, metadata={}, last_error=None, required_action=None,
+        )
+        if status in ("completed", "failed"):
+            model.usage = RunCompletionUsage(
+                prompt_tokens=self.tokens_in, completion_tokens=self.tokens_out,
+                total_tokens=self.tokens_in + self.tokens_out,
+            )
+        if status == "failed":
+            model.last_error = RunError(code=run["error_code"], message=f"Simulated {run['error_code']}")
+        return model
+
+    def _run_steps_list(self, thread_id: str, run_id: str, **kwargs) -> List[RunStep]:
+        run = self._runs[run_id]
+        ended_at = run["ends_at"] if run["cancelled_at"] is None else min(run["ends_at"], run["cancelled_at"])
+        now = min(time.monotonic(), ended_at)
+        step_time = (run["ends_at"] - run["started_at"]) / self.steps_per_run
+        prompt_tokens = self.tokens_in // self.steps_per_run
+        completion_tokens = self.tokens_out // self.steps_per_run
+        steps = []
+        for n in range(self.steps_per_run):
+            if now < run["started_at"] + n * step_time:
+                break
+            completed = now >= run["started_at"] + (n + 1) * step_time
+            steps.append(RunStep(
+                id=f"{run_id}_step_{n}", type="message_creation", agent_id=run["agent_id"],
+                thread_id=thread_id, run_id=run_id, status="completed" if completed else "in_progress",
+                step_details=RunStepMessageCreationDetails(
+                    message_creation=RunStepMessageCreationReference(message_id=f"{run_id}_msg")
+                ),
+                last_error=None, created_at=None, expired_at=None, completed_at=None,
+                cancelled_at=None, failed_at=None, metadata={},
+                usage=RunStepCompletionUsage(
+                    prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                    total_tokens=prompt_tokens + completion_tokens,
+                ) if completed else None,
+            ))
+        return steps
+
+    def _threads_create(self, **kwargs) -> Any:
+        thread_id = self._new_id("thread")
+        self._threads[thread_id] = {"question": None, "run_id": None}
+        return _Thread(thread_id)
+
+    def _threads_delete(self, thread_id: str, **kwargs) -> None:
+        self._threads.pop(thread_id, None)
+
+    def _messages_create(self, thread_id: str, role: str, content: str, **kwargs) -> Any:
+        self._threads[thread_id]["question"] = content
+        return _Thread(self._new_id("msg"))
+
+    def _runs_create(self, thread_id: str, agent_id: str, **kwargs) -> ThreadRun:
+        run_id = self._new_id("run")
+        started_at = time.monotonic() + max(0.0, self.queue_time(self._rng))
+        draw = self._rng.random()
+        error_code = None
+        if draw < self.failure_rate:
+            error_code = "server_error"
+        elif draw < self.failure_rate + self.run_throttle_rate:
+            error_code = "rate_limit_exceeded"
+        self._runs[run_id] = {
+            "thread_id": thread_id,
+            "agent_id": agent_id,
+            "started_at": started_at,
+            "ends_at": started_at + max(0.0, self.run_time(self._rng)),
+            "outcome": "failed" if error_code else "completed",
+            "error_code": error_code,
+            "cancelled_at": None,
+        }
+        self._threads[thread_id]["run_id"] = run_id
+        self.runs_started += 1
+        return self._run_model(run_id)
+
+    def _create_thread_and_run(self, agent_id: str, thread: Any = None, **kwargs) -> ThreadRun:
+        thread_id = self._threads_create().id
+        if thread is not None and thread.messages:
+            self._threads[thread_id]["question"] = thread.messages[0].content
+        return self._runs_create(thread_id, agent_id)
+
+    def _runs_get(self, thread_id: str, run_id: str, **kwargs) -> ThreadRun:
+        return self._run_model(run_id)
+
+    def _runs_cancel(self, thread_id: str, run_id: str, **kwargs) -> ThreadRun:
+        self._runs[run_id]["cancelled_at"] = time.monotonic()
+        return self._run_model(run_id)
+
+    def _messages_get_last_message_by_role(self, thread_id: str, role: Any, **kwargs) -> Optional[ThreadMessage]:
+        run_id = self._threads[thread_id]["run_id"]
+        if run_id is None or self._run_status(self._runs[run_id]) != "completed":
+            return None
+        annotations = [
+            MessageTextUrlCitationAnnotation(
+                text=f"[{n}]",
+                url_citation=MessageTextUrlCitationDetails(url=f"https://example.com/source/{n}", title=f"Source {n}"),
+            )
+            for n in range(1, self.citations + 1)
+        ]
+        return ThreadMessage(
+            id=self._new_id("msg"), created_at=0, thread_id=thread_id, status="completed",
+            role="assistant", attachments=[], metadata={}, run_id=run_id,
+            # A fresh string per answer, as the SDK deserializes one per response
+            content=[MessageTextContent(text=MessageTextDetails(value=f"{run_id}: {self.answer_text}", annotations=annotations))],
+        )
+
+
+class _Thread:
+    """Minimal object with the id the runners read from threads.create and messages.create."""
+
+    def __init__(self, id: str):
+        self.id = id
+
+
+class _Operations:
+    """An operation group (threads, messages, runs, run_steps) of a fake client."""
+
+    def __init__(self, call: Callable, group: str):
+        self._call = call
+        self._group = group
+
+    def __getattr__(self, name: str):
+        operation = f"{self._group}.{name}"
+        if operation not in OPERATIONS:
+            raise AttributeError(f"The fake Agents service does not implement {operation}")
+        return functools.partial(self._call, operation)
+
+
+class FakeAgentsClient:
+    """Drop-in for the parts of azure.ai.agents.AgentsClient the runners use, backed by a FakeAgentsService."""
+
+    def __init__(self, service: FakeAgentsService):
+        self.service = service
+        self.threads = _Operations(self._call, "threads")
+        self.messages = _Operations(self._call, "messages")
+        self.runs = _Operations(self._call, "runs")
+        self.run_steps = _Operations(self._call, "run_steps")
+
+    def _call(self, operation: str, *args, **kwargs) -> Any:
+        time.sleep(self.service.latency(operation))
+        return self.service.execute(operation, *args, **kwargs)
+
+    def create_thread_and_run(self, *args, **kwargs) -> ThreadRun:
+        return self._call("create_thread_and_run", *args, **kwargs)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class _AsyncPager:
+    """Async iterable returned by list operations, which calls the service when iterated, as AsyncItemPaged does."""
+
+    def __init__(self, call: Callable, operation: str, *args, **kwargs):
+        self._call = call
+        self._operation = operation
+        self._args = args
+        self._kwargs = kwargs
+
+    async def __aiter__(self):
+        for item in await self._call(self._operation, *self._args, **self._kwargs):
+            yield item
+
+
+class _AsyncOperations(_Operations):
+    """An operation group of an async fake client: list methods return a pager, the rest are coroutines."""
+
+    def __getattr__(self, name: str):
+        operation = super().__getattr__(name)
+        if name == "list":
+            return functools.partial(_AsyncPager, self._call, operation.args[0])
+        return operation
+
+
+class AsyncFakeAgentsClient:
+    """Drop-in for azure.ai.agents.aio.AgentsClient; latency is awaited instead of slept."""
+
+    def __init__(self, service: FakeAgentsService):
+        self.service = service
+        self.threads = _AsyncOperations(self._call, "threads")
+        self.messages = _AsyncOperations(self._call, "messages")
+        self.runs = _AsyncOperations(self._call, "runs")
+        self.run_steps = _AsyncOperations(self._call, "run_steps")
+
+    async def _call(self, operation: str, *args, **kwargs) -> Any:
+        await asyncio.sleep(self.service.latency(operation))
+        return self.service.execute(operation, *args, **kwargs)
+
+    async def create_thread_and_run(self, *args, **kwargs) -> ThreadRun:
+        return await self._call("create_thread_and_run", *args, **kwargs)
+
+    async def close(self):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
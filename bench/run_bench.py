@@ -0,0 +1,180 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import resource
+import tempfile
+import subprocess
+import contextlib
+from datetime import datetime
+from typing import Dict, List
+
+from fake_agents import AsyncFakeAgentsClient, FakeAgentsClient, FakeAgentsService
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runner name -> component directory holding its modules
+RUNNERS = {
+    "batch-threads": "batch_research-agents",
+    "batch-async": "batch_research-agents",
+    "chat-batch": "chat_research_agent",
+}
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MiB (ru_maxrss is KiB on Linux, bytes on macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def create_service(args: argparse.Namespace) -> FakeAgentsService:
+    return FakeAgentsService(
+        call_latency=args.call_latency,
+        queue_time=args.queue_time,
+        run_time=args.run_time,
+        failure_rate=args.failure_rate,
+        run_throttle_rate=args.run_throttle_rate,
+        throttle_rate=args.throttle_rate,
+        error_rate=args.error_rate,
+        max_active_runs=args.max_active_runs,
+        retry_after=args.retry_after,
+        answer_chars=args.answer_chars,
+        seed=args.seed,
+    )
+
+
+def run_worker(runner: str, args: argparse.Namespace) -> Dict:
+    """Run one runner against a fresh fake service in this process and return its measurements.
+
+    The runner gets the same rate limiter and retry policy its CLI builds, so
+    429s are paced and transient failures retried as in production. Its
+    console output is discarded. RSS growth is measured from after the
+    runner's modules are imported, so it covers the run itself (including the
+    fake service's state).
+    """
+    sys.path.insert(0, os.path.join(REPO_ROOT, RUNNERS[runner]))
+    sys.path.insert(0, os.path.join(REPO_ROOT, "common"))
+    from poll_scheduler import FixedPollScheduler
+    from rate_limiter import create_rate_limiter
+    from retry_policy import create_retry_policy
+    if runner == "chat-batch":
+        from chat_research import process_batch_research
+    else:
+        from batch_research import process_batch_research, process_batch_research_async
+
+    questions = [f"Benchmark question {i}: what changed in market segment {i % 17} this year?"
+                 for i in range(1, args.questions + 1)]
+    service = create_service(args)
+    rate_limiter = create_rate_limiter()
+    retry_policy = create_retry_policy(len(questions))
+    poll_scheduler = FixedPollScheduler(interval=args.poll_interval)
+    baseline_rss = peak_rss_mb()
+
+    with tempfile.TemporaryDirectory() as output_dir, open(os.devnull, "w") as devnull:
+        with contextlib.redirect_stdout(devnull):
+            start = time.monotonic()
+            if runner == "batch-threads":
+                results = process_batch_research(
+                    questions, rate_limiter.wrap(FakeAgentsClient(service)), "fake-agent", output_dir,
+                    concurrency=args.concurrency, poll_scheduler=poll_scheduler,
+                    rate_limiter=rate_limiter, retry_policy=retry_policy, create_mode=args.create_mode,
+                )
+            elif runner == "batch-async":
+                results = asyncio.run(process_batch_research_async(
+                    questions, rate_limiter.wrap_async(AsyncFakeAgentsClient(service)), "fake-agent", output_dir,
+                    concurrency=args.concurrency, poll_scheduler=poll_scheduler,
+                    rate_limiter=rate_limiter, retry_policy=retry_policy, create_mode=args.create_mode,
+                ))
+            else:
+                # The chat runner processes questions one at a time
+                results = process_batch_research(
+                    questions, rate_limiter.wrap(FakeAgentsClient(service)), "fake-agent", output_dir,
+                    poll_scheduler=poll_scheduler, rate_limiter=rate_limiter,
+                    retry_policy=retry_policy, create_mode=args.create_mode,
+                )
+            wall_seconds = time.monotonic() - start
+
+    completed = sum(1 for r in results if r["status"] == "completed")
+    return {
+        "runner": runner,
+        "questions": len(questions),
+        "completed": completed,
+        "failed": len(results) - completed,
+        "wall_seconds": round(wall_seconds, 3),
+        "questions_per_hour": round(len(questions) / wall_seconds * 3600, 1),
+        "sdk_calls_per_question": round(service.total_calls / len(questions), 2),
+        "sdk_calls": dict(service.calls),
+        "runs_started": service.runs_started,
+        "throttled_429": service.throttled,
+        "server_errors_500": service.errors,
+        "retries": retry_policy.retries_used,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "rss_growth_mb": round(peak_rss_mb() - baseline_rss, 1),
+    }
+
+
+def run_in_subprocess(runner: str) -> Dict:
+    """Run a runner in a fresh interpreter so modules and memory are not shared between runners."""
+    argv = [sys.executable, os.path.abspath(__file__), *sys.argv[1:], "--worker", runner]
+    completed = subprocess.run(argv, capture_output=True, text=True)
+    if completed.returncode != 0:
+        print(completed.stderr, file=sys.stderr)
+        raise RuntimeError(f"Benchmark of {runner} failed with exit code {completed.returncode}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def print_report(reports: List[Dict]):
+    print(f"\n{'Runner':<15} {'Done':>9} {'Seconds':>9} {'Q/hour':>10} {'Calls/Q':>8} {'429s':>6} {'Peak RSS MB':>12} {'RSS growth MB':>14}")
+    for r in reports:
+        print(f"{r['runner']:<15} {r['completed']:>4}/{r['questions']:<4} {r['wall_seconds']:>9.1f} "
+              f"{r['questions_per_hour']:>10.0f} {r['sdk_calls_per_question']:>8.2f} {r['throttled_429']:>6} "
+              f"{r['peak_rss_mb']:>12.1f} {r['rss_growth_mb']:>14.1f}")
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the research runners against a local fake Agents service")
+    parser.add_argument("--runner", choices=[*RUNNERS, "all"], default="all", help="Runner to benchmark (default: all)")
+    parser.add_argument("--questions", type=int, default=50, help="Number of synthetic questions (default: 50)")
+    parser.add_argument("--concurrency", type=int, default=10, help="Questions in flight for the batch runners (default: 10)")
+    parser.add_argument("--create-mode", choices=["separate", "combined"], default="separate",
+                        help="How runs are started (default: separate, as in the CLIs)")
+    parser.add_argument("--poll-interval", type=float, default=0.25, help="Seconds between run status polls (default: 0.25)")
+    parser.add_argument("--call-latency", default="lognormal:0.05,0.3", help="Latency of every SDK call (see fake_agents.parse_latency)")
+    parser.add_argument("--queue-time", default="exp:0.2", help="Time a run stays queued")
+    parser.add_argument("--run-time", default="lognormal:1,0.5", help="Time a run stays in progress")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of runs failing with server_error")
+    parser.add_argument("--run-throttle-rate", type=float, default=0.0, help="Fraction of runs failing with rate_limit_exceeded")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of calls rejected with 429")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of calls rejected with 500")
+    parser.add_argument("--max-active-runs", type=int, default=0, help="Reject run starts with 429 above this many active runs (0: no limit)")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with injected 429s")
+    parser.add_argument("--answer-chars", type=int, default=4000, help="Length of every answer (default: 4000)")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for the fake service")
+    parser.add_argument("--output", default=None, help="JSON report path (default: bench_results_<timestamp>.json)")
+    parser.add_argument("--worker", choices=list(RUNNERS), help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.worker:
+        print(json.dumps(run_worker(args.worker, args)))
+        return
+
+    runners = list(RUNNERS) if args.runner == "all" else [args.runner]
+    reports = []
+    for runner in runners:
+        print(f"Benchmarking {runner} with {args.questions} questions...")
+        reports.append(run_in_subprocess(runner))
+    print_report(reports)
+
+    output = args.output or f"bench_results_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({"config": {k: v for k, v in vars(args).items() if k != "worker"}, "results": reports}, f, indent=2)
+    print(f"\nReport saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,10 @@
 import os
+import sys
 import json
 import time
 import random
 import uuid
+import atexit
 import threading
 from datetime import datetime
 from typing import Dict, List, Optional, Any
@@ -12,26 +14,26 @@ from azure.identity import DefaultAzureCredential
 from azure.ai.agents import AgentsClient
 from azure.ai.agents.models import DeepResearchTool, MessageRole, ThreadMessage
 from dotenv import load_dotenv
+# Helpers shared by the research runners live in ../common
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+from poll_scheduler import create_poll_scheduler
+from rate_limiter import create_rate_limiter
+from graceful_shutdown import create_graceful_shutdown
+from thread_provisioner import create_thread_provisioner, new_thread_id
+from connection_cache import create_connection_cache, with_connection
+from preflight import PROJECT_SCOPE, SharedTokenCredential, run_preflight
+from agent_registry import create_agent_registry, get_or_create_agent
 
 # Load environment variables from .env file
 load_dotenv()
 
 class DeepResearchChatAgent:
     def __init__(self):
-        # Initialize Azure clients
+        # Initialize Azure clients; they share one token per scope
+        self.credential = SharedTokenCredential(DefaultAzureCredential())
         self.project_client = AIProjectClient(
             endpoint=os.environ["PROJECT_ENDPOINT_RELX_LEGAL"],
-            credential=DefaultAzureCredential(),
-        )
-        
-        # Initialize Deep Research tool
-        self.conn_id = self.project_client.connections.get(
-            name=os.environ["BING_CONNECTED_RESOURCE_NAME"]
-        ).id
-        
-        self.deep_research_tool = DeepResearchTool(
-            bing_grounding_connection_id=self.conn_id,
-            deep_research_model=os.environ["DEEP_RESEARCH_MODEL_DEPLOYMENT_NAME"],
+            credential=self.credential,
         )
         
         # Configure persistence directories
@@ -42,12 +44,25 @@ class DeepResearchChatAgent:
         # Try to load from disk if available
         self.thread_cache = self._load_thread_cache() or {}
         
-        # Initialize agents client
+        # Poll scheduler for run status checks (POLL_MODE / POLL_* env vars)
+        self.poll_scheduler = create_poll_scheduler(key="chat_research")
+        
+        # Initialize agents client; every call goes through a shared rate limiter (AGENTS_RPM / AGENTS_TPM),
+        # and runs are tracked so a shutdown can cancel the ones in flight
         self.project_client.__enter__()
-        self.agents_client = self.project_client.agents.__enter__()
+        self.rate_limiter = create_rate_limiter()
+        self.shutdown = create_graceful_shutdown()
+        self.agents_client = self.shutdown.wrap(self.rate_limiter.wrap(self.project_client.agents.__enter__()))
+        
+        # With PREWARM_THREADS set, keep empty threads ready so new sessions skip the threads.create
+        # round trip; off by default, as a single question has nothing to overlap it with
+        self.thread_provisioner = create_thread_provisioner(self.agents_client, default_size=0)
         
-        # Try to load existing agent ID
-        self.agent = self._load_or_create_agent()
+        # Fetch the token while the Bing connection is resolved and the agent looked up
+        self.agent = run_preflight({
+            "credential": lambda: self.credential.get_token(PROJECT_SCOPE),
+            "agent": self._load_or_create_agent,
+        })["agent"]
         
         # Set up periodic thread cache saving (every 10 minutes)
         self.keep_saving = True
@@ -58,31 +73,26 @@ class DeepResearchChatAgent:
         print(f"Initialized Deep Research Chat Agent, ID: {self.agent.id}")
         
     def _load_or_create_agent(self):
-        """Load existing agent or create a new one if needed"""
-        agent_config_file = os.path.join(self.config_dir, "agent_config.json")
-        agent = None
-        
-        try:
-            # Check if config file exists
-            if os.path.exists(agent_config_file):
-                with open(agent_config_file, 'r') as f:
-                    agent_config = json.load(f)
-                    
-                agent_id = agent_config.get('agent_id')
-                if agent_id:
-                    try:
-                        # Try to fetch the existing agent
-                        agent = self.agents_client.get_agent(agent_id)
-                        print(f"Loaded existing agent, ID: {agent_id}")
-                        return agent
-                    except Exception as e:
-                        print(f"Failed to load existing agent: {str(e)}")
-        except Exception as e:
-            print(f"Error loading agent config: {str(e)}")
-        
+        """Reuse the agent registered for this model, instructions and tools, or create one"""
+        # Bing connection ids are cached on disk (CONNECTION_CACHE_FILE / CONNECTION_CACHE_TTL_SECONDS)
+        connection_cache = create_connection_cache(
+            os.environ["PROJECT_ENDPOINT_RELX_LEGAL"], os.path.join(self.config_dir, "connection_cache.json")
+        )
+        agent, self.owns_agent = with_connection(
+            connection_cache, self.project_client, os.environ["BING_CONNECTED_RESOURCE_NAME"], self._get_or_create_agent
+        )
+        return agent
 
-        # Create a new agent if we couldn't load an existing one
-        agent = self.agents_client.create_agent(
+    def _get_or_create_agent(self, conn_id: str):
+        """Build the Deep Research tool for conn_id and get or create the agent using it"""
+        self.conn_id = conn_id
+        self.deep_research_tool = DeepResearchTool(
+            bing_grounding_connection_id=conn_id,
+            deep_research_model=os.environ["DEEP_RESEARCH_MODEL_DEPLOYMENT_NAME"],
+        )
+        return get_or_create_agent(
+            self.agents_client,
+            create_agent_registry(os.path.join(self.config_dir, "agent_registry.json")),
             model=os.environ["MODEL_DEPLOYMENT_NAME"],
             name="deep-research-chat-agent",
             instructions="""You are a helpful research agent that assists in researching topics comprehensively. 
@@ -96,21 +106,9 @@ class DeepResearchChatAgent:
 
             You will be provided a question to answer that you must do your best to answer without asking for clarity. Provide a complete, well-researched response.""",
             tools=self.deep_research_tool.definitions,
-        )        
-        # Save the agent ID for future use
-        try:
-            with open(agent_config_file, 'w') as f:
-                json.dump({
-                    'agent_id': agent.id,
-                    'name': "deep-research-chat-agent",
-                    'model': os.environ["MODEL_DEPLOYMENT_NAME"],
-                    'created_at': datetime.now().isoformat()
-                }, f, indent=2)
-                print(f"Saved agent configuration, ID: {agent.id}")
-        except Exception as e:
-            print(f"Failed to save agent configuration: {str(e)}")
-            
-        return agent
+            # The agent id saved by earlier versions seeds the registry on first use
+            legacy_config=os.path.join(self.config_dir, "agent_config.json"),
+        )
 
     def _load_thread_cache(self):
         """Load thread cache from file"""
@@ -226,9 +224,8 @@ class DeepResearchChatAgent:
                 # Continue below to create a new thread
         
         try:
-            # Create a new thread
-            thread = self.agents_client.threads.create()
-            thread_id = thread.id
+            # Take a pre-created thread, or create one if none is ready
+            thread_id = new_thread_id(self.agents_client, self.thread_provisioner)
             self.thread_cache[session_id] = thread_id
             print(f"Created new thread for session {session_id}, ID: {thread_id}")
             
@@ -276,6 +273,7 @@ class DeepResearchChatAgent:
                     # Max retries reached, raise error
                     raise Exception(f"Failed to create or access thread after {max_retries} attempts: {str(last_error)}")
         
+        run = None
         try:
             # Create message
             self.agents_client.messages.create(
@@ -291,20 +289,26 @@ class DeepResearchChatAgent:
             # Add timeout and heartbeat settings for polling
             timeout = timeout_seconds or int(os.getenv("CHAT_TIMEOUT_SECONDS", "600"))  # increased default timeout to 600 seconds
             heartbeat_interval = 5  # seconds between progress logs
-            loop_seconds = 0
+            # Measured on the monotonic clock so slow runs.get calls count towards the timeout
+            started = time.monotonic()
+            elapsed = 0.0
+            next_heartbeat = heartbeat_interval
             
             response_text = ""
             citations = []
+            requeues = 0
             
-            # Poll for completion
+            # Poll for completion, letting the scheduler decide how long to wait between checks
             while run.status in ("queued", "in_progress"):
-                await asyncio.sleep(1)  # Use asyncio.sleep for async waiting
-                loop_seconds += 1
+                interval = min(self.poll_scheduler.next_interval(elapsed), max(timeout - elapsed, 0))
+                await asyncio.sleep(interval)  # Use asyncio.sleep for async waiting
+                elapsed = time.monotonic() - started
                 
-                if loop_seconds % heartbeat_interval == 0:
-                    print(f"Still processing message in session {session_id}, elapsed {loop_seconds}s")
+                if elapsed >= next_heartbeat:
+                    print(f"Still processing message in session {session_id}, elapsed {elapsed:.0f}s")
+                    next_heartbeat = (elapsed // heartbeat_interval + 1) * heartbeat_interval
                 
-                if loop_seconds >= timeout:
+                if elapsed >= timeout:
                     print(f"Timeout after {timeout}s for message ('{message[:50]}...'), aborting run.")
                     try:
                         self.agents_client.runs.cancel(thread_id=thread_id, run_id=run_id)
@@ -322,6 +326,13 @@ class DeepResearchChatAgent:
                 # Update run status
                 run = self.agents_client.runs.get(thread_id=thread_id, run_id=run_id)
                 
+                # A run that failed on a rate limit is started again instead of failing the message
+                if self.rate_limiter.requeue_throttled_run(run, requeues):
+                    requeues += 1
+                    run = self.agents_client.runs.create(thread_id=thread_id, agent_id=self.agent.id)
+                    run_id = run.id
+                    continue
+                
                 # Get latest response
                 response = self.agents_client.messages.get_last_message_by_role(
                     thread_id=thread_id,
@@ -346,8 +357,8 @@ class DeepResearchChatAgent:
                             for i, ann in enumerate(response.url_citation_annotations)
                         ]
 
-            response_text = response_text
-            citations = citations
+            if run.status == "completed":
+                self.poll_scheduler.record(time.monotonic() - started)
 
             
             # Generate formatted markdown for the response
@@ -370,6 +381,8 @@ class DeepResearchChatAgent:
                 "status": "error",
                 "error": str(e)
             }
+        finally:
+            self.rate_limiter.release_run(run)
 
     async def reset_session(self, session_id: str) -> bool:
         """Reset a conversation session by creating a new thread"""
@@ -503,6 +516,10 @@ class DeepResearchChatAgent:
                 
     def cleanup(self):
         """Clean up resources - no longer deletes the agent"""
+        # Runs at exit and again from __del__
+        if getattr(self, 'cleaned_up', False):
+            return
+        self.cleaned_up = True
         try:
             # Stop the periodic save thread
             if hasattr(self, 'keep_saving'):
@@ -510,13 +527,25 @@ class DeepResearchChatAgent:
                 if hasattr(self, 'save_thread'):
                     self.save_thread.join(timeout=2.0)  # Give it 2 seconds to finish
                 
+            # Cancel runs still in flight, such as one abandoned by an interrupted request
+            if hasattr(self, 'shutdown'):
+                self.shutdown.cancel_in_flight()
+                
             # Save thread cache before shutting down
             if hasattr(self, 'thread_cache'):
                 self._save_thread_cache()
                 print("Thread cache saved during cleanup")
                 
-            # Note: We no longer delete the agent since we want to reuse it
-            # We just clean up the clients
+            # Delete pre-created threads no session has used
+            if getattr(self, 'thread_provisioner', None):
+                self.thread_provisioner.close()
+                
+            # Registered agents are kept for reuse; only one created without a registry is deleted
+            if getattr(self, 'owns_agent', False):
+                self.agents_client.delete_agent(self.agent.id)
+                self.owns_agent = False
+                print("Agent cleaned up")
+                
             if hasattr(self, 'agents_client'):
                 self.project_client.agents.__exit__(None, None, None)
                 
@@ -535,8 +564,11 @@ class DeepResearchChatAgent:
             pass
 
 
-# Singleton instance
+# Singleton instance; cleaned up at exit so pre-created threads are not left behind
 deep_research_agent = DeepResearchChatAgent()
+atexit.register(deep_research_agent.cleanup)
+# SIGINT/SIGTERM cancel the runs in flight, then go on to the host application's own handler
+deep_research_agent.shutdown.install(chain=True)
 
 # Async function to run a chat session
 def save_response_locally(prompt: str, result: Dict[str, Any], session_id: str) -> str:
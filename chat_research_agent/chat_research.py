@@ -1,17 +1,49 @@
+import io
 import os
-import csv
+import sys
 import json
 import time
 import re
 import argparse
+import contextlib
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
 from azure.ai.projects import AIProjectClient
 from azure.identity import DefaultAzureCredential
 from azure.ai.agents import AgentsClient
 from azure.ai.agents.models import DeepResearchTool, MessageRole, ThreadMessage
 from opentelemetry import trace
 from dotenv import load_dotenv
+# Helpers shared by the research runners live in ../common
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+from poll_scheduler import PollScheduler, FixedPollScheduler, create_poll_scheduler
+from streaming import stream_run
+from rate_limiter import RateLimiter, count_calls, create_rate_limiter
+from thread_provisioner import ThreadProvisioner, create_thread_provisioner, new_thread_id
+from phase_timing import PhaseTimer, write_phase_table
+from run_submit import CREATE_MODES, CombinedCreate
+from question_reader import iter_questions
+from sharding import Shard, merge_shard_results, parse_shard, select_shard, write_shard_manifest
+from retry_policy import RetryPolicy, create_retry_policy
+from question_runner import Attempt, run_question
+from batch_deadline import BatchDeadline, create_batch_deadline
+from connection_cache import create_connection_cache, with_connection
+from preflight import PROJECT_SCOPE, SharedTokenCredential, run_preflight
+from agent_registry import create_agent_registry, get_or_create_agent
+from token_budget import ADMIT, TokenBudget, create_token_budget
+from result_writer import ResultWriter, write_text
+from graceful_shutdown import GracefulShutdown, ShutdownRequested, create_graceful_shutdown, print_incomplete
+from result_journal import (
+    JOURNAL_FILENAME,
+    RESULTS_FILENAME,
+    ResultJournal,
+    compact_journal,
+    question_key,
+    read_journal,
+    result_key,
+    summarize_result,
+    write_json_atomic,
+)
 
 
 # Load environment variables from .env file
@@ -40,35 +72,37 @@ def validate_environment():
         raise ValueError("Timeout environment variables must be valid integers")
 
 def read_questions(file_path: str) -> List[str]:
-    """Read questions from JSON or CSV file."""
-    if not os.path.exists(file_path):
-        raise FileNotFoundError(f"Input file not found: {file_path}")
-    
-    questions = []
-    if file_path.endswith('.json'):
-        with open(file_path, 'r', encoding='utf-8') as f:
-            questions = json.load(f)
-    else:
-        # Fallback to CSV reading
-        with open(file_path, 'r', encoding='utf-8') as f:
-            reader = csv.reader(f)
-            for row in reader:
-                if row:  # Skip empty rows
-                    questions.append(row[0])
-    return questions
-
-def load_progress(output_dir: str) -> List[str]:
-    """Load already processed questions from output directory."""
-    processed_questions = []
+    """Read all questions from a JSONL, JSON or CSV file into a list.
     
-    # Check for existing results file
-    results_file = f"{output_dir}/batch_results.json"
+    Use question_reader.iter_questions to stream large files instead.
+    """
+    return list(iter_questions(file_path))
+
+def iter_results(output_dir: str) -> Iterator[Dict]:
+    """Stream finished results from the checkpoint journal in the output directory.
+    
+    Falls back to batch_results.json for runs written before the journal
+    existed. Which file is read is decided when this is called, not when
+    iteration starts.
+    """
+    journal_file = os.path.join(output_dir, JOURNAL_FILENAME)
+    if os.path.exists(journal_file):
+        return read_journal(journal_file)
+    
+    results_file = os.path.join(output_dir, RESULTS_FILENAME)
     if os.path.exists(results_file):
         with open(results_file, 'r', encoding='utf-8') as f:
-            results = json.load(f)
-            processed_questions = [r['question'] for r in results]
+            return iter(json.load(f))
     
-    return processed_questions
+    return iter([])
+
+def load_results(output_dir: str) -> List[Dict]:
+    """Load finished results from the checkpoint journal in the output directory."""
+    return list(iter_results(output_dir))
+
+def load_progress(output_dir: str) -> Set[str]:
+    """Load the keys of already processed questions from output directory."""
+    return {result_key(r) for r in iter_results(output_dir)}
 
 def is_clarification_needed(response_text: str) -> bool:
     """Better detection of when agent needs clarification."""
@@ -93,182 +127,244 @@ def is_clarification_needed(response_text: str) -> bool:
     
     return False
 
+def count_rest(remaining: Iterator) -> int:
+    """Read past the questions left in the input and return how many there were, without keeping them."""
+    return sum(1 for _ in remaining)
+
+def attempt_result(question: str, attempt: Attempt) -> Dict:
+    """Build the result dictionary for one attempt at a batch question (see question_runner.py)."""
+    if attempt.error is not None:
+        return {
+            "question": question,
+            "question_key": question_key(question),
+            "status": "error",
+            "error": str(attempt.error),
+            "metrics": {
+                "time_to_first_token": None,
+                "total_time": time.time() - attempt.start_time,
+                "tokens_in": 0,
+                "tokens_out": 0,
+                "total_tokens": 0,
+                "response_text": "",
+                "citations": []
+            }
+        }
+    
+    run = attempt.run
+    if attempt.citations:
+        print("\nReferences:")
+        for j, citation in enumerate(attempt.citations, 1):
+            print(f"{j}. {citation['title']}: {citation['url']}")
+    
+    # Get token usage (if available from run)
+    tokens_in = getattr(run.usage, 'prompt_tokens', 0) if hasattr(run, 'usage') else 0
+    tokens_out = getattr(run.usage, 'completion_tokens', 0) if hasattr(run, 'usage') else 0
+    
+    result = {
+        "question": question,
+        "question_key": question_key(question),
+        "status": run.status,
+        "error": str(run.last_error) if run.status == "failed" else None,
+        "metrics": {
+            "time_to_first_token": attempt.time_to_first_token,
+            "total_time": time.time() - attempt.start_time,
+            "tokens_in": tokens_in,
+            "tokens_out": tokens_out,
+            "total_tokens": tokens_in + tokens_out,
+            "response_text": attempt.response_text,
+            "citations": attempt.citations,
+            "requeues": attempt.requeues
+        }
+    }
+    if attempt.stream_metrics:
+        result["metrics"].update(attempt.stream_metrics)
+    if attempt.cap_error:
+        result["status"] = "cancelled"
+        result["error"] = attempt.cap_error
+    return result
+
 def process_batch_research(
-    questions: List[str],
+    questions: Iterable[str],
     agents_client: AgentsClient,
     agent_id: str,
     output_base_path: str,
-    resume_progress: List[str] = None
+    resume_progress: Optional[Set[str]] = None,
+    poll_scheduler: Optional[PollScheduler] = None,
+    stream: bool = False,
+    rate_limiter: Optional[RateLimiter] = None,
+    retry_policy: Optional[RetryPolicy] = None,
+    shard: Optional[Shard] = None,
+    thread_provisioner: Optional[ThreadProvisioner] = None,
+    create_mode: str = "separate",
+    token_budget: Optional[TokenBudget] = None,
+    shutdown: Optional[GracefulShutdown] = None,
+    batch_deadline: Optional[BatchDeadline] = None
 ) -> List[Dict]:
-    """Process a batch of research questions and track metrics."""
-    results = []
+    """Process a batch of research questions and track metrics.
     
-    # Load existing results if resuming
-    if resume_progress:
-        results_file = f"{output_base_path}/batch_results.json"
-        if os.path.exists(results_file):
-            with open(results_file, 'r', encoding='utf-8') as f:
-                results = json.load(f)
+    Returns result summaries; the optional parameters are described in README.md.
+    """
+    poll_scheduler = poll_scheduler or FixedPollScheduler()
+    # Only summaries are kept in memory; full results live in the journal
+    results = []
+    previous_results = iter_results(output_base_path) if resume_progress else iter([])
+    
+    # Each finished question is appended to an fsync'd JSONL journal instead of
+    # rewriting batch_results.json; the JSON file is compacted from it at the end
+    journal_exists = os.path.exists(os.path.join(output_base_path, JOURNAL_FILENAME))
+    journal = ResultJournal(output_base_path)
+    for previous_result in previous_results:
+        if not journal_exists:
+            # Carry results from a pre-journal batch_results.json over into the journal
+            journal.append(previous_result)
+        results.append(summarize_result(previous_result))
     
     # Summary statistics tracking
     total_start_time = time.time()
     successful_queries = sum(1 for r in results if r.get('status') == 'completed')
     failed_queries = sum(1 for r in results if r.get('status') != 'completed')
     
-    # Filter out already processed questions
+    # Number questions by their position in the input, keeping this node's shard only
+    numbered = select_shard(questions, shard)
+    total = None
+    if isinstance(questions, list):
+        numbered = list(numbered)
+        total = len(numbered)
+    
+    # Filter out already processed questions (set lookup on the normalized question hash)
     if resume_progress:
-        questions = [q for q in questions if q not in resume_progress]
-        if resume_progress:
-            print(f"\nResuming: Skipping {len(resume_progress)} already processed questions")
-    
-    for i, question in enumerate(questions, 1):
-        print(f"\n{'='*60}")
-        print(f"Processing question {i}/{len(questions)} ({(i + len(results))/(len(questions) + len(resume_progress or []))*100:.1f}% complete)")
-        print(f"Successful: {successful_queries}, Failed: {failed_queries}")
-        elapsed = time.time() - total_start_time
-        avg_time = elapsed / (i + len(results)) if (i + len(results)) > 0 else 0
-        estimated_remaining = avg_time * (len(questions) - i)
-        print(f"Elapsed: {elapsed:.1f}s, Est. remaining: {estimated_remaining:.1f}s")
-        print(f"{'='*60}")
-        print(f"Question: {question}")
+        if total is not None:
+            numbered = [(n, q) for n, q in numbered if question_key(q) not in resume_progress]
+            print(f"\nResuming: Skipping {total - len(numbered)} already processed questions")
+            total = len(numbered)
+        else:
+            numbered = ((n, q) for n, q in numbered if question_key(q) not in resume_progress)
+            print("\nResuming: Skipping already processed questions as they are read")
+    
+    previously_processed = len(results)
+    retry_policy = retry_policy or create_retry_policy(total)
+    combined_create = CombinedCreate(create_mode)
+    if batch_deadline:
+        batch_deadline.plan(total, poll_scheduler.expected_duration())
+    incomplete: List[Tuple[int, str]] = []
+    not_started, first_unstarted = 0, None
+    if shutdown:
+        shutdown.on_request(retry_policy.stop)
+    
+    # Result files and journal entries are written on a background thread; the
+    # finally block drains it, so an interrupted batch keeps every finished result
+    result_writer = ResultWriter()
+    remaining = iter(numbered)
+    try:
+        for i, (input_index, question) in enumerate(remaining, 1):
+            if shutdown and shutdown.requested.is_set():
+                # Count the rest of the input rather than holding it in memory
+                not_started, first_unstarted = 1 + count_rest(remaining), input_index
+                break
+            if token_budget and token_budget.admit() != ADMIT:
+                # Unstarted questions are not journaled, so --resume picks them up
+                not_started = 1 + count_rest(remaining)
+                token_budget.skip(not_started - 1)
+                print(f"Stopping before question {i}: {not_started} questions not started, from input question "
+                      f"{input_index} on; rerun with --resume and a larger budget to continue")
+                break
+            question_deadline = None
+            if batch_deadline:
+                timeout = batch_deadline.start()
+                if timeout is None:
+                    not_started = 1 + count_rest(remaining)
+                    batch_deadline.skip(not_started - 1)
+                    print(f"Stopping before question {i}: too little time is left before the batch deadline; "
+                          f"{not_started} questions not started, from input question {input_index} on; "
+                          "rerun with --resume to continue")
+                    break
+                question_deadline = time.monotonic() + timeout
+            print(f"\n{'='*60}")
+            elapsed = time.time() - total_start_time
+            if total is not None:
+                print(f"Processing question {i}/{total} ({(previously_processed + i)/(previously_processed + total)*100:.1f}% complete)")
+                print(f"Successful: {successful_queries}, Failed: {failed_queries}")
+                avg_time = elapsed / (i + len(results)) if (i + len(results)) > 0 else 0
+                estimated_remaining = avg_time * (total - i)
+                print(f"Elapsed: {elapsed:.1f}s, Est. remaining: {estimated_remaining:.1f}s")
+            else:
+                # Streamed input: the number of questions left is not known
+                print(f"Processing question {i}")
+                print(f"Successful: {successful_queries}, Failed: {failed_queries}")
+                print(f"Elapsed: {elapsed:.1f}s")
+            print(f"{'='*60}")
+            print(f"Question: {question}")
+            if question_deadline:
+                print(f"Up to {question_deadline - time.monotonic():.0f}s to meet the batch deadline")
         
-        # Create a new thread for each question to avoid conflicts
-        thread = agents_client.threads.create()
-        thread_id = thread.id
-        print(f"Created new thread for question {i}, ID: {thread_id}")
+            start_time = time.time()
+            phase_timer = PhaseTimer()
+            # Every call the rate-limited client sends for the question, 429 requeues included
+            with count_calls() as calls:
+                attempt, attempts = run_question(
+                    question, i, agents_client, agent_id, poll_scheduler, retry_policy, stream, rate_limiter,
+                    thread_provisioner, combined_create, phase_timer, token_budget, question_deadline
+                )
+            result = attempt_result(question, attempt)
         
-        # Initialize metrics
-        start_time = time.time()
-        time_to_first_token = None
-        response_text = ""
-        citations = []
+            result["metrics"].update({
+                "total_time": time.time() - start_time,
+                "sdk_calls": calls.calls,
+                "attempts": attempts,
+                "failure_class": attempt.failure,
+                "attempt_failures": attempt.failures,
+                "phases": phase_timer.durations,
+            })
+            result["input_index"] = input_index
+            if token_budget:
+                token_budget.settle(result)
+            if batch_deadline:
+                batch_deadline.settle(result)
+            if shutdown and shutdown.requested.is_set() and result['status'] != 'completed':
+                # Interrupted by the shutdown: leave it out of the journal so --resume reruns it
+                incomplete.append((input_index, question))
+                continue
+            results.append(summarize_result(result))
         
-        try:
-            # Create message
-            message = agents_client.messages.create(
-                thread_id=thread_id,
-                role="user",
-                content=question,
-            )
-            
-            # Create and monitor run
-            run = agents_client.runs.create(thread_id=thread_id, agent_id=agent_id)
-            run_id = run.id
-            # Add timeout and heartbeat settings for polling
-            timeout = int(os.getenv("BATCH_TIMEOUT_SECONDS", "300"))  # max seconds to wait per question
-            heartbeat_interval = 10  # seconds between progress logs
-            loop_seconds = 0
-    
-            # Poll for completion
-            while run.status in ("queued", "in_progress"):
-                time.sleep(1)
-                loop_seconds += 1
-                if loop_seconds % heartbeat_interval == 0:
-                    print(f"Still processing question {i}, elapsed {loop_seconds}s")
-                if loop_seconds >= timeout:
-                    print(f"Timeout after {timeout}s for question {i}, aborting run.")
-                    # Cancel the run that timed out
-                    try:
-                        agents_client.runs.cancel(thread_id=thread_id, run_id=run_id)
-                        print(f"Run {run_id} canceled")
-                    except Exception as cancel_error:
-                        print(f"Error canceling run: {str(cancel_error)}")
-                    break
-                # update run status
-                run = agents_client.runs.get(thread_id=thread_id, run_id=run_id)
-                
-                # Get latest response
-                response = agents_client.messages.get_last_message_by_role(
-                    thread_id=thread_id,
-                    role=MessageRole.AGENT,
-                )
-                
-                if response and response.text_messages:
-                    if time_to_first_token is None:
-                        time_to_first_token = time.time() - start_time
-                    response_text = "\n".join(t.text.value for t in response.text_messages)
-                    
-                    # Collect citations
-                    if response.url_citation_annotations:
-                        citations = [
-                            {"title": ann.url_citation.title, "url": ann.url_citation.url}
-                            for ann in response.url_citation_annotations
-                        ]
-                        if citations:
-                            print("\nReferences:")
-                            for j, citation in enumerate(citations, 1):
-                                print(f"{j}. {citation['title']}: {citation['url']}")
-            
-            # Calculate metrics
-            total_time = time.time() - start_time
-            
-            # Get token usage (if available from run)
-            tokens_in = getattr(run.usage, 'prompt_tokens', 0) if hasattr(run, 'usage') else 0
-            tokens_out = getattr(run.usage, 'completion_tokens', 0) if hasattr(run, 'usage') else 0
-            total_tokens = tokens_in + tokens_out
-            
-            # Save individual result with metrics
-            result = {
-                "question": question,
-                "status": run.status,
-                "error": str(run.last_error) if run.status == "failed" else None,
-                "metrics": {
-                    "time_to_first_token": time_to_first_token,
-                    "total_time": total_time,
-                    "tokens_in": tokens_in,
-                    "tokens_out": tokens_out,
-                    "total_tokens": total_tokens,
-                    "response_text": response_text,
-                    "citations": citations
-                }
-            }
-            results.append(result)
-            
             # Update success/failure counts
             if result['status'] == 'completed':
                 successful_queries += 1
             else:
                 failed_queries += 1
-            
+        
             # Save individual markdown file
-            save_markdown_result(result, output_base_path, i + len(resume_progress) if resume_progress else i)
-            
-            # Save progress after each question
-            save_json_results(results, output_base_path)
-            
-        except Exception as e:
-            print(f"Error processing question {i}: {str(e)}")
-            total_time = time.time() - start_time
-            results.append({
-                "question": question,
-                "status": "error",
-                "error": str(e),
-                "metrics": {
-                    "time_to_first_token": None,
-                    "total_time": total_time,
-                    "tokens_in": 0,
-                    "tokens_out": 0,
-                    "total_tokens": 0,
-                    "response_text": "",
-                    "citations": []
-                }
-            })
-            failed_queries += 1
+            if result['status'] != 'error':
+                with phase_timer.phase("render"):
+                    save_markdown_result(result, output_base_path, previously_processed + i, result_writer)
             
-            # Save progress even on error
-            save_json_results(results, output_base_path)
-    
-    # Save final consolidated results
-    save_consolidated_markdown(results, output_base_path)
+            # Checkpoint progress after each question, even on error
+            result_writer.append_journal(journal, result)
+    finally:
+        result_writer.close()
+        journal.close()
+    
+    if retry_policy.retries_used:
+        print(f"Retried {retry_policy.retries_used} transient failures")
+    if token_budget:
+        print(token_budget.summary())
+    if batch_deadline:
+        print(batch_deadline.summary())
+    if shutdown and shutdown.requested.is_set():
+        print_incomplete(incomplete, "Rerun with --resume to finish them", not_started, first_unstarted)
+    
+    # Compact the journal into batch_results.json and save final consolidated results,
+    # streaming the journal rather than holding every answer
+    compact_journal(output_base_path)
+    save_consolidated_markdown(read_journal(os.path.join(output_base_path, JOURNAL_FILENAME)), output_base_path)
     
     return results
 
-def save_markdown_result(result: Dict, base_path: str, index: int):
-    """Save individual research result as markdown."""
+def save_markdown_result(result: Dict, base_path: str, index: int, result_writer: Optional[ResultWriter] = None):
+    """Save individual research result as markdown, written by result_writer's thread when given."""
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     filename = f"{base_path}/research_{index:03d}_{timestamp}.md"
     
-    with open(filename, "w", encoding="utf-8") as f:
+    with io.StringIO() as f:
         f.write("# Research Result\n\n")
         f.write(f"**Generated on:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
         f.write(f"**Question:** {result['question']}\n")
@@ -280,10 +376,22 @@ def save_markdown_result(result: Dict, base_path: str, index: int):
         f.write("## Metrics\n")
         metrics = result['metrics']
         f.write(f"- Time to First Token: {metrics['time_to_first_token']} seconds\n")
+        if metrics.get('inter_token_latency') is not None:
+            f.write(f"- Inter-token Latency: {metrics['inter_token_latency']:.3f} seconds\n")
         f.write(f"- Total Time: {metrics['total_time']} seconds\n")
         f.write(f"- Tokens In: {metrics['tokens_in']}\n")
         f.write(f"- Tokens Out: {metrics['tokens_out']}\n")
-        f.write(f"- Total Tokens: {metrics['total_tokens']}\n\n")
+        f.write(f"- Total Tokens: {metrics['total_tokens']}\n")
+        f.write(f"- SDK Calls: {metrics.get('sdk_calls')}\n")
+        if metrics.get('requeues'):
+            f.write(f"- Requeued After Rate Limit: {metrics['requeues']} times\n")
+        if metrics.get('attempts', 1) > 1:
+            f.write(f"- Attempts: {metrics['attempts']}\n")
+        if metrics.get('attempt_failures'):
+            f.write(f"- Attempt Failures: {'; '.join(metrics['attempt_failures'])}\n")
+        if metrics.get('phases'):
+            f.write("- Phases: " + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in metrics['phases'].items()) + "\n")
+        f.write("\n")
         
         f.write("## Response\n")
         f.write(metrics['response_text'])
@@ -292,16 +400,24 @@ def save_markdown_result(result: Dict, base_path: str, index: int):
             f.write("\n\n## References\n")
             for i, citation in enumerate(metrics['citations'], 1):
                 f.write(f"{i}. [{citation['title']}]({citation['url']})\n")
+        text = f.getvalue()
+    
+    if result_writer is not None:
+        result_writer.write_text(filename, text)
+    else:
+        write_text(filename, text)
 
 def save_json_results(results: List[Dict], base_path: str):
-    """Save consolidated results as JSON."""
-    filename = f"{base_path}/batch_results.json"
-    with open(filename, "w", encoding="utf-8") as f:
-        json.dump(results, f, indent=2)
+    """Save consolidated results as JSON (written atomically)."""
+    write_json_atomic(os.path.join(base_path, RESULTS_FILENAME), results)
 
-def save_consolidated_markdown(results: List[Dict], base_path: str):
-    """Save consolidated results as markdown."""
+def save_consolidated_markdown(results: Iterable[Dict], base_path: str):
+    """Save consolidated results as markdown.
+    
+    results may be a stream (such as read_journal); only their summaries are kept while writing.
+    """
     filename = f"{base_path}/batch_results.md"
+    results = [summarize_result(r) for r in results]
     
     with open(filename, "w", encoding="utf-8") as f:
         f.write("# Batch Research Results\n\n")
@@ -312,15 +428,22 @@ def save_consolidated_markdown(results: List[Dict], base_path: str):
         total_time = sum(r['metrics']['total_time'] or 0 for r in results)
         total_tokens = sum(r['metrics']['total_tokens'] or 0 for r in results)
         success_count = sum(1 for r in results if r['status'] == 'completed')
+        total_sdk_calls = sum(r['metrics'].get('sdk_calls') or 0 for r in results)
         
         f.write("## Summary Statistics\n")
         f.write(f"- Total Processing Time: {total_time:.2f} seconds\n")
         f.write(f"- Total Tokens Used: {total_tokens}\n")
-        f.write(f"- Success Rate: {success_count}/{len(results)} ({success_count/len(results)*100:.1f}%)\n\n")
+        f.write(f"- Total SDK Calls: {total_sdk_calls} ({total_sdk_calls/max(len(results), 1):.1f} per question)\n")
+        f.write(f"- Success Rate: {success_count}/{len(results)} ({success_count/max(len(results), 1)*100:.1f}%)\n")
+        retry_count = sum(r['metrics'].get('attempts', 1) - 1 for r in results)
+        if retry_count:
+            f.write(f"- Retries of Transient Failures: {retry_count}\n")
+        f.write("\n")
+        write_phase_table(f, results)
         
         f.write("## Individual Results\n\n")
         for i, result in enumerate(results, 1):
-            f.write(f"### {i}. {result['question'][:100]}...\n")
+            f.write(f"### {result.get('input_index', i)}. {result['question'][:100]}...\n")
             f.write(f"**Status:** {result['status']}\n")
             if result['error']:
                 f.write(f"**Error:** {result['error']}\n")
@@ -330,22 +453,39 @@ def save_consolidated_markdown(results: List[Dict], base_path: str):
             f.write(f"- Time to First Token: {metrics['time_to_first_token']} seconds\n")
             f.write(f"- Total Time: {metrics['total_time']} seconds\n")
             f.write(f"- Tokens: {metrics['tokens_in']} in, {metrics['tokens_out']} out, {metrics['total_tokens']} total\n")
+            f.write(f"- SDK Calls: {metrics.get('sdk_calls')}\n")
+            if metrics.get('attempts', 1) > 1:
+                f.write(f"- Attempts: {metrics['attempts']}\n")
+            if metrics.get('attempt_failures'):
+                f.write(f"- Attempt Failures: {'; '.join(metrics['attempt_failures'])}\n")
             f.write("\n---\n\n")
 
 def interactive_research_session(
     agents_client: AgentsClient,
     agent_id: str,
     initial_question: str,
-    output_base_path: str
+    output_base_path: str,
+    poll_scheduler: Optional[PollScheduler] = None,
+    stream: bool = False,
+    rate_limiter: Optional[RateLimiter] = None,
+    thread_provisioner: Optional[ThreadProvisioner] = None,
+    shutdown: Optional[GracefulShutdown] = None
 ) -> Dict:
-    """Conduct an interactive research session with multi-turn conversation."""
+    """Conduct an interactive research session with multi-turn conversation.
+    
+    Ends and saves the session as stopped once shutdown is requested, even during a prompt.
+    """
+    def ask(prompt: str) -> str:
+        with shutdown.interruptible() if shutdown else contextlib.nullcontext():
+            return input(prompt)
+    
+    poll_scheduler = poll_scheduler or FixedPollScheduler()
     print(f"\n=== Starting Interactive Research Session ===")
     print(f"Initial Question: {initial_question}")
     
-    # Create a new thread for the conversation
-    thread = agents_client.threads.create()
-    thread_id = thread.id
-    print(f"Created thread ID: {thread_id}")
+    # Use a new thread for the conversation
+    thread_id = new_thread_id(agents_client, thread_provisioner)
+    print(f"Using thread ID: {thread_id}")
     
     conversation_history = []
     all_citations = []  # Initialize citations list
@@ -355,9 +495,13 @@ def interactive_research_session(
     time_to_first_token = None
     total_tokens_in = 0
     total_tokens_out = 0
+    token_gaps = []  # seconds between streamed deltas, across all turns
+    requeues = 0
     
     # Add timeout for interactive sessions
     session_timeout = int(os.getenv("INTERACTIVE_SESSION_TIMEOUT", "1800"))  # 30 minutes default
+    # Timeouts and poll timing run on the monotonic clock; session_start stays wall-clock for TTFT
+    session_deadline = time.monotonic() + session_timeout
     
     # Send initial question
     message = agents_client.messages.create(
@@ -368,37 +512,67 @@ def interactive_research_session(
     conversation_history.append({"role": "user", "content": initial_question})
     
     while True:
+        if shutdown and shutdown.requested.is_set():
+            print("\n[Session stopped by shutdown]")
+            break
+        
         # Check session timeout
-        if time.time() - session_start > session_timeout:
+        if time.monotonic() > session_deadline:
             print(f"\n[Session timeout after {session_timeout} seconds]")
             break
             
+        run = None
         try:
-            # Create and monitor run with timeout
-            run = agents_client.runs.create(thread_id=thread_id, agent_id=agent_id)
-            run_id = run.id
-            
             # Add per-question timeout for interactive mode
             question_timeout = int(os.getenv("INTERACTIVE_QUESTION_TIMEOUT", "300"))
-            question_start = time.time()
+            question_start = time.monotonic()
             
-            # Poll for completion with visual feedback
-            print("\nProcessing", end="", flush=True)
-            while run.status in ("queued", "in_progress"):
-                time.sleep(1)
-                print(".", end="", flush=True)
+            if stream:
+                # Print the response as it is generated instead of polling
+                print("\n--- Agent Response ---")
+                reserved = rate_limiter.estimate_run_tokens() if rate_limiter else None
+                handler = stream_run(agents_client, thread_id, agent_id, session_start, question_timeout)
+                print("--- End Response ---\n")
+                if handler.run is None:
+                    raise RuntimeError(handler.error or "Run stream ended before the run was created")
+                run = handler.run
+                if rate_limiter:
+                    rate_limiter.record_run(run, reserved=reserved)
+                if time_to_first_token is None:
+                    time_to_first_token = handler.time_to_first_token
+                token_gaps.extend(handler.token_gaps)
+            else:
+                # Create and monitor run with timeout
+                run = agents_client.runs.create(thread_id=thread_id, agent_id=agent_id)
+                run_id = run.id
+                question_deadline = question_start + question_timeout
                 
-                # Check question timeout
-                if time.time() - question_start > question_timeout:
-                    print(f"\n[Question timeout after {question_timeout} seconds]")
-                    try:
-                        agents_client.runs.cancel(thread_id=thread_id, run_id=run_id)
-                    except:
-                        pass
-                    break
+                # Poll for completion with visual feedback
+                print("\nProcessing", end="", flush=True)
+                while run.status in ("queued", "in_progress"):
+                    time.sleep(min(poll_scheduler.next_interval(time.monotonic() - question_start),
+                                   max(question_deadline - time.monotonic(), 0)))
+                    print(".", end="", flush=True)
                     
-                run = agents_client.runs.get(thread_id=thread_id, run_id=run_id)
-            print()  # New line after dots
+                    # Check question timeout
+                    if time.monotonic() >= question_deadline:
+                        print(f"\n[Question timeout after {question_timeout} seconds]")
+                        try:
+                            agents_client.runs.cancel(thread_id=thread_id, run_id=run_id)
+                        except:
+                            pass
+                        break
+                        
+                    run = agents_client.runs.get(thread_id=thread_id, run_id=run_id)
+                print()  # New line after dots
+                
+                if run.status == "completed":
+                    poll_scheduler.record(time.monotonic() - question_start)
+            
+            # A shutdown cancels the run; end the session rather than reading its answer
+            if shutdown and shutdown.requested.is_set():
+                print("\n[Session stopped by shutdown]")
+                break
             
             # Update token metrics
             if hasattr(run, 'usage'):
@@ -406,9 +580,12 @@ def interactive_research_session(
                 total_tokens_out += getattr(run.usage, 'completion_tokens', 0)
             
             # Handle run status
+            if rate_limiter is not None and rate_limiter.requeue_throttled_run(run, requeues):
+                requeues += 1
+                continue
             if run.status == "failed":
                 print(f"[Run failed: {run.last_error}]")
-                user_input = input("\nWould you like to retry or exit? (retry/exit): ").strip().lower()
+                user_input = ask("\nWould you like to retry or exit? (retry/exit): ").strip().lower()
                 if user_input == 'exit':
                     break
                 else:
@@ -427,10 +604,11 @@ def interactive_research_session(
                     
                 agent_response = "\n".join(t.text.value for t in response.text_messages)
                 
-                # Display agent's response
-                print("\n--- Agent Response ---")
-                print(agent_response)
-                print("--- End Response ---\n")
+                # Display agent's response (already printed as it streamed)
+                if not stream:
+                    print("\n--- Agent Response ---")
+                    print(agent_response)
+                    print("--- End Response ---\n")
                 
                 conversation_history.append({"role": "agent", "content": agent_response})
                 
@@ -450,7 +628,7 @@ def interactive_research_session(
             if agent_response and is_clarification_needed(agent_response):
                 # Agent is asking for clarification
                 print("\n[The agent appears to be asking for clarification]")
-                user_input = input("\nYour response (or 'exit' to end session): ").strip()
+                user_input = ask("\nYour response (or 'exit' to end session): ").strip()
                 
                 if user_input.lower() == 'exit':
                     print("Ending interactive session...")
@@ -470,13 +648,13 @@ def interactive_research_session(
                 conversation_history.append({"role": "user", "content": user_input})
             else:
                 # Research appears complete, ask if user needs more
-                user_input = input("\nDo you need further clarification or have follow-up questions? (yes/no/exit): ").strip().lower()
+                user_input = ask("\nDo you need further clarification or have follow-up questions? (yes/no/exit): ").strip().lower()
                 
                 if user_input in ['no', 'exit']:
                     print("Research session complete.")
                     break
                 elif user_input == 'yes':
-                    follow_up = input("Please enter your follow-up question: ").strip()
+                    follow_up = ask("Please enter your follow-up question: ").strip()
                     if not follow_up:
                         print("Empty question not allowed. Please provide a question.")
                         continue
@@ -489,11 +667,23 @@ def interactive_research_session(
                     conversation_history.append({"role": "user", "content": follow_up})
             
                 
+        except ShutdownRequested:
+            print("\n[Session stopped by shutdown]")
+            break
         except Exception as e:
             print(f"Error during conversation: {str(e)}")
-            user_input = input("\nWould you like to continue or exit? (continue/exit): ").strip().lower()
+            if shutdown and shutdown.requested.is_set():
+                break
+            try:
+                user_input = ask("\nWould you like to continue or exit? (continue/exit): ").strip().lower()
+            except ShutdownRequested:
+                print("\n[Session stopped by shutdown]")
+                break
             if user_input == 'exit':
                 break
+        finally:
+            if rate_limiter:
+                rate_limiter.release_run(run)
     
     
     # Compile final response text
@@ -510,7 +700,7 @@ def interactive_research_session(
     result = {
         "question": initial_question,
         "conversation_history": conversation_history,
-        "status": "completed",
+        "status": "stopped" if shutdown and shutdown.requested.is_set() else "completed",
         "error": None,
         "metrics": {
             "time_to_first_token": time_to_first_token,
@@ -518,6 +708,7 @@ def interactive_research_session(
             "tokens_in": total_tokens_in,
             "tokens_out": total_tokens_out,
             "total_tokens": total_tokens,
+            "inter_token_latency": sum(token_gaps) / len(token_gaps) if token_gaps else None,
             "citations": all_citations
         }
     }
@@ -546,6 +737,8 @@ def save_interactive_session(result: Dict, base_path: str):
         f.write("## Metrics\n")
         metrics = result['metrics']
         f.write(f"- Time to First Token: {metrics['time_to_first_token']} seconds\n")
+        if metrics.get('inter_token_latency') is not None:
+            f.write(f"- Inter-token Latency: {metrics['inter_token_latency']:.3f} seconds\n")
         f.write(f"- Total Time: {metrics['total_time']} seconds\n")
         f.write(f"- Tokens In: {metrics['tokens_in']}\n")
         f.write(f"- Tokens Out: {metrics['tokens_out']}\n")
@@ -563,8 +756,42 @@ def save_interactive_session(result: Dict, base_path: str):
     
     print(f"\nSession saved to:\n- {md_filename}\n- {json_filename}")
 
+def merge_main(argv: List[str]):
+    """Merge the output directories of a sharded batch into one set of results."""
+    parser = argparse.ArgumentParser(prog="chat_research.py merge",
+                                     description="Merge the results of shards run with --shard")
+    parser.add_argument("shard_dirs", nargs="+", help="Output directory of each shard")
+    parser.add_argument("--output", type=str, help="Directory for the merged results (default: merged_results_<timestamp>)")
+    args = parser.parse_args(argv)
+    
+    output_dir = args.output or f"merged_results_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    os.makedirs(output_dir, exist_ok=True)
+    merge_shard_results(args.shard_dirs, output_dir)
+    compact_journal(output_dir)
+    save_consolidated_markdown(read_journal(os.path.join(output_dir, JOURNAL_FILENAME)), output_dir)
+    print(f"Merged results saved in {output_dir}/")
+
+def print_connection_help(project_client: AIProjectClient, connection_name: str, error: Exception):
+    """Explain a failed startup, listing the project's connections to help spot a wrong connection name."""
+    print(f"Error setting up the agent with Bing connection '{connection_name}': {str(error)}")
+    try:
+        print("Available connections:")
+        for conn in project_client.connections.list():
+            print(f"  - {conn.name} (Type: {conn.properties.get('category', 'Unknown')})")
+    except Exception as list_error:
+        print(f"Could not list connections: {list_error}")
+    print("\nPossible solutions:")
+    print("1. Verify the connection name matches exactly in Azure AI Studio")
+    print("2. Check if the connection exists in your Azure AI Project")
+    print("3. Ensure your credentials have access to the connection")
+    print("4. Try using the connection ID directly if you have it")
+
+
 def main():
     """Main function to process batch research questions or run interactive mode."""
+    if sys.argv[1:2] == ["merge"]:
+        merge_main(sys.argv[2:])
+        return
     try:
         # Validate environment first
         validate_environment()
@@ -577,48 +804,41 @@ def main():
                           help="Input file for batch mode")
         parser.add_argument("--resume", action="store_true", 
                            help="Resume from previous batch run if interrupted")
+        parser.add_argument("--poll-mode", choices=["adaptive", "fixed"], default=os.getenv("POLL_MODE", "adaptive"),
+                           help="Poll run status adaptively from past run durations (default) or at a fixed interval")
+        parser.add_argument("--stream", action="store_true",
+                           help="Stream run events instead of polling (prints output live, reports real time to first token)")
+        parser.add_argument("--create-mode", choices=CREATE_MODES, default=os.getenv("RUN_CREATE_MODE", "separate"),
+                           help="Batch mode: start each question with separate thread, message and run calls "
+                                "(separate, default) or with one create_thread_and_run call (combined)")
+        parser.add_argument("--shard", type=parse_shard,
+                           help="Batch mode: run only shard i of N (e.g. 2/4), a stable hash partition of the questions")
+        parser.add_argument("--max-total-tokens", type=int,
+                           default=int(os.environ["MAX_TOTAL_TOKENS"]) if os.getenv("MAX_TOTAL_TOKENS") else None,
+                           help="Batch mode: stop before the projected spend exceeds this many tokens")
+        parser.add_argument("--max-tokens-per-question", type=int,
+                           default=int(os.environ["MAX_TOKENS_PER_QUESTION"]) if os.getenv("MAX_TOKENS_PER_QUESTION") else None,
+                           help="Batch mode: cancel a run once it reports more than this many tokens")
+        parser.add_argument("--deadline", default=os.getenv("BATCH_DEADLINE"),
+                           help="Batch mode: finish by this time (seconds, a duration like 1h30m, HH:MM or an ISO time); "
+                                "each question gets a share of the time left as its timeout")
         
         args = parser.parse_args()
+        # The deadline is counted from now, so agent setup comes out of the batch's time
+        batch_deadline = create_batch_deadline(args.deadline) if args.mode == "batch" else None
         
-        # Initialize Azure clients - Use the correct environment variable
+        # Initialize Azure clients; all of them share one token per scope
+        endpoint = os.environ["PROJECT_ENDPOINT_RELX_LEGAL"]
+        credential = SharedTokenCredential(DefaultAzureCredential())
         project_client = AIProjectClient(
-            endpoint=os.environ["PROJECT_ENDPOINT_RELX_LEGAL"],
-            credential=DefaultAzureCredential(),
+            endpoint=endpoint,
+            credential=credential,
         )
-        
-        # Get Bing connection with better error handling
-        try:
-            bing_connection_name = os.environ["BING_CONNECTED_RESOURCE_NAME"]
-            print(f"Attempting to get Bing connection: {bing_connection_name}")
-            
-            # List available connections for debugging
-            try:
-                connections = project_client.connections.list()
-                print("Available connections:")
-                for conn in connections:
-                    print(f"  - {conn.name} (Type: {conn.properties.get('category', 'Unknown')})")
-            except Exception as list_error:
-                print(f"Could not list connections: {list_error}")
-            
-            conn_id = project_client.connections.get(name=bing_connection_name).id
-            print(f"Successfully retrieved connection ID: {conn_id}")
-            
-        except KeyError:
+        # Bing connection ids are cached on disk (CONNECTION_CACHE_FILE / CONNECTION_CACHE_TTL_SECONDS)
+        connection_cache = create_connection_cache(endpoint)
+        if "BING_CONNECTED_RESOURCE_NAME" not in os.environ:
             raise ValueError("BING_CONNECTED_RESOURCE_NAME environment variable is not set")
-        except Exception as e:
-            print(f"Error getting Bing connection '{bing_connection_name}': {str(e)}")
-            print("\nPossible solutions:")
-            print("1. Verify the connection name matches exactly in Azure AI Studio")
-            print("2. Check if the connection exists in your Azure AI Project")
-            print("3. Ensure your credentials have access to the connection")
-            print("4. Try using the connection ID directly if you have it")
-            raise
-        
-        # Initialize Deep Research tool
-        deep_research_tool = DeepResearchTool(
-            bing_grounding_connection_id=conn_id,
-            deep_research_model=os.environ["DEEP_RESEARCH_MODEL_DEPLOYMENT_NAME"],
-        )
+        bing_connection_name = os.environ["BING_CONNECTED_RESOURCE_NAME"]
         
         # Create output directory
         if args.mode == "batch" and args.resume:
@@ -640,8 +860,15 @@ def main():
             output_dir = f"research_results_{timestamp}"
             os.makedirs(output_dir, exist_ok=True)
         
+        # SIGINT/SIGTERM cancel the run in flight and stop the batch or session cleanly instead of killing it
+        shutdown = create_graceful_shutdown()
+        
         with project_client:
             with project_client.agents as agents_client:
+                # Every Agents call made by this session is paced by one shared dispatcher
+                rate_limiter = create_rate_limiter()
+                agents_client = rate_limiter.wrap(agents_client)
+                
                 # Create agent with updated instructions for interactive mode
                 instructions = (
                     "You are a helpful research assistant that conducts thorough research on topics. "
@@ -651,14 +878,47 @@ def main():
                     else "You are a helpful Agent that assists in researching topics. You will be provided a question to answer that you must do your best to answer without asking for clarity. Just answer it."
                 )
                 
-                agent = agents_client.create_agent(
-                    model=os.environ["MODEL_DEPLOYMENT_NAME"],
-                    name=f"{args.mode}-research-agent",
-                    instructions=instructions,
-                    tools=deep_research_tool.definitions,
-                )
-                print(f"Created agent, ID: {agent.id}")
+                agent_registry = create_agent_registry()
+                
+                def setup_agent(conn_id: str):
+                    # Reuse the registered agent for this model, instructions and tools
+                    # (AGENT_REGISTRY_FILE); a new one is only created when they change
+                    deep_research_tool = DeepResearchTool(
+                        bing_grounding_connection_id=conn_id,
+                        deep_research_model=os.environ["DEEP_RESEARCH_MODEL_DEPLOYMENT_NAME"],
+                    )
+                    return get_or_create_agent(
+                        agents_client,
+                        agent_registry,
+                        model=os.environ["MODEL_DEPLOYMENT_NAME"],
+                        name=f"{args.mode}-research-agent",
+                        instructions=instructions,
+                        tools=deep_research_tool.definitions,
+                    )
+                
+                # The token is fetched while the connection is resolved and the agent looked up
+                try:
+                    preflight = run_preflight({
+                        "credential": lambda: credential.get_token(PROJECT_SCOPE),
+                        "agent": lambda: with_connection(connection_cache, project_client, bing_connection_name, setup_agent),
+                    })
+                except Exception as e:
+                    print_connection_help(project_client, bing_connection_name, e)
+                    raise
+                agent, owns_agent = preflight["agent"]
                 
+                # Threads are pre-created in the background (PREWARM_THREADS) so no
+                # question waits on threads.create; batch questions only need them by
+                # default when not using create_thread_and_run. An interactive session
+                # uses one thread, created while the user types the first question
+                if args.mode == "interactive":
+                    thread_provisioner = None if args.question else create_thread_provisioner(
+                        agents_client, default_size=1, limit=1)
+                else:
+                    thread_provisioner = create_thread_provisioner(
+                        agents_client,
+                        default_size=2 if args.create_mode == "separate" or args.stream else 0
+                    )
                 try:
                     if args.mode == "interactive":
                         # Interactive mode
@@ -670,38 +930,68 @@ def main():
                         else:
                             initial_question = args.question
                         
-                        result = interactive_research_session(
-                            agents_client=agents_client,
-                            agent_id=agent.id,
-                            initial_question=initial_question,
-                            output_base_path=output_dir
-                        )
+                        with shutdown:
+                            result = interactive_research_session(
+                                agents_client=shutdown.wrap(agents_client),
+                                agent_id=agent.id,
+                                initial_question=initial_question,
+                                output_base_path=output_dir,
+                                poll_scheduler=create_poll_scheduler(args.poll_mode, key="interactive_research"),
+                                stream=args.stream,
+                                rate_limiter=rate_limiter,
+                                thread_provisioner=thread_provisioner,
+                                shutdown=shutdown
+                            )
                     else:
                         # Batch mode
-                        questions = read_questions(args.file)
-                        print(f"Loaded {len(questions)} questions from {args.file}")
+                        # Questions are streamed from the input file as they are processed
+                        questions = iter_questions(args.file)
+                        print(f"Reading questions from {args.file}")
+                        if batch_deadline:
+                            # Sharing the time left needs the number of questions, so the input is read up front
+                            questions = list(questions)
+                        if args.shard:
+                            write_shard_manifest(output_dir, args.shard, args.file)
+                            print(f"Running shard {args.shard}")
                         
                         # Check for resume
-                        resume_progress = []
+                        resume_progress = set()
                         if args.resume:
                             resume_progress = load_progress(output_dir)
                             if resume_progress:
                                 print(f"Found {len(resume_progress)} already processed questions")
                         
-                        results = process_batch_research(
-                            questions=questions,
-                            agents_client=agents_client,
-                            agent_id=agent.id,
-                            output_base_path=output_dir,
-                            resume_progress=resume_progress
-                        )
+                        with shutdown:
+                            results = process_batch_research(
+                                questions=questions,
+                                agents_client=shutdown.wrap(agents_client),
+                                agent_id=agent.id,
+                                output_base_path=output_dir,
+                                resume_progress=resume_progress,
+                                poll_scheduler=create_poll_scheduler(args.poll_mode, key="batch_research"),
+                                stream=args.stream,
+                                rate_limiter=rate_limiter,
+                                shard=args.shard,
+                                thread_provisioner=thread_provisioner,
+                                create_mode=args.create_mode,
+                                token_budget=create_token_budget(args.max_total_tokens, args.max_tokens_per_question),
+                                shutdown=shutdown,
+                                batch_deadline=batch_deadline
+                            )
                     
-                    print(f"\nProcessing complete. Results saved in {output_dir}/")
+                    status = "stopped" if shutdown.requested.is_set() else "complete"
+                    print(f"\nProcessing {status}. Results saved in {output_dir}/")
                     
                 finally:
                     # Cleanup
-                    agents_client.delete_agent(agent.id)
-                    print("Agent cleaned up")
+                    if thread_provisioner:
+                        thread_provisioner.close()
+                    if owns_agent:
+                        agents_client.delete_agent(agent.id)
+                        print("Agent cleaned up")
+        
+        if shutdown.requested.is_set():
+            sys.exit(shutdown.exit_code)
         
     except FileNotFoundError as e:
         print(f"File error: {str(e)}")
@@ -337,7 +337,9 @@ You will be provided a question to answer that you must do your best to answer w
             # Add timeout and heartbeat settings for polling
             timeout = timeout_seconds or int(os.getenv("CHAT_TIMEOUT_SECONDS", "600"))  # increased default timeout to 600 seconds
             heartbeat_interval = 5  # seconds between progress logs
-            loop_seconds = 0
+            # Measured on the monotonic clock so slow runs.get calls count towards the timeout
+            started = time.monotonic()
+            next_heartbeat = heartbeat_interval
             
             response_text = ""
             citations = []
@@ -345,12 +347,13 @@ You will be provided a question to answer that you must do your best to answer w
             # Poll for completion
             while run.status in ("queued", "in_progress"):
                 await asyncio.sleep(1)  # Use asyncio.sleep for async waiting
-                loop_seconds += 1
+                elapsed = time.monotonic() - started
                 
-                if loop_seconds % heartbeat_interval == 0:
-                    print(f"Still processing message in session {session_id}, elapsed {loop_seconds}s")
+                if elapsed >= next_heartbeat:
+                    print(f"Still processing message in session {session_id}, elapsed {elapsed:.0f}s")
+                    next_heartbeat += heartbeat_interval
                 
-                if loop_seconds >= timeout:
+                if elapsed >= timeout:
                     print(f"Timeout after {timeout}s for message ('{message[:50]}...'), aborting run.")
                     try:
                         self.agents_client.runs.cancel(thread_id=thread_id, run_id=run_id)
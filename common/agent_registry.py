@@ -0,0 +1,186 @@
+import os
+import json
+import hashlib
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from azure.core.exceptions import ResourceNotFoundError
+
+REGISTRY_VERSION = 1
+
+
+def agent_fingerprint(model: str, instructions: str, tools: List[Any]) -> str:
+    """Stable hash of the settings that make two agents interchangeable.
+
+    Tool definitions are compared by their serialized form, so a change of
+    deep research model or Bing connection yields a new fingerprint. The
+    agent's name is not part of it.
+    """
+    config = {
+        "model": model,
+        "instructions": instructions,
+        "tools": [tool.as_dict() if hasattr(tool, "as_dict") else tool for tool in tools or []],
+    }
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class AgentRegistry:
+    """Agent ids persisted in a JSON file, keyed by agent_fingerprint.
+
+    The file is re-read before each write and replaced atomically, so runners
+    launched side by side keep each other's entries.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._agents = self._load().get("agents", {})
+
+    def _load(self) -> Dict:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"Could not load agent registry {self.path}: {e}")
+            return {}
+
+    def _update(self, change: Callable[[Dict], None]):
+        """Apply change to whatever the file holds now and write it back."""
+        with self._lock:
+            data = self._load()
+            data.setdefault("agents", {})
+            change(data)
+            data["version"] = REGISTRY_VERSION
+            self._agents = data["agents"]
+            tmp_file = f"{self.path}.tmp"
+            try:
+                with open(tmp_file, "w", encoding="utf-8") as f:
+                    json.dump(data, f, indent=2)
+                os.replace(tmp_file, self.path)
+            except Exception as e:
+                print(f"Could not save agent registry {self.path}: {e}")
+
+    def _save(self, fingerprint: str, entry: Optional[Dict]):
+        """Write one entry (None removes it) on top of whatever the file holds now."""
+        def change(data: Dict):
+            if entry is None:
+                data["agents"].pop(fingerprint, None)
+            else:
+                data["agents"][fingerprint] = entry
+        self._update(change)
+
+    def lookup(self, fingerprint: str) -> Optional[str]:
+        """Registered agent id for fingerprint, or None."""
+        entry = self._agents.get(fingerprint)
+        return entry["agent_id"] if entry else None
+
+    def record(self, fingerprint: str, agent_id: str, name: str, model: str):
+        self._save(fingerprint, {
+            "agent_id": agent_id,
+            "name": name,
+            "model": model,
+            "created_at": datetime.now().isoformat(),
+        })
+
+    def forget(self, fingerprint: str):
+        self._save(fingerprint, None)
+
+    def migrate(self, config_path: str, fingerprint: str):
+        """Register the agent in an older runner's single-agent config file under fingerprint.
+
+        That agent was created for the runner's configuration at the time,
+        which is taken to be the current one. Each file is read once: its
+        path is recorded in the registry, so a later configuration change
+        does not adopt the old agent again. The file itself is left in
+        place for runners that still use it.
+        """
+        if not os.path.exists(config_path) or config_path in self._load().get("migrated", []):
+            return
+        try:
+            with open(config_path, "r", encoding="utf-8") as f:
+                config = json.load(f)
+        except Exception as e:
+            print(f"Could not read agent config {config_path}: {e}")
+            return
+
+        def change(data: Dict):
+            data["migrated"] = data.get("migrated", []) + [config_path]
+            if config.get("agent_id") and fingerprint not in data["agents"]:
+                data["agents"][fingerprint] = {
+                    "agent_id": config["agent_id"],
+                    "name": config.get("name"),
+                    "model": config.get("model"),
+                    "created_at": config.get("created_at") or datetime.now().isoformat(),
+                }
+                print(f"Registered agent {config['agent_id']} from {config_path} in {self.path}")
+        self._update(change)
+
+    def get_or_create(
+        self,
+        agents_client: Any,
+        model: str,
+        name: str,
+        instructions: str,
+        tools: List[Any],
+        legacy_config: Optional[str] = None
+    ) -> Tuple[Any, bool]:
+        """Return the agent registered for this configuration, creating and registering one if needed.
+
+        The registered agent is fetched with get_agent to make sure it still
+        exists; one deleted on the service (404) is replaced, while any
+        other error is raised. legacy_config is migrated first (see
+        migrate). Returns the agent and whether it was created.
+        """
+        fingerprint = agent_fingerprint(model, instructions, tools)
+        if legacy_config:
+            self.migrate(legacy_config, fingerprint)
+        agent_id = self.lookup(fingerprint)
+        if agent_id:
+            try:
+                agent = agents_client.get_agent(agent_id)
+                print(f"Reusing agent {agent_id} ({name}) from {self.path}")
+                return agent, False
+            except ResourceNotFoundError as e:
+                print(f"Registered agent {agent_id} no longer exists ({str(e)}); creating a new one")
+                self.forget(fingerprint)
+        agent = agents_client.create_agent(model=model, name=name, instructions=instructions, tools=tools)
+        self.record(fingerprint, agent.id, name, model)
+        print(f"Created agent {agent.id} ({name}) and registered it in {self.path}")
+        return agent, True
+
+
+def create_agent_registry(default_path: str = "agent_registry.json") -> Optional[AgentRegistry]:
+    """Build the registry stored in AGENT_REGISTRY_FILE (default: default_path).
+
+    An empty AGENT_REGISTRY_FILE disables it: callers then create an agent
+    per launch and delete it on exit, as before.
+    """
+    path = os.getenv("AGENT_REGISTRY_FILE", default_path)
+    return AgentRegistry(path) if path else None
+
+
+def get_or_create_agent(
+    agents_client: Any,
+    registry: Optional[AgentRegistry],
+    model: str,
+    name: str,
+    instructions: str,
+    tools: List[Any],
+    legacy_config: Optional[str] = None
+) -> Tuple[Any, bool]:
+    """Get the agent for this configuration from registry, or create one when there is no registry.
+
+    legacy_config is an older single-agent config file to seed the registry
+    from (see AgentRegistry.migrate). Returns the agent and whether the
+    caller owns it: an agent created without a registry should be deleted
+    when the caller is done with it.
+    """
+    if registry is None:
+        agent = agents_client.create_agent(model=model, name=name, instructions=instructions, tools=tools)
+        print(f"Created agent, ID: {agent.id}")
+        return agent, True
+    agent, _ = registry.get_or_create(agents_client, model, name, instructions, tools, legacy_config)
+    return agent, False
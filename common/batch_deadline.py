@@ -0,0 +1,137 @@
+import os
+import re
+import time
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+DEADLINE_REACHED = "Not started: not enough time was left before the batch deadline"
+
+_DURATION = re.compile(r"^(?:(\d+(?:\.\d+)?)h)?(?:(\d+(?:\.\d+)?)m)?(?:(\d+(?:\.\d+)?)s?)?$")
+
+
+def parse_deadline(value: str, now: Optional[datetime] = None) -> float:
+    """Seconds from now until a deadline given as a duration or a local time.
+
+    A duration is a number of seconds or combines hours, minutes and seconds
+    ("5400", "90m", "1h30m"). A time is "HH:MM" (the next time the clock
+    shows it) or an ISO date and time ("2025-06-30T18:00").
+    """
+    value = value.strip()
+    now = now or datetime.now()
+    match = _DURATION.match(value)
+    if value and match and any(match.groups()):
+        hours, minutes, seconds = (float(g) if g else 0.0 for g in match.groups())
+        return hours * 3600 + minutes * 60 + seconds
+    try:
+        if re.match(r"^\d{1,2}:\d{2}$", value):
+            hour, minute = (int(part) for part in value.split(":"))
+            target = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+            if target <= now:
+                target += timedelta(days=1)
+        else:
+            target = datetime.fromisoformat(value)
+            if target.tzinfo is not None:
+                now = now.astimezone(target.tzinfo)
+    except ValueError:
+        raise ValueError(f"Invalid deadline '{value}': expected seconds, a duration like 1h30m, HH:MM or an ISO time")
+    return (target - now).total_seconds()
+
+
+class BatchDeadline:
+    """Shares the time left before a whole-batch deadline among the questions left.
+
+    Each question asks for its timeout with start() as it begins; None means
+    too little time is left to start it. No timeout exceeds max_timeout.
+    """
+
+    def __init__(
+        self,
+        seconds: float,
+        max_timeout: float,
+        concurrency: int = 1,
+        min_question_seconds: float = 60.0,
+        headroom: float = 1.5
+    ):
+        self.end = time.monotonic() + seconds
+        self.max_timeout = max_timeout
+        self.concurrency = max(concurrency, 1)
+        self.min_question_seconds = min_question_seconds
+        self.headroom = headroom
+        self.total: Optional[int] = None
+        self.expected_seconds: Optional[float] = None
+        self.finished = 0
+        self.skipped = 0
+        self.completed = 0
+        self.completed_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def plan(self, total: Optional[int], expected_seconds: Optional[float] = None):
+        """Set how many questions share the time (None when unknown) and how long one is expected to take."""
+        self.total = total
+        self.expected_seconds = expected_seconds
+
+    def remaining(self) -> float:
+        """Seconds left before the deadline, never negative."""
+        return max(self.end - time.monotonic(), 0.0)
+
+    def needed_seconds(self) -> float:
+        """The least time worth giving a question: headroom times its typical duration, at least min_question_seconds."""
+        with self._lock:
+            typical = self.completed_seconds / self.completed if self.completed else self.expected_seconds or 0.0
+        return max(typical * self.headroom, self.min_question_seconds)
+
+    def start(self) -> Optional[float]:
+        """Timeout in seconds for a question starting now, or None when it should not be started."""
+        needed = min(self.needed_seconds(), self.max_timeout)
+        left = self.remaining()
+        with self._lock:
+            if left < needed:
+                self.skipped += 1
+                return None
+            share = left
+            if self.total is not None:
+                unfinished = max(self.total - self.finished - self.skipped, 1)
+                share = left * self.concurrency / unfinished
+            return min(self.max_timeout, left, max(share, needed))
+
+    def skip(self, count: int):
+        """Record count more questions left unstarted without asking start(), as when a batch stops early."""
+        with self._lock:
+            self.skipped += count
+
+    def settle(self, result: Dict):
+        """Record a finished question; only runs completed in this batch count towards the mean."""
+        metrics = result["metrics"]
+        with self._lock:
+            self.finished += 1
+            if (result["status"] == "completed" and metrics.get("total_time")
+                    and not metrics.get("cache_hit") and not metrics.get("duplicate_of")):
+                self.completed += 1
+                self.completed_seconds += metrics["total_time"]
+
+    def summary(self) -> str:
+        overrun = time.monotonic() - self.end
+        ending = f"{overrun:.0f}s after" if overrun > 0 else f"{-overrun:.0f}s before"
+        return f"Batch deadline: finished {ending} the deadline; {self.skipped} questions not started"
+
+
+def create_batch_deadline(value: Optional[str], concurrency: int = 1) -> Optional[BatchDeadline]:
+    """Build a BatchDeadline from a --deadline value, or None when no deadline is set.
+
+    Timeouts are capped at BATCH_TIMEOUT_SECONDS (default 300), and no
+    question is started with less than DEADLINE_MIN_QUESTION_SECONDS
+    (default 60) left.
+    """
+    if not value:
+        return None
+    seconds = parse_deadline(value)
+    if seconds <= 0:
+        raise ValueError(f"Deadline '{value}' has already passed")
+    print(f"Batch deadline in {seconds:.0f}s")
+    return BatchDeadline(
+        seconds,
+        max_timeout=float(os.getenv("BATCH_TIMEOUT_SECONDS", "300")),
+        concurrency=concurrency,
+        min_question_seconds=float(os.getenv("DEADLINE_MIN_QUESTION_SECONDS", "60")),
+    )
@@ -0,0 +1,149 @@
+import os
+import json
+import time
+import threading
+import concurrent.futures
+from typing import Any, Callable, Dict, Iterable, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class ConnectionCache:
+    """Project connection ids resolved by name, persisted in a JSON file for ttl_seconds.
+
+    Callers check ids served from the cache with revalidate() while they set
+    up, and call invalidate() when a cached id is rejected.
+    """
+
+    def __init__(self, path: Optional[str], endpoint: str, ttl_seconds: float = 86400.0):
+        self.path = path
+        self.endpoint = endpoint
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._name_locks: Dict[str, threading.Lock] = {}
+        self._hits: Dict[str, bool] = {}
+        self._entries = self._load()
+
+    def _key(self, name: str) -> str:
+        return f"{self.endpoint}|{name}"
+
+    def _load(self) -> Dict:
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f).get("connections", {})
+        except Exception as e:
+            print(f"Could not load connection cache {self.path}: {e}")
+            return {}
+
+    def _save(self, key: str, entry: Optional[Dict]):
+        """Write one entry (None removes it) on top of whatever the file holds now."""
+        with self._lock:
+            entries = self._load()
+            if entry is None:
+                entries.pop(key, None)
+            else:
+                entries[key] = entry
+            self._entries = entries
+            if not self.path:
+                return
+            tmp_file = f"{self.path}.tmp"
+            try:
+                with open(tmp_file, "w", encoding="utf-8") as f:
+                    json.dump({"connections": entries}, f, indent=2)
+                os.replace(tmp_file, self.path)
+            except Exception as e:
+                print(f"Could not save connection cache {self.path}: {e}")
+
+    def lookup(self, name: str) -> Optional[str]:
+        """Cached id for name when it is still fresh, or None."""
+        entry = self._entries.get(self._key(name))
+        if entry and time.time() - entry["resolved_at"] < self.ttl_seconds:
+            return entry["id"]
+        return None
+
+    def resolve(self, project_client: Any, name: str, refresh: bool = False) -> str:
+        """Id of the connection called name, from the cache unless refresh is set."""
+        with self._lock:
+            name_lock = self._name_locks.setdefault(name, threading.Lock())
+        with name_lock:
+            connection_id = None if refresh else self.lookup(name)
+            self._hits[name] = connection_id is not None
+            if connection_id is None:
+                connection_id = project_client.connections.get(name=name).id
+                self._save(self._key(name), {"id": connection_id, "resolved_at": time.time()})
+            return connection_id
+
+    def was_cached(self, name: str) -> bool:
+        """Whether the last resolve of name was served from the cache."""
+        return self._hits.get(name, False)
+
+    def invalidate(self, name: str):
+        """Drop the entry for name after its id was found not to work."""
+        self._hits.pop(name, None)
+        self._save(self._key(name), None)
+
+    def revalidate(self, project_client: Any, names: Iterable[str]) -> Dict[str, str]:
+        """Resolve the names last served from the cache again, concurrently.
+
+        Returns the current id of each name whose cached id is out of date.
+        A name that cannot be resolved keeps its cached id.
+        """
+        cached = {name: self.lookup(name) for name in names if self.was_cached(name)}
+        if not cached:
+            return {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(cached)) as executor:
+            futures = {name: executor.submit(self.resolve, project_client, name, True) for name in cached}
+        changed = {}
+        for name, future in futures.items():
+            try:
+                connection_id = future.result()
+            except Exception as e:
+                print(f"Could not check the cached id of connection '{name}': {str(e)}")
+                continue
+            if connection_id != cached[name]:
+                print(f"Connection '{name}' was recreated; its cached id is out of date")
+                changed[name] = connection_id
+        return changed
+
+
+def with_connection(cache: ConnectionCache, project_client: Any, name: str, setup: Callable[[str], T]) -> T:
+    """Call setup with the id of the connection called name and return its result.
+
+    An id served from the cache is checked with one connections.get call
+    while setup runs, so the check adds no time unless the id is out of
+    date. Setup is then called once more with the current id. A setup that
+    fails on an id that is still current raises.
+    """
+    connection_id = cache.resolve(project_client, name)
+    if not cache.was_cached(name):
+        return setup(connection_id)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        check = executor.submit(cache.revalidate, project_client, [name])
+        try:
+            result, error = setup(connection_id), None
+        except Exception as e:
+            result, error = None, e
+        changed = check.result()
+    if name not in changed:
+        if error is not None:
+            raise error
+        return result
+    if error is not None:
+        print(f"Setup failed with the cached id of connection '{name}' ({str(error)})")
+    return setup(changed[name])
+
+
+def create_connection_cache(endpoint: str, default_path: str = "connection_cache.json") -> ConnectionCache:
+    """Build the cache stored in CONNECTION_CACHE_FILE (default: default_path).
+
+    Entries stay valid for CONNECTION_CACHE_TTL_SECONDS (default 86400, one
+    day). An empty CONNECTION_CACHE_FILE or a TTL of 0 resolves every
+    connection on each launch.
+    """
+    return ConnectionCache(
+        path=os.getenv("CONNECTION_CACHE_FILE", default_path) or None,
+        endpoint=endpoint,
+        ttl_seconds=float(os.getenv("CONNECTION_CACHE_TTL_SECONDS", "86400")),
+    )
@@ -0,0 +1,308 @@
+import os
+import time
+import signal
+import asyncio
+import inspect
+import contextlib
+import weakref
+import threading
+import concurrent.futures
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from rate_limiter import OPERATION_GROUPS
+
+# Calls that start a run; refused once shutdown has been requested
+RUN_STARTING_CALLS = ("runs.create", "runs.stream", "create_thread_and_run")
+ACTIVE_RUN_STATUSES = ("queued", "in_progress", "requires_action")
+SHUTDOWN_SIGNALS = (signal.SIGINT, signal.SIGTERM)
+
+
+class ShutdownRequested(Exception):
+    """Raised by a wrapped client instead of starting (or, after the grace period, polling) a run."""
+
+
+class GracefulShutdown:
+    """Stops a batch cleanly on SIGINT or SIGTERM.
+
+    Clients wrapped with wrap() or wrap_async() record their runs so the
+    first signal can cancel them; runners check requested to stop
+    dispatching. A second signal raises KeyboardInterrupt.
+    """
+
+    def __init__(self, grace_seconds: float = 30.0):
+        self.grace_seconds = grace_seconds
+        self.requested = threading.Event()
+        self.signal_number: Optional[int] = None
+        self.cancelled = 0
+        self._deadline: Optional[float] = None
+        self._callbacks: List[Callable[[], None]] = []
+        self._runs: Dict[str, str] = {}
+        self._streams: "weakref.WeakSet" = weakref.WeakSet()
+        self._client: Any = None
+        self._is_async = False
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._cancel_task: Optional[asyncio.Task] = None
+        self._previous_handlers: Dict[int, Any] = {}
+        self._chain = False
+        self._interruptible = False
+        self._lock = threading.Lock()
+
+    def install(self, chain: bool = False) -> "GracefulShutdown":
+        """Handle SIGINT and SIGTERM until uninstall(); signals can only be handled on the main thread.
+
+        With chain, for a module loaded into a host application that must
+        still exit on the signal, a signal cancels the in-flight runs (waiting
+        at most grace_seconds) and is then passed to the handler installed before.
+        """
+        if threading.current_thread() is not threading.main_thread():
+            print("Graceful shutdown is only available on the main thread")
+            return self
+        self._chain = chain
+        for signum in SHUTDOWN_SIGNALS:
+            self._previous_handlers[signum] = signal.signal(signum, self._handle)
+        return self
+
+    def uninstall(self):
+        for signum, handler in self._previous_handlers.items():
+            signal.signal(signum, handler)
+        self._previous_handlers.clear()
+
+    def __enter__(self):
+        return self.install()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.uninstall()
+
+    def on_request(self, callback: Callable[[], None]):
+        """Call callback (on the main thread) when shutdown is requested."""
+        self._callbacks.append(callback)
+
+    @contextlib.contextmanager
+    def interruptible(self):
+        """Raise ShutdownRequested on the main thread if a signal arrives inside the block."""
+        self._interruptible = True
+        try:
+            yield
+        finally:
+            self._interruptible = False
+
+    def _handle(self, signum: int, frame: Any):
+        if self._chain:
+            self._pass_on(signum, frame)
+            return
+        if self.requested.is_set():
+            print("\nSecond signal received, stopping immediately")
+            raise KeyboardInterrupt
+        self.request(signum)
+        if self._interruptible:
+            raise ShutdownRequested("Shutdown requested")
+
+    def _pass_on(self, signum: int, frame: Any):
+        previous = self._previous_handlers.get(signum)
+        self.request(signum, wait=True)
+        self.uninstall()
+        if callable(previous):
+            previous(signum, frame)
+        elif previous == signal.SIG_DFL:
+            os.kill(os.getpid(), signum)
+
+    def request(self, signum: Optional[int] = None, wait: bool = False):
+        """Start shutting down, as the first signal does; with wait, a sync client's runs are cancelled first."""
+        with self._lock:
+            if self.requested.is_set():
+                return
+            self.signal_number = signum
+            self._deadline = time.monotonic() + self.grace_seconds
+            self.requested.set()
+        name = signal.Signals(signum).name if signum else "Shutdown"
+        again = "" if self._chain else " Signal again to stop immediately."
+        print(f"\n{name} received: starting no new questions and cancelling in-flight runs "
+              f"(grace period {self.grace_seconds:.0f}s).{again}")
+        for callback in self._callbacks:
+            callback()
+        if self._client is None:
+            return
+        if self._is_async:
+            self._loop.call_soon_threadsafe(self._start_cancel_task)
+        elif wait:
+            self.cancel_in_flight()
+        else:
+            threading.Thread(target=self.cancel_in_flight, name="shutdown-cancel", daemon=True).start()
+
+    def _start_cancel_task(self):
+        self._cancel_task = self._loop.create_task(self.cancel_in_flight_async())
+
+    @property
+    def exit_code(self) -> int:
+        """Conventional exit status for the signal that stopped the batch."""
+        return 128 + (self.signal_number or signal.SIGINT)
+
+    def wrap(self, agents_client: Any) -> "ShutdownAwareClient":
+        """Record the runs started through a sync AgentsClient; cancels go through agents_client."""
+        self._client = agents_client
+        return ShutdownAwareClient(agents_client, self)
+
+    def wrap_async(self, agents_client: Any) -> "ShutdownAwareClient":
+        """Record the runs started through an azure.ai.agents.aio AgentsClient; call from its event loop."""
+        self._client = agents_client
+        self._is_async = True
+        self._loop = asyncio.get_running_loop()
+        return ShutdownAwareClient(agents_client, self, is_async=True)
+
+    def before(self, name: str, kwargs: Dict):
+        """Refuse calls a shutdown rules out; note the event handler of a run stream."""
+        if name in RUN_STARTING_CALLS:
+            if self.requested.is_set():
+                raise ShutdownRequested("Shutdown requested, not starting a run")
+            if name == "runs.stream" and kwargs.get("event_handler") is not None:
+                with self._lock:
+                    self._streams.add(kwargs["event_handler"])
+        elif name == "runs.get" and self._deadline is not None and time.monotonic() > self._deadline:
+            raise ShutdownRequested("Shutdown grace period is over, no longer polling")
+
+    def after(self, name: str, result: Any) -> bool:
+        """Track a started run, untrack a finished one; True when a run started just as shutdown was requested."""
+        if name in ("runs.create", "create_thread_and_run"):
+            with self._lock:
+                self._runs[result.id] = result.thread_id
+            return self.requested.is_set()
+        if name in ("runs.get", "runs.cancel") and getattr(result, "status", None) not in ACTIVE_RUN_STATUSES:
+            with self._lock:
+                self._runs.pop(result.id, None)
+        return False
+
+    def cancel_late_run(self, run: Any):
+        """Cancel a run that started as shutdown was requested, too late for cancel_in_flight to see it."""
+        try:
+            self._client.runs.cancel(thread_id=run.thread_id, run_id=run.id)
+            self._report([(run.thread_id, run.id)], [None])
+        except Exception as e:
+            self._report([(run.thread_id, run.id)], [e])
+
+    async def cancel_late_run_async(self, run: Any):
+        """Async counterpart of cancel_late_run."""
+        try:
+            await self._client.runs.cancel(thread_id=run.thread_id, run_id=run.id)
+            self._report([(run.thread_id, run.id)], [None])
+        except Exception as e:
+            self._report([(run.thread_id, run.id)], [e])
+
+    def in_flight(self) -> List[Tuple[str, str]]:
+        """(thread_id, run_id) of every recorded run not yet seen finishing, streamed runs included."""
+        with self._lock:
+            runs = dict(self._runs)
+            streams = list(self._streams)
+        for handler in streams:
+            run = getattr(handler, "run", None)
+            if run is not None and run.status in ACTIVE_RUN_STATUSES:
+                runs.setdefault(run.id, run.thread_id)
+        return [(thread_id, run_id) for run_id, thread_id in runs.items()]
+
+    def cancel_in_flight(self) -> int:
+        """Cancel every in-flight run concurrently, waiting at most grace_seconds; return how many were cancelled."""
+        runs = self.in_flight()
+        if not runs:
+            return 0
+        print(f"Cancelling {len(runs)} in-flight runs")
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=min(32, len(runs)), thread_name_prefix="shutdown-cancel")
+        futures = [executor.submit(self._client.runs.cancel, thread_id=thread_id, run_id=run_id)
+                   for thread_id, run_id in runs]
+        concurrent.futures.wait(futures, timeout=self.grace_seconds)
+        executor.shutdown(wait=False, cancel_futures=True)
+        return self._report(runs, [f.exception() if f.done() else TimeoutError() for f in futures])
+
+    async def cancel_in_flight_async(self) -> int:
+        """Async counterpart of cancel_in_flight."""
+        runs = self.in_flight()
+        if not runs:
+            return 0
+        print(f"Cancelling {len(runs)} in-flight runs")
+        tasks = [asyncio.ensure_future(self._client.runs.cancel(thread_id=thread_id, run_id=run_id))
+                 for thread_id, run_id in runs]
+        await asyncio.wait(tasks, timeout=self.grace_seconds)
+        errors = []
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+                errors.append(TimeoutError())
+            else:
+                errors.append(None if task.cancelled() else task.exception())
+        return self._report(runs, errors)
+
+    def _report(self, runs: List[Tuple[str, str]], errors: List[Optional[BaseException]]) -> int:
+        cancelled = 0
+        for (thread_id, run_id), error in zip(runs, errors):
+            if error is None:
+                cancelled += 1
+                with self._lock:
+                    self._runs.pop(run_id, None)
+            elif isinstance(error, TimeoutError):
+                print(f"Run {run_id} was not cancelled within the {self.grace_seconds:.0f}s grace period")
+            else:
+                print(f"Could not cancel run {run_id}: {str(error)}")
+        self.cancelled += cancelled
+        print(f"Cancelled {cancelled} of {len(runs)} in-flight runs")
+        return cancelled
+
+
+class ShutdownAwareClient:
+    """Proxy for an AgentsClient (or one of its operation groups) that reports runs to a GracefulShutdown."""
+
+    def __init__(self, target: Any, shutdown: GracefulShutdown, is_async: bool = False, prefix: str = ""):
+        self._target = target
+        self._is_async = is_async
+        self._prefix = prefix
+        self.shutdown = shutdown
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._target, name)
+        if name in OPERATION_GROUPS:
+            return ShutdownAwareClient(attr, self.shutdown, self._is_async, prefix=f"{name}.")
+        if not callable(attr) or name.startswith("_"):
+            return attr
+        full_name = self._prefix + name
+        if self._is_async and inspect.iscoroutinefunction(attr):
+            async def call_async(*args, **kwargs):
+                self.shutdown.before(full_name, kwargs)
+                result = await attr(*args, **kwargs)
+                if self.shutdown.after(full_name, result):
+                    await self.shutdown.cancel_late_run_async(result)
+                return result
+            return call_async
+
+        # Sync calls, and async list operations, whose pager is returned unchanged
+        def call(*args, **kwargs):
+            self.shutdown.before(full_name, kwargs)
+            result = attr(*args, **kwargs)
+            if self.shutdown.after(full_name, result):
+                self.shutdown.cancel_late_run(result)
+            return result
+        return call
+
+
+def print_incomplete(
+    incomplete: List[Tuple[int, str]],
+    hint: str = "",
+    not_started: int = 0,
+    first_unstarted: Optional[int] = None
+):
+    """Print what a shutdown left unfinished as (input position, question) pairs, in input order.
+
+    not_started counts the questions never started, from input position first_unstarted on.
+    """
+    if not incomplete and not not_started:
+        print("Shutdown complete: no questions were left incomplete")
+        return
+    if incomplete:
+        print(f"\nShutdown left {len(incomplete)} questions incomplete:")
+        for input_index, question in sorted(incomplete):
+            print(f"  {input_index}. {question[:100]}")
+    if not_started:
+        print(f"\nShutdown left {not_started} questions not started, from input question {first_unstarted} on")
+    if hint:
+        print(hint)
+
+
+def create_graceful_shutdown() -> GracefulShutdown:
+    """Build a GracefulShutdown whose grace period comes from SHUTDOWN_GRACE_SECONDS (default 30)."""
+    return GracefulShutdown(grace_seconds=float(os.getenv("SHUTDOWN_GRACE_SECONDS", "30")))
@@ -0,0 +1,93 @@
+import time
+from contextlib import contextmanager
+from typing import IO, Dict, Iterator, List, Optional
+
+# Phases of a question in the order they happen; thread_and_run_create replaces
+# thread_create, message_post and run_create when the run is started in one call
+PHASES = (
+    "thread_create",
+    "message_post",
+    "thread_and_run_create",
+    "run_create",
+    "run_queued",
+    "run_in_progress",
+    "message_fetch",
+    "render",
+)
+RUN_STATUS_PHASES = {"queued": "run_queued", "in_progress": "run_in_progress"}
+PERCENTILES = (50, 90, 99)
+
+
+class PhaseTimer:
+    """Wall-clock time spent in each phase of one question, measured with time.monotonic.
+
+    Client-side phases are timed with phase(). Time on the service is split
+    by the run status last seen (run_status), so queued and in-progress
+    durations are accurate to one poll interval, or to the event when
+    streaming. A phase repeated by retries or requeues accumulates.
+    """
+
+    def __init__(self):
+        self.durations: Dict[str, float] = {}
+        self._status: Optional[str] = None
+        self._status_since = 0.0
+
+    def add(self, name: str, seconds: float):
+        self.durations[name] = self.durations.get(name, 0.0) + seconds
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add(name, time.monotonic() - start)
+
+    def run_status(self, status: str):
+        """Record a status seen for the current run; the time since the previous sighting goes to the previous status."""
+        now = time.monotonic()
+        if self._status in RUN_STATUS_PHASES:
+            self.add(RUN_STATUS_PHASES[self._status], now - self._status_since)
+        self._status = status if status in RUN_STATUS_PHASES else None
+        self._status_since = now
+
+    def end_run(self):
+        """Stop timing the current run (it finished, timed out or the stream ended)."""
+        self.run_status("ended")
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Linearly interpolated percentile of a non-empty list."""
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def phase_percentiles(results: List[Dict]) -> Dict[str, Dict[str, float]]:
+    """Percentiles and mean of each phase over the results that recorded it."""
+    summary = {}
+    for name in PHASES:
+        values = [r["metrics"]["phases"][name] for r in results
+                  if name in (r["metrics"].get("phases") or {})]
+        if not values:
+            continue
+        summary[name] = {f"p{pct}": percentile(values, pct) for pct in PERCENTILES}
+        summary[name]["mean"] = sum(values) / len(values)
+        summary[name]["count"] = len(values)
+    return summary
+
+
+def write_phase_table(f: IO[str], results: List[Dict]):
+    """Write the per-phase latency percentiles as a markdown table (nothing when no phases were timed)."""
+    summary = phase_percentiles(results)
+    if not summary:
+        return
+    f.write("## Latency by Phase (seconds)\n")
+    f.write("| Phase | Count | Mean | " + " | ".join(f"p{pct}" for pct in PERCENTILES) + " |\n")
+    f.write("|---|---|---|" + "---|" * len(PERCENTILES) + "\n")
+    for name, stats in summary.items():
+        f.write(f"| {name} | {stats['count']} | {stats['mean']:.2f} | "
+                + " | ".join(f"{stats[f'p{pct}']:.2f}" for pct in PERCENTILES) + " |\n")
+    f.write("\n")
@@ -0,0 +1,181 @@
+import os
+import abc
+import json
+import threading
+from typing import Dict, List, Optional
+
+
+class PollScheduler(abc.ABC):
+    """Decides how long to wait before the next runs.get call for an in-flight run."""
+
+    @abc.abstractmethod
+    def next_interval(self, elapsed: float) -> float:
+        """Return the number of seconds to sleep given the seconds elapsed since the run started."""
+
+    def record(self, duration: float):
+        """Record the duration of a run that reached a terminal status."""
+        pass
+
+    def expected_duration(self) -> Optional[float]:
+        """Typical duration of a run in seconds, or None when the scheduler does not know it."""
+        return None
+
+
+class FixedPollScheduler(PollScheduler):
+    """Poll at a constant interval (the original once-per-second behaviour)."""
+
+    def __init__(self, interval: float = 1.0):
+        self.interval = interval
+
+    def next_interval(self, elapsed: float) -> float:
+        return self.interval
+
+
+class AdaptivePollScheduler(PollScheduler):
+    """Back off exponentially early in a run and tighten near the expected completion time.
+
+    The expected completion time is the median of past run durations, which are
+    appended per key (e.g. per runner) to a JSON Lines history file so that it
+    improves across launches. Within +/- window of that time the interval drops to
+    precision * expected. Without history the scheduler is pure exponential
+    backoff capped at max_interval.
+    """
+
+    def __init__(
+        self,
+        history_file: Optional[str] = None,
+        key: str = "default",
+        min_interval: float = 1.0,
+        max_interval: float = 30.0,
+        backoff: float = 2.0,
+        window: float = 0.2,
+        precision: float = 0.02,
+        history_size: int = 200
+    ):
+        self.history_file = history_file
+        self.key = key
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.window = window
+        self.precision = precision
+        self.history_size = history_size
+        self._lock = threading.Lock()
+        self._history = self._load_history()
+
+    def _load_history(self) -> Dict[str, List[float]]:
+        """Load run duration history from disk, compacting the file when it has grown well past history_size."""
+        history: Dict[str, List[float]] = {}
+        if not (self.history_file and os.path.exists(self.history_file)):
+            return history
+        lines = 0
+        legacy = False
+        try:
+            with open(self.history_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A line torn by a crash mid-append
+                        continue
+                    lines += 1
+                    if "duration" in entry:
+                        history.setdefault(entry["key"], []).append(entry["duration"])
+                    else:
+                        # A whole {key: [durations]} history, as written before the file was append-only
+                        legacy = True
+                        for key, durations in entry.items():
+                            history.setdefault(key, []).extend(durations)
+        except Exception as e:
+            print(f"Could not load poll history {self.history_file}: {e}")
+            return {}
+        for durations in history.values():
+            del durations[:-self.history_size]
+        if legacy or lines > 2 * sum(len(durations) for durations in history.values()):
+            self._compact_history(history)
+        return history
+
+    def _compact_history(self, history: Dict[str, List[float]]):
+        """Rewrite the history file with only the retained durations, atomically.
+
+        A duration another process appends while the file is rewritten may be
+        lost, which only costs the estimate one sample.
+        """
+        tmp_file = f"{self.history_file}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                for key, durations in history.items():
+                    f.writelines(json.dumps({"key": key, "duration": d}) + "\n" for d in durations)
+            os.replace(tmp_file, self.history_file)
+        except Exception as e:
+            print(f"Could not compact poll history {self.history_file}: {e}")
+
+    def _append_history(self, duration: float):
+        """Append one duration as a single write, so processes sharing the file do not overwrite each other."""
+        if not self.history_file:
+            return
+        try:
+            with open(self.history_file, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({"key": self.key, "duration": duration}) + "\n")
+        except Exception as e:
+            print(f"Could not save poll history {self.history_file}: {e}")
+
+    def expected_duration(self) -> Optional[float]:
+        """Median duration of past runs for this key, or None without history."""
+        with self._lock:
+            durations = sorted(self._history.get(self.key, []))
+        if not durations:
+            return None
+        mid = len(durations) // 2
+        if len(durations) % 2:
+            return durations[mid]
+        return (durations[mid - 1] + durations[mid]) / 2
+
+    def next_interval(self, elapsed: float) -> float:
+        # Exponential backoff: with backoff=2 polls land at roughly 1, 2, 4, 8, ... seconds
+        interval = max(self.min_interval, elapsed * (self.backoff - 1))
+
+        expected = self.expected_duration()
+        if expected is not None:
+            window_start = expected * (1 - self.window)
+            window_end = expected * (1 + self.window)
+            if window_start <= elapsed <= window_end:
+                # Inside the expected completion window: poll at a small fraction of the expected duration
+                interval = max(self.min_interval, expected * self.precision)
+            elif elapsed < window_start:
+                # Don't sleep past the start of the completion window
+                interval = min(interval, max(self.min_interval, window_start - elapsed))
+            else:
+                # Overran the expected time: back off again relative to the overrun
+                interval = max(self.min_interval, (elapsed - window_end) * (self.backoff - 1))
+
+        return min(interval, self.max_interval)
+
+    def record(self, duration: float):
+        duration = round(duration, 2)
+        with self._lock:
+            durations = self._history.setdefault(self.key, [])
+            durations.append(duration)
+            del durations[:-self.history_size]
+            self._append_history(duration)
+
+
+def create_poll_scheduler(mode: Optional[str] = None, key: str = "default") -> PollScheduler:
+    """Build a poll scheduler from a mode name and POLL_* environment variables.
+
+    mode defaults to POLL_MODE (or "adaptive"). "fixed" polls every
+    POLL_MIN_INTERVAL_SECONDS; "adaptive" uses AdaptivePollScheduler with its
+    history stored in POLL_HISTORY_FILE.
+    """
+    mode = mode or os.getenv("POLL_MODE", "adaptive")
+    min_interval = float(os.getenv("POLL_MIN_INTERVAL_SECONDS", "1"))
+    if mode == "fixed":
+        return FixedPollScheduler(interval=min_interval)
+    if mode == "adaptive":
+        return AdaptivePollScheduler(
+            history_file=os.getenv("POLL_HISTORY_FILE", "run_durations.json"),
+            key=key,
+            min_interval=min_interval,
+            max_interval=float(os.getenv("POLL_MAX_INTERVAL_SECONDS", "30")),
+        )
+    raise ValueError(f"Unknown poll mode: {mode}")
@@ -0,0 +1,117 @@
+import time
+import asyncio
+import threading
+import concurrent.futures
+from typing import Any, Callable, Dict, Tuple
+
+# Scope the project and Agents clients request tokens for
+PROJECT_SCOPE = "https://ai.azure.com/.default"
+
+
+class SharedTokenCredential:
+    """Wraps a credential so every client built on it shares one token per scope.
+
+    Tokens are cached until refresh_seconds before they expire, and only one caller fetches a given token.
+    """
+
+    def __init__(self, credential: Any, refresh_seconds: float = 300.0):
+        self.credential = credential
+        self.refresh_seconds = refresh_seconds
+        self._tokens: Dict[Tuple, Any] = {}
+        self._fetch_locks: Dict[Tuple, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def _cached(self, key: Tuple, margin: float) -> Any:
+        """Cached token for key if it is valid for at least margin more seconds, or None."""
+        with self._lock:
+            token = self._tokens.get(key)
+        if token is not None and token.expires_on - time.time() > margin:
+            return token
+        return None
+
+    def get_token(self, *scopes: str, claims: Any = None, tenant_id: Any = None, **kwargs) -> Any:
+        if claims:
+            # A claims challenge needs a new token
+            return self.credential.get_token(*scopes, claims=claims, tenant_id=tenant_id, **kwargs)
+        key = (scopes, tenant_id, kwargs.get("enable_cae", False))
+        token = self._cached(key, self.refresh_seconds)
+        if token is not None:
+            return token
+        with self._lock:
+            fetch_lock = self._fetch_locks.setdefault(key, threading.Lock())
+        if not fetch_lock.acquire(blocking=False):
+            # Another caller is fetching: keep using a token that has not expired, or wait for the new one
+            token = self._cached(key, 0)
+            if token is not None:
+                return token
+            fetch_lock.acquire()
+        try:
+            token = self._cached(key, self.refresh_seconds)
+            if token is None:
+                token = self.credential.get_token(*scopes, tenant_id=tenant_id, **kwargs)
+                with self._lock:
+                    self._tokens[key] = token
+            return token
+        finally:
+            fetch_lock.release()
+
+    def close(self):
+        if hasattr(self.credential, "close"):
+            self.credential.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class AsyncSharedTokenCredential:
+    """Async view of a SharedTokenCredential, so azure.ai.agents.aio clients share its tokens too.
+
+    A token the shared credential has to fetch is fetched on a worker thread,
+    keeping the event loop free. Closing this view leaves the shared
+    credential open; its owner closes it.
+    """
+
+    def __init__(self, credential: SharedTokenCredential):
+        self.credential = credential
+
+    async def get_token(self, *scopes: str, **kwargs) -> Any:
+        return await asyncio.to_thread(self.credential.get_token, *scopes, **kwargs)
+
+    async def close(self):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+
+def run_preflight(steps: Dict[str, Callable[[], Any]]) -> Dict[str, Any]:
+    """Run independent startup steps concurrently and return their results by name.
+
+    Each step's duration is printed on one line. Every step is waited for;
+    the first failure, in the order steps were given, is then raised.
+    """
+    start = time.monotonic()
+    timings: Dict[str, float] = {}
+
+    def timed(name: str, step: Callable[[], Any]) -> Any:
+        step_start = time.monotonic()
+        try:
+            return step()
+        finally:
+            timings[name] = time.monotonic() - step_start
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(steps), thread_name_prefix="preflight") as executor:
+        futures = {name: executor.submit(timed, name, step) for name, step in steps.items()}
+        concurrent.futures.wait(futures.values())
+    parts = ", ".join(f"{name} {timings[name] * 1000:.0f}ms" for name in steps)
+    print(f"Startup preflight: {parts} (total {(time.monotonic() - start) * 1000:.0f}ms)")
+    for future in futures.values():
+        if future.exception() is not None:
+            raise future.exception()
+    return {name: future.result() for name, future in futures.items()}
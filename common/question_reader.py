@@ -0,0 +1,106 @@
+import os
+import re
+import csv
+import json
+from typing import IO, Any, Iterator
+
+CHUNK_SIZE = 64 * 1024
+WHITESPACE = re.compile(r"\s*")
+
+
+def iter_questions(file_path: str) -> Iterator[str]:
+    """Yield questions from a JSONL, JSON or CSV file one at a time.
+
+    Nothing is read ahead beyond one chunk, so memory stays flat and the first
+    question is available immediately regardless of file size. .jsonl files
+    hold one question per line, .json files a (possibly huge) array, and any
+    other file is read as CSV with the question in the first column. JSON
+    items may be strings or objects with a "question" field. A missing file
+    is reported here rather than on the first read.
+    """
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"Input file not found: {file_path}")
+    return _read_questions(file_path)
+
+
+def _read_questions(file_path: str) -> Iterator[str]:
+    with open(file_path, 'r', encoding='utf-8', newline='') as f:
+        if file_path.endswith('.jsonl'):
+            for line_number, line in enumerate(f, 1):
+                line = line.strip()
+                if line:
+                    yield _question_text(json.loads(line), f"{file_path}:{line_number}")
+        elif file_path.endswith('.json'):
+            for item in iter_json_array(f):
+                yield _question_text(item, file_path)
+        else:
+            # Fallback to CSV reading
+            for row in csv.reader(f):
+                if row:  # Skip empty rows
+                    yield row[0]
+
+
+def iter_json_array(f: IO[str]) -> Iterator[Any]:
+    """Incrementally decode the items of a top-level JSON array from a text stream."""
+    decoder = json.JSONDecoder()
+    buffer = ""
+    pos = 0
+    eof = False
+
+    def fill() -> bool:
+        # Drop consumed text and append the next chunk; False at end of file
+        nonlocal buffer, pos, eof
+        chunk = f.read(CHUNK_SIZE)
+        buffer = buffer[pos:] + chunk
+        pos = 0
+        eof = not chunk
+        return bool(chunk)
+
+    def skip_whitespace():
+        nonlocal pos
+        while True:
+            pos = WHITESPACE.match(buffer, pos).end()
+            if pos < len(buffer) or not fill():
+                return
+
+    skip_whitespace()
+    if pos >= len(buffer) or buffer[pos] != '[':
+        raise ValueError("Expected a JSON array of questions")
+    pos += 1
+
+    first = True
+    while True:
+        skip_whitespace()
+        if pos >= len(buffer):
+            raise ValueError("Unterminated JSON array")
+        if buffer[pos] == ']':
+            return
+        if not first:
+            if buffer[pos] != ',':
+                raise ValueError(f"Expected ',' in JSON array, found {buffer[pos]!r}")
+            pos += 1
+            skip_whitespace()
+        first = False
+        while True:
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # The item is cut off at the end of the buffer; read more and try again
+                if eof or not fill():
+                    raise
+                continue
+            if end == len(buffer) and not eof and isinstance(item, (int, float)):
+                # A number at the end of the buffer may continue in the next chunk
+                if fill():
+                    continue
+            pos = end
+            yield item
+            break
+
+
+def _question_text(item: Any, source: str) -> str:
+    if isinstance(item, str):
+        return item
+    if isinstance(item, dict) and isinstance(item.get("question"), str):
+        return item["question"]
+    raise ValueError(f"Unsupported question entry in {source}: {item!r}")
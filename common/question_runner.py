@@ -0,0 +1,443 @@
+import os
+import time
+import asyncio
+import contextlib
+from typing import Any, Dict, List, Optional, Tuple
+
+from azure.ai.agents.models import MessageRole, ThreadMessage
+
+from phase_timing import PhaseTimer
+from poll_scheduler import PollScheduler
+from rate_limiter import RateLimiter
+from retry_policy import PERMANENT, RetryPolicy, classify_exception, classify_run
+from run_submit import CombinedCreate, thread_options
+from streaming import stream_run
+from thread_provisioner import ThreadProvisioner, new_thread_id
+from token_budget import TokenBudget
+
+HEARTBEAT_SECONDS = 10  # seconds between "still processing" logs
+
+
+class Attempt:
+    """What one attempt at a question produced; each runner builds its own result from it."""
+
+    def __init__(self):
+        self.start_time = time.time()
+        self.run: Any = None
+        self.thread_id: Optional[str] = None
+        self.time_to_first_token: Optional[float] = None
+        self.response_text = ""
+        self.citations: List[Dict] = []
+        self.stream_metrics: Optional[Dict] = None
+        self.requeues = 0
+        self.cap_error: Optional[str] = None
+        self.error: Optional[Exception] = None
+        # None when the run completed, otherwise "transient" or "permanent" (see retry_policy.py)
+        self.failure: Optional[str] = None
+        # Why each attempt at the question failed, in order; filled in by run_question
+        self.failures: List[str] = []
+
+    def failure_reason(self) -> Optional[str]:
+        """A short description of why the attempt failed, or None if it did not."""
+        if self.failure is None:
+            return None
+        if self.error is not None:
+            return f"{type(self.error).__name__}: {str(self.error)}"
+        if self.cap_error:
+            return self.cap_error
+        # The SDK may hand back a RunStatus enum member rather than the plain string
+        status = getattr(self.run.status, "value", self.run.status)
+        if status in ("queued", "in_progress"):
+            return f"timed out while {status}"
+        if status == "failed":
+            return f"failed: {getattr(self.run.last_error, 'code', None)}"
+        return status
+
+
+def extract_response(response: ThreadMessage) -> Tuple[str, List[Dict]]:
+    """Join the text of an agent message and collect its URL citations."""
+    response_text = "\n".join(t.text.value for t in response.text_messages)
+    citations = []
+    if response.url_citation_annotations:
+        citations = [
+            {"title": ann.url_citation.title, "url": ann.url_citation.url}
+            for ann in response.url_citation_annotations
+        ]
+    return response_text, citations
+
+
+def cancel_run(agents_client: Any, thread_id: str, run_id: str):
+    """Cancel a run, logging rather than raising when the cancel fails."""
+    try:
+        agents_client.runs.cancel(thread_id=thread_id, run_id=run_id)
+        print(f"Run {run_id} canceled")
+    except Exception as cancel_error:
+        print(f"Error canceling run: {str(cancel_error)}")
+
+
+async def cancel_run_async(agents_client: Any, thread_id: str, run_id: str):
+    """Async counterpart of cancel_run."""
+    try:
+        await agents_client.runs.cancel(thread_id=thread_id, run_id=run_id)
+        print(f"Run {run_id} canceled")
+    except Exception as cancel_error:
+        print(f"Error canceling run: {str(cancel_error)}")
+
+
+def wait_for_run(
+    agents_client: Any,
+    thread_id: str,
+    run: Any,
+    timeout: float,
+    index: int,
+    poll_scheduler: PollScheduler,
+    phase_timer: Optional[PhaseTimer] = None,
+    token_budget: Optional[TokenBudget] = None
+) -> Any:
+    """Poll a run until it leaves queued/in_progress, cancelling it after timeout seconds.
+
+    The timeout is measured on the monotonic clock, so slow runs.get calls count towards it.
+    Each status seen is passed to phase_timer to split queued from in-progress time.
+    A run reporting more tokens than token_budget's per-question cap is cancelled too.
+    """
+    phase_timer = phase_timer or PhaseTimer()
+    phase_timer.run_status(run.status)
+    run_id = run.id
+    started = time.monotonic()
+    elapsed = 0.0
+    next_heartbeat = HEARTBEAT_SECONDS
+
+    # Poll for completion, letting the scheduler decide how long to wait between checks
+    while run.status in ("queued", "in_progress"):
+        interval = min(poll_scheduler.next_interval(elapsed), max(timeout - elapsed, 0))
+        time.sleep(interval)
+        elapsed = time.monotonic() - started
+        if elapsed >= next_heartbeat:
+            print(f"Still processing question {index}, elapsed {elapsed:.0f}s")
+            next_heartbeat = (elapsed // HEARTBEAT_SECONDS + 1) * HEARTBEAT_SECONDS
+        if elapsed >= timeout:
+            print(f"Timeout after {timeout}s for question {index}, aborting run.")
+            cancel_run(agents_client, thread_id, run_id)
+            break
+        run = agents_client.runs.get(thread_id=thread_id, run_id=run_id)
+        phase_timer.run_status(run.status)
+        cap_error = token_budget.check_run(agents_client, run) if token_budget else None
+        if cap_error:
+            print(f"{cap_error} for question {index}, aborting run.")
+            cancel_run(agents_client, thread_id, run_id)
+            break
+
+    phase_timer.end_run()
+    if run.status == "completed":
+        poll_scheduler.record(time.monotonic() - started)
+    return run
+
+
+async def wait_for_run_async(
+    agents_client: Any,
+    thread_id: str,
+    run: Any,
+    timeout: float,
+    index: int,
+    poll_scheduler: PollScheduler,
+    phase_timer: Optional[PhaseTimer] = None,
+    token_budget: Optional[TokenBudget] = None
+) -> Any:
+    """Async counterpart of wait_for_run; polling waits without blocking the event loop."""
+    phase_timer = phase_timer or PhaseTimer()
+    phase_timer.run_status(run.status)
+    run_id = run.id
+    started = time.monotonic()
+    elapsed = 0.0
+    next_heartbeat = HEARTBEAT_SECONDS
+
+    while run.status in ("queued", "in_progress"):
+        interval = min(poll_scheduler.next_interval(elapsed), max(timeout - elapsed, 0))
+        await asyncio.sleep(interval)
+        elapsed = time.monotonic() - started
+        if elapsed >= next_heartbeat:
+            print(f"Still processing question {index}, elapsed {elapsed:.0f}s")
+            next_heartbeat = (elapsed // HEARTBEAT_SECONDS + 1) * HEARTBEAT_SECONDS
+        if elapsed >= timeout:
+            print(f"Timeout after {timeout}s for question {index}, aborting run.")
+            await cancel_run_async(agents_client, thread_id, run_id)
+            break
+        run = await agents_client.runs.get(thread_id=thread_id, run_id=run_id)
+        phase_timer.run_status(run.status)
+        cap_error = await token_budget.check_run_async(agents_client, run) if token_budget else None
+        if cap_error:
+            print(f"{cap_error} for question {index}, aborting run.")
+            await cancel_run_async(agents_client, thread_id, run_id)
+            break
+
+    phase_timer.end_run()
+    if run.status == "completed":
+        poll_scheduler.record(time.monotonic() - started)
+    return run
+
+
+def classify_attempt(attempt: Attempt, token_budget: Optional[TokenBudget]):
+    """Set how the attempt's run failed; a run cancelled over the per-question token cap fails permanently."""
+    attempt.cap_error = token_budget.over_cap_error(attempt.run) if token_budget else None
+    attempt.failure = PERMANENT if attempt.cap_error else classify_run(attempt.run)
+
+
+def attempt_run(
+    question: str,
+    index: int,
+    agents_client: Any,
+    agent_id: str,
+    poll_scheduler: PollScheduler,
+    stream: bool = False,
+    rate_limiter: Optional[RateLimiter] = None,
+    thread_provisioner: Optional[ThreadProvisioner] = None,
+    combined_create: Optional[CombinedCreate] = None,
+    phase_timer: Optional[PhaseTimer] = None,
+    token_budget: Optional[TokenBudget] = None,
+    timeout: Optional[float] = None
+) -> Attempt:
+    """Make one attempt at a question on a fresh thread: submit, wait (poll or stream), fetch and classify.
+
+    timeout defaults to BATCH_TIMEOUT_SECONDS. An exception is caught and
+    recorded on the attempt rather than raised.
+    """
+    attempt = Attempt()
+    phase_timer = phase_timer or PhaseTimer()
+    run = None
+    try:
+        if not stream and combined_create and combined_create.available:
+            try:
+                with phase_timer.phase("thread_and_run_create"):
+                    run = agents_client.create_thread_and_run(agent_id=agent_id, thread=thread_options(question))
+                combined_create.succeeded()
+                attempt.thread_id = run.thread_id
+                print(f"Started run on new thread for question {index}, ID: {attempt.thread_id}")
+            except Exception as e:
+                if not combined_create.failed(e):
+                    raise
+
+        if run is None:
+            # Use a new thread for each attempt to avoid conflicts
+            with phase_timer.phase("thread_create"):
+                attempt.thread_id = new_thread_id(agents_client, thread_provisioner)
+            print(f"Using new thread for question {index}, ID: {attempt.thread_id}")
+            with phase_timer.phase("message_post"):
+                agents_client.messages.create(thread_id=attempt.thread_id, role="user", content=question)
+
+        if timeout is None:
+            timeout = int(os.getenv("BATCH_TIMEOUT_SECONDS", "300"))
+
+        while True:
+            if stream:
+                # Consume the run's event stream; TTFT comes from the first message delta
+                reserved = rate_limiter.estimate_run_tokens() if rate_limiter else None
+                handler = stream_run(
+                    agents_client, attempt.thread_id, agent_id, attempt.start_time, timeout,
+                    prefix=f"[Question {index}] ", phase_timer=phase_timer, token_budget=token_budget
+                )
+                if handler.run is None:
+                    raise RuntimeError(handler.error or "Run stream ended before the run was created")
+                run = handler.run
+                if rate_limiter:
+                    rate_limiter.record_run(run, reserved=reserved)
+            else:
+                # Create (unless create_thread_and_run already did) and monitor the run
+                if run is None:
+                    with phase_timer.phase("run_create"):
+                        run = agents_client.runs.create(thread_id=attempt.thread_id, agent_id=agent_id)
+                run = wait_for_run(
+                    agents_client, attempt.thread_id, run, timeout, index, poll_scheduler, phase_timer, token_budget
+                )
+            if rate_limiter is None or not rate_limiter.requeue_throttled_run(run, attempt.requeues):
+                break
+            attempt.requeues += 1
+            run = None
+        attempt.run = run
+
+        if stream:
+            attempt.stream_metrics = handler.metrics()
+            attempt.time_to_first_token = handler.time_to_first_token
+            attempt.response_text = handler.response_text
+            if handler.message and handler.message.text_messages:
+                attempt.response_text, attempt.citations = extract_response(handler.message)
+        elif run.status == "completed":
+            with phase_timer.phase("message_fetch"):
+                response = agents_client.messages.get_last_message_by_role(
+                    thread_id=attempt.thread_id, role=MessageRole.AGENT
+                )
+            if response and response.text_messages:
+                attempt.time_to_first_token = time.time() - attempt.start_time
+                attempt.response_text, attempt.citations = extract_response(response)
+        classify_attempt(attempt, token_budget)
+    except Exception as e:
+        print(f"Error processing question {index}: {str(e)}")
+        attempt.error = e
+        attempt.failure = classify_exception(e)
+    finally:
+        if rate_limiter:
+            rate_limiter.release_run(run)
+    return attempt
+
+
+async def attempt_run_async(
+    question: str,
+    index: int,
+    agents_client: Any,
+    agent_id: str,
+    poll_scheduler: PollScheduler,
+    rate_limiter: Optional[RateLimiter] = None,
+    thread_provisioner: Optional[ThreadProvisioner] = None,
+    combined_create: Optional[CombinedCreate] = None,
+    phase_timer: Optional[PhaseTimer] = None,
+    token_budget: Optional[TokenBudget] = None,
+    timeout: Optional[float] = None
+) -> Attempt:
+    """Async counterpart of attempt_run, for an azure.ai.agents.aio client; runs are polled, not streamed."""
+    attempt = Attempt()
+    phase_timer = phase_timer or PhaseTimer()
+    run = None
+    try:
+        if combined_create and combined_create.available:
+            try:
+                with phase_timer.phase("thread_and_run_create"):
+                    run = await agents_client.create_thread_and_run(agent_id=agent_id, thread=thread_options(question))
+                combined_create.succeeded()
+                attempt.thread_id = run.thread_id
+                print(f"Started run on new thread for question {index}, ID: {attempt.thread_id}")
+            except Exception as e:
+                if not combined_create.failed(e):
+                    raise
+
+        if run is None:
+            # A pre-created thread is taken without blocking; otherwise create one here
+            with phase_timer.phase("thread_create"):
+                attempt.thread_id = thread_provisioner.try_acquire() if thread_provisioner else None
+                if attempt.thread_id is None:
+                    attempt.thread_id = (await agents_client.threads.create()).id
+            print(f"Using new thread for question {index}, ID: {attempt.thread_id}")
+            with phase_timer.phase("message_post"):
+                await agents_client.messages.create(thread_id=attempt.thread_id, role="user", content=question)
+
+        if timeout is None:
+            timeout = int(os.getenv("BATCH_TIMEOUT_SECONDS", "300"))
+
+        while True:
+            if run is None:
+                with phase_timer.phase("run_create"):
+                    run = await agents_client.runs.create(thread_id=attempt.thread_id, agent_id=agent_id)
+            run = await wait_for_run_async(
+                agents_client, attempt.thread_id, run, timeout, index, poll_scheduler, phase_timer, token_budget
+            )
+            if rate_limiter is None or not rate_limiter.requeue_throttled_run(run, attempt.requeues):
+                break
+            attempt.requeues += 1
+            run = None
+        attempt.run = run
+
+        if run.status == "completed":
+            with phase_timer.phase("message_fetch"):
+                response = await agents_client.messages.get_last_message_by_role(
+                    thread_id=attempt.thread_id, role=MessageRole.AGENT
+                )
+            if response and response.text_messages:
+                attempt.time_to_first_token = time.time() - attempt.start_time
+                attempt.response_text, attempt.citations = extract_response(response)
+        classify_attempt(attempt, token_budget)
+    except Exception as e:
+        print(f"Error processing question {index}: {str(e)}")
+        attempt.error = e
+        attempt.failure = classify_exception(e)
+    finally:
+        if rate_limiter:
+            rate_limiter.release_run(run)
+    return attempt
+
+
+def retry_delay(
+    attempt: Attempt,
+    attempt_number: int,
+    index: int,
+    retry_policy: RetryPolicy,
+    question_deadline: Optional[float]
+) -> Optional[float]:
+    """Seconds to wait before retrying a question after attempt, or None when it is not retried."""
+    if not retry_policy.should_retry(attempt.failure, attempt_number):
+        return None
+    delay = retry_policy.backoff(attempt_number)
+    if question_deadline and time.monotonic() + delay >= question_deadline:
+        print(f"No time left to retry question {index} before its deadline")
+        return None
+    print(f"Attempt {attempt_number} for question {index} failed ({attempt.failure}), retrying in {delay:.1f}s")
+    return delay
+
+
+def run_question(
+    question: str,
+    index: int,
+    agents_client: Any,
+    agent_id: str,
+    poll_scheduler: PollScheduler,
+    retry_policy: RetryPolicy,
+    stream: bool = False,
+    rate_limiter: Optional[RateLimiter] = None,
+    thread_provisioner: Optional[ThreadProvisioner] = None,
+    combined_create: Optional[CombinedCreate] = None,
+    phase_timer: Optional[PhaseTimer] = None,
+    token_budget: Optional[TokenBudget] = None,
+    question_deadline: Optional[float] = None
+) -> Tuple[Attempt, int]:
+    """Attempt a question until it succeeds or retry_policy stops; return the last attempt and the number made.
+
+    With a question_deadline (monotonic) every attempt's timeout is the time left before it.
+    """
+    failures = []
+    attempt_number = 1
+    while True:
+        timeout = question_deadline - time.monotonic() if question_deadline else None
+        attempt = attempt_run(
+            question, index, agents_client, agent_id, poll_scheduler, stream, rate_limiter,
+            thread_provisioner, combined_create, phase_timer, token_budget, timeout
+        )
+        if attempt.failure:
+            failures.append(attempt.failure_reason())
+        delay = retry_delay(attempt, attempt_number, index, retry_policy, question_deadline)
+        if delay is None:
+            attempt.failures = failures
+            return attempt, attempt_number
+        time.sleep(delay)
+        attempt_number += 1
+
+
+async def run_question_async(
+    question: str,
+    index: int,
+    agents_client: Any,
+    agent_id: str,
+    poll_scheduler: PollScheduler,
+    retry_policy: RetryPolicy,
+    rate_limiter: Optional[RateLimiter] = None,
+    thread_provisioner: Optional[ThreadProvisioner] = None,
+    combined_create: Optional[CombinedCreate] = None,
+    phase_timer: Optional[PhaseTimer] = None,
+    token_budget: Optional[TokenBudget] = None,
+    question_deadline: Optional[float] = None,
+    semaphore: Optional[asyncio.Semaphore] = None
+) -> Tuple[Attempt, int]:
+    """Async counterpart of run_question; each attempt holds a semaphore slot, released while backing off."""
+    failures = []
+    attempt_number = 1
+    while True:
+        async with semaphore or contextlib.nullcontext():
+            timeout = question_deadline - time.monotonic() if question_deadline else None
+            attempt = await attempt_run_async(
+                question, index, agents_client, agent_id, poll_scheduler, rate_limiter,
+                thread_provisioner, combined_create, phase_timer, token_budget, timeout
+            )
+        if attempt.failure:
+            failures.append(attempt.failure_reason())
+        delay = retry_delay(attempt, attempt_number, index, retry_policy, question_deadline)
+        if delay is None:
+            attempt.failures = failures
+            return attempt, attempt_number
+        await asyncio.sleep(delay)
+        attempt_number += 1
@@ -0,0 +1,341 @@
+import os
+import re
+import time
+import asyncio
+import inspect
+import threading
+import contextlib
+import contextvars
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from azure.core.exceptions import HttpResponseError
+
+# Agents client attributes that are operation groups rather than methods
+OPERATION_GROUPS = ("threads", "messages", "runs", "run_steps", "files", "vector_stores",
+                    "vector_store_files", "vector_store_file_batches")
+# Calls that start a run and are charged against the tokens-per-minute bucket
+RUN_STARTING_CALLS = ("runs.create", "runs.stream", "create_thread_and_run")
+
+
+class CallCount:
+    """Number of Agents calls sent while a count_calls() block was active."""
+
+    def __init__(self):
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def add(self):
+        with self._lock:
+            self.calls += 1
+
+
+_call_count: contextvars.ContextVar[Optional[CallCount]] = contextvars.ContextVar("agents_call_count", default=None)
+
+
+@contextlib.contextmanager
+def count_calls() -> Iterator[CallCount]:
+    """Count the calls a RateLimiter sends from this context, each attempt of a requeued 429 included.
+
+    Threads started inside the block only count towards it when they run in a
+    copy of its context (contextvars.copy_context()).
+    """
+    count = CallCount()
+    token = _call_count.set(count)
+    try:
+        yield count
+    finally:
+        _call_count.reset(token)
+
+
+def _count_call():
+    count = _call_count.get()
+    if count is not None:
+        count.add()
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at rate_per_minute, holding at most one minute's worth.
+
+    reserve() debits immediately and returns how long the caller must wait for
+    the debt to be refilled, so concurrent callers queue up in arrival order.
+    """
+
+    def __init__(self, rate_per_minute: float):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = rate_per_minute
+        self._tokens = float(rate_per_minute)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, amount: float) -> float:
+        """Take amount tokens and return the seconds to wait before using them."""
+        with self._lock:
+            self._refill()
+            self._tokens -= min(amount, self.capacity)
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def adjust(self, amount: float):
+        """Give back (positive) or take (negative) tokens after the real cost is known."""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self.capacity, self._tokens + amount)
+
+
+class RateLimiter:
+    """Shared dispatcher for Agents service calls.
+
+    Every call waits on a requests-per-minute bucket and every run start on a
+    tokens-per-minute bucket; a 429 pauses all callers for Retry-After and the
+    call is requeued. A limit of 0 disables that bucket.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float = 0,
+        tokens_per_minute: float = 0,
+        max_requeues: int = 10,
+        token_estimate: int = 5000,
+        default_retry_after: float = 10.0
+    ):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_requeues = max_requeues
+        self.default_retry_after = default_retry_after
+        self.throttled = 0
+        self._token_estimate = token_estimate
+        self._finished_runs = 0
+        self._pending_runs: Dict[str, float] = {}
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _wait_time(self, tokens: float) -> float:
+        wait = max(0.0, self._paused_until - time.monotonic())
+        if self.requests is not None:
+            wait = max(wait, self.requests.reserve(1))
+        if tokens and self.tokens is not None:
+            wait = max(wait, self.tokens.reserve(tokens))
+        return wait
+
+    def acquire(self, tokens: float = 0):
+        """Block until one request (and tokens) may be sent."""
+        wait = self._wait_time(tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens: float = 0):
+        wait = self._wait_time(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def pause(self, seconds: float):
+        """Hold back every caller for the given number of seconds."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self.throttled += 1
+
+    def estimate_run_tokens(self) -> float:
+        with self._lock:
+            return self._token_estimate
+
+    def record_run(self, run: Any, reserved: Optional[float] = None):
+        """Settle a finished run's token reservation against its reported usage.
+
+        Runs started with runs.create are tracked automatically; pass reserved
+        for runs whose id was not known when the tokens were taken (streams).
+        """
+        if run is None or getattr(run, "usage", None) is None:
+            return
+        with self._lock:
+            reserved = self._pending_runs.pop(run.id, reserved)
+            if reserved is None:
+                return
+            actual = (run.usage.prompt_tokens or 0) + (run.usage.completion_tokens or 0)
+            self._finished_runs += 1
+            self._token_estimate += (actual - self._token_estimate) / self._finished_runs
+        if self.tokens is not None:
+            self.tokens.adjust(reserved - actual)
+
+    def release_run(self, run: Any):
+        """Drop a run's reservation once its question is done with it.
+
+        Covers runs that never reached a terminal runs.get, such as runs
+        cancelled on a timeout or token cap or abandoned on an error. The run
+        is settled when it reports usage; otherwise the estimate stays charged,
+        since the tokens it spent are unknown. Settled runs are left alone.
+        """
+        if run is None:
+            return
+        if getattr(run, "usage", None) is not None:
+            self.record_run(run)
+            return
+        with self._lock:
+            self._pending_runs.pop(run.id, None)
+
+    def _before(self, name: str) -> float:
+        return self.estimate_run_tokens() if name in RUN_STARTING_CALLS else 0
+
+    def _after(self, name: str, tokens: float, result: Any):
+        if name in ("runs.create", "create_thread_and_run"):
+            with self._lock:
+                self._pending_runs[result.id] = tokens
+        elif name == "runs.get" and getattr(result, "status", None) in ("completed", "failed", "cancelled", "expired"):
+            self.record_run(result)
+
+    def _refund(self, tokens: float):
+        """Give back the tokens reserved for a call that failed, so a retry does not pay for them twice."""
+        if tokens and self.tokens is not None:
+            self.tokens.adjust(tokens)
+
+    def _throttle(self, name: str, error: HttpResponseError, attempt: int):
+        if not is_rate_limited(error) or attempt >= self.max_requeues:
+            raise error
+        delay = retry_after_seconds(error) or self.default_retry_after
+        print(f"Rate limited on {name}, requeueing after {delay:.1f}s")
+        self.pause(delay)
+
+    def call(self, name: str, fn: Callable, /, *args, **kwargs):
+        """Invoke fn once the buckets allow it, requeueing on 429."""
+        attempt = 0
+        while True:
+            tokens = self._before(name)
+            self.acquire(tokens)
+            _count_call()
+            try:
+                result = fn(*args, **kwargs)
+            except HttpResponseError as e:
+                self._refund(tokens)
+                self._throttle(name, e, attempt)
+                attempt += 1
+                continue
+            except Exception:
+                self._refund(tokens)
+                raise
+            self._after(name, tokens, result)
+            return result
+
+    async def call_async(self, name: str, fn: Callable, /, *args, **kwargs):
+        attempt = 0
+        while True:
+            tokens = self._before(name)
+            await self.acquire_async(tokens)
+            _count_call()
+            try:
+                result = await fn(*args, **kwargs)
+            except HttpResponseError as e:
+                self._refund(tokens)
+                self._throttle(name, e, attempt)
+                attempt += 1
+                continue
+            except Exception:
+                self._refund(tokens)
+                raise
+            self._after(name, tokens, result)
+            return result
+
+    def call_paged(self, name: str, fn: Callable, /, *args, **kwargs):
+        """Invoke fn, an async list operation, and return its pager unchanged.
+
+        The pager sends its requests as it is iterated, so nothing is awaited
+        here; one request is charged to the buckets, which paces later calls.
+        """
+        self._wait_time(0)
+        _count_call()
+        return fn(*args, **kwargs)
+
+    def requeue_throttled_run(self, run: Any, requeues: int) -> bool:
+        """Return True (after pausing) if a run failed on a rate limit and should be started again."""
+        error = getattr(run, "last_error", None)
+        if run is None or run.status != "failed" or error is None or error.code != "rate_limit_exceeded":
+            return False
+        if requeues >= self.max_requeues:
+            return False
+        match = re.search(r"(\d+(?:\.\d+)?) seconds?", error.message or "")
+        delay = float(match.group(1)) if match else self.default_retry_after
+        print(f"Run {run.id} was rate limited, requeueing after {delay:.1f}s")
+        self.pause(delay)
+        return True
+
+    def wrap(self, agents_client: Any) -> "RateLimitedClient":
+        """Route every call made through a sync AgentsClient via this limiter."""
+        return RateLimitedClient(agents_client, self)
+
+    def wrap_async(self, agents_client: Any) -> "RateLimitedClient":
+        """Route every call made through an azure.ai.agents.aio AgentsClient via this limiter."""
+        return RateLimitedClient(agents_client, self, is_async=True)
+
+
+class RateLimitedClient:
+    """Proxy for an AgentsClient (or one of its operation groups) that dispatches through a RateLimiter."""
+
+    def __init__(self, target: Any, rate_limiter: RateLimiter, is_async: bool = False, prefix: str = ""):
+        self._target = target
+        self._is_async = is_async
+        self._prefix = prefix
+        self.rate_limiter = rate_limiter
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._target, name)
+        if name in OPERATION_GROUPS:
+            return RateLimitedClient(attr, self.rate_limiter, self._is_async, prefix=f"{name}.")
+        if not callable(attr) or name.startswith("_"):
+            return attr
+        full_name = self._prefix + name
+        if self._is_async and not inspect.iscoroutinefunction(attr):
+            # List operations return an async pager rather than a coroutine
+            def dispatch_paged(*args, **kwargs):
+                return self.rate_limiter.call_paged(full_name, attr, *args, **kwargs)
+            return dispatch_paged
+        if self._is_async:
+            async def dispatch_async(*args, **kwargs):
+                return await self.rate_limiter.call_async(full_name, attr, *args, **kwargs)
+            return dispatch_async
+
+        def dispatch(*args, **kwargs):
+            return self.rate_limiter.call(full_name, attr, *args, **kwargs)
+        return dispatch
+
+
+def is_rate_limited(error: Exception) -> bool:
+    return isinstance(error, HttpResponseError) and error.status_code == 429
+
+
+def retry_after_seconds(error: HttpResponseError) -> Optional[float]:
+    """Read the server's requested delay from retry-after-ms or Retry-After headers."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    for header in ("retry-after-ms", "x-ms-retry-after-ms"):
+        if headers.get(header):
+            try:
+                return float(headers[header]) / 1000
+            except ValueError:
+                pass
+    value = headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+def create_rate_limiter() -> RateLimiter:
+    """Build a RateLimiter from AGENTS_RPM, AGENTS_TPM and RATE_LIMIT_* environment variables."""
+    return RateLimiter(
+        requests_per_minute=float(os.getenv("AGENTS_RPM", "0")),
+        tokens_per_minute=float(os.getenv("AGENTS_TPM", "0")),
+        max_requeues=int(os.getenv("RATE_LIMIT_MAX_REQUEUES", "10")),
+        token_estimate=int(os.getenv("RATE_LIMIT_TOKEN_ESTIMATE", "5000")),
+    )
@@ -0,0 +1,176 @@
+import os
+import re
+import json
+import hashlib
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+JOURNAL_FILENAME = "batch_results.jsonl"
+RESULTS_FILENAME = "batch_results.json"
+
+
+def normalize_question(question: str) -> str:
+    """Collapse whitespace and case so trivially different copies of a question compare equal."""
+    return re.sub(r"\s+", " ", question).strip().casefold()
+
+
+def question_key(question: str) -> str:
+    """Stable hash of the normalized question, used to key progress and results."""
+    return hashlib.sha256(normalize_question(question).encode("utf-8")).hexdigest()[:32]
+
+
+def result_key(result: Dict) -> str:
+    """Key of a stored result; results written before keys existed are hashed from their question."""
+    return result.get("question_key") or question_key(result["question"])
+
+
+class ResultJournal:
+    """Append-only JSONL journal of finished results, one line per question.
+
+    Every append is flushed and fsync'd, so a crash loses at most the line
+    being written. A torn final line left by a previous crash is trimmed when
+    the journal is reopened, before anything new is appended.
+    """
+
+    def __init__(self, base_path: str, filename: str = JOURNAL_FILENAME):
+        self.path = os.path.join(base_path, filename)
+        self._lock = threading.Lock()
+        _trim_partial_line(self.path)
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    def append(self, result: Dict):
+        """Durably append one result."""
+        self.append_lines([json.dumps(result, ensure_ascii=False)])
+
+    def append_lines(self, lines: List[str]):
+        """Durably append already serialized results with a single fsync."""
+        with self._lock:
+            self._file.write("".join(line + "\n" for line in lines))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _trim_partial_line(path: str):
+    """Truncate a journal back to its last complete line."""
+    if not os.path.exists(path):
+        return
+    with open(path, 'rb+') as f:
+        data = f.read()
+        if not data or data.endswith(b"\n"):
+            return
+        keep = data.rfind(b"\n") + 1
+        print(f"Discarding incomplete trailing record in {path}")
+        f.truncate(keep)
+
+
+def read_journal(path: str) -> Iterator[Dict]:
+    """Yield the results recorded in a journal, skipping lines that cannot be parsed."""
+    if not os.path.exists(path):
+        return
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                print(f"Skipping unreadable journal line {line_number} in {path}")
+
+
+def read_journal_ordered(path: str) -> Iterator[Dict]:
+    """Yield a journal's results by input_index, the last one recorded for a position winning.
+
+    Only the byte offset of each line is held in memory; results are read back
+    one at a time. Results without an input_index follow, in journal order.
+    """
+    if not os.path.exists(path):
+        return
+    offsets: Dict[Tuple[int, int], int] = {}
+    with open(path, 'rb') as f:
+        offset = 0
+        for line_number, line in enumerate(f, 1):
+            try:
+                result = json.loads(line) if line.strip() else None
+            except json.JSONDecodeError:
+                result = None
+                print(f"Skipping unreadable journal line {line_number} in {path}")
+            if result is not None:
+                input_index = result.get("input_index")
+                offsets[(0, input_index) if input_index is not None else (1, line_number)] = offset
+            offset += len(line)
+        for key in sorted(offsets):
+            f.seek(offsets[key])
+            yield json.loads(f.readline())
+
+
+def summarize_result(result: Dict) -> Dict:
+    """Copy of a result without its response text and citations, the bulk of its size.
+
+    Batch runs keep only these summaries in memory; full results stay in the journal.
+    """
+    metrics = {k: v for k, v in result["metrics"].items() if k not in ("response_text", "citations")}
+    return {**result, "metrics": metrics}
+
+
+def write_json_atomic(path: str, data: Any, indent: int = 2):
+    """Write JSON to a temporary file, fsync it and rename it over path."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=indent)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def write_json_array_atomic(path: str, items: Iterable[Any], indent: int = 2) -> int:
+    """Stream items into a JSON array file as write_json_atomic would lay it out; return how many were written."""
+    tmp_path = f"{path}.tmp"
+    count = 0
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for item in items:
+            f.write("[\n" if count == 0 else ",\n")
+            f.write(" " * indent + json.dumps(item, indent=indent).replace("\n", "\n" + " " * indent))
+            count += 1
+        f.write("\n]" if count else "[]")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return count
+
+
+def write_journal_atomic(path: str, results: Iterable[Dict]) -> int:
+    """Stream results into a new journal at path, replacing any journal there; return how many were written."""
+    tmp_path = f"{path}.tmp"
+    count = 0
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for result in results:
+            f.write(json.dumps(result, ensure_ascii=False) + "\n")
+            count += 1
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return count
+
+
+def compact_journal(base_path: str, ordered: bool = False) -> int:
+    """Rewrite the journal as the consolidated batch_results.json and return how many results it holds.
+
+    Results are streamed, so the journal is never loaded whole. With ordered
+    they are written by input_index (see read_journal_ordered) rather than in
+    journal order.
+    """
+    journal_path = os.path.join(base_path, JOURNAL_FILENAME)
+    results = read_journal_ordered(journal_path) if ordered else read_journal(journal_path)
+    return write_json_array_atomic(os.path.join(base_path, RESULTS_FILENAME), results)
@@ -0,0 +1,106 @@
+import json
+import time
+import queue
+import threading
+from typing import Dict, List
+
+from result_journal import ResultJournal
+
+_STOP = object()
+
+
+def write_text(path: str, text: str):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+class ResultWriter:
+    """Writes result files on a background thread so dispatch and polling never wait on disk.
+
+    Callers render a file's contents (or serialize a journal entry) up front
+    and queue it; the worker takes whatever has queued up, up to max_batch
+    items at a time, and appends each journal's lines with a single fsync.
+    A failed write is logged and counted without stopping the others.
+    close() drains the queue before returning, so nothing queued is lost,
+    and prints how long the writes took (write_seconds).
+    """
+
+    def __init__(self, max_batch: int = 64):
+        self.max_batch = max_batch
+        self.written = 0
+        self.failed = 0
+        self.write_seconds = 0.0
+        self._queue: "queue.Queue" = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="result-writer", daemon=True)
+        self._thread.start()
+
+    def write_text(self, path: str, text: str):
+        """Queue text to be written to path."""
+        self._queue.put(("text", path, text))
+
+    def append_journal(self, journal: ResultJournal, result: Dict):
+        """Queue a result to be appended to journal, as it is now."""
+        self._queue.put(("journal", journal, json.dumps(result, ensure_ascii=False)))
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = self._write(batch)
+            for _ in batch:
+                self._queue.task_done()
+            if stop:
+                return
+
+    def _write(self, batch: List) -> bool:
+        """Write a batch of queued items; return True when it holds the stop marker."""
+        stop = False
+        journal_lines: Dict[ResultJournal, List[str]] = {}
+        for item in batch:
+            if item is _STOP:
+                stop = True
+            elif item[0] == "journal":
+                journal_lines.setdefault(item[1], []).append(item[2])
+            else:
+                self._attempt(item[1], write_text, item[1], item[2])
+        for journal, lines in journal_lines.items():
+            self._attempt(journal.path, journal.append_lines, lines, count=len(lines))
+        return stop
+
+    def _attempt(self, target: str, fn, *args, count: int = 1):
+        start = time.monotonic()
+        try:
+            fn(*args)
+            self.written += count
+        except Exception as e:
+            self.failed += count
+            print(f"Could not write {target}: {str(e)}")
+        finally:
+            self.write_seconds += time.monotonic() - start
+
+    def flush(self):
+        """Block until everything queued so far has been written."""
+        self._queue.join()
+
+    def close(self):
+        """Write everything still queued, then stop the worker."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join()
+        if self.failed:
+            print(f"Result writer: {self.failed} writes failed, {self.written} succeeded")
+        if self.written or self.failed:
+            print(f"Result writer: {self.written + self.failed} writes took {self.write_seconds:.2f}s in the background")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,118 @@
+import os
+import math
+import random
+import threading
+from typing import Any, Optional
+
+from azure.core.exceptions import HttpResponseError, ServiceRequestError, ServiceResponseError
+
+TRANSIENT = "transient"
+PERMANENT = "permanent"
+
+# HTTP statuses and run last_error codes worth another attempt
+TRANSIENT_HTTP_STATUSES = (408, 429, 500, 502, 503, 504)
+TRANSIENT_RUN_ERROR_CODES = ("server_error", "rate_limit_exceeded")
+
+
+def classify_exception(error: Exception) -> str:
+    """Classify an exception raised while processing a question as transient or permanent."""
+    if isinstance(error, HttpResponseError):
+        return TRANSIENT if error.status_code in TRANSIENT_HTTP_STATUSES else PERMANENT
+    if isinstance(error, (ServiceRequestError, ServiceResponseError, ConnectionError, TimeoutError)):
+        return TRANSIENT
+    return PERMANENT
+
+
+def classify_run(run: Any) -> Optional[str]:
+    """Classify a finished run: None when it completed, otherwise transient or permanent.
+
+    Only a failed run with a transient error code is worth another attempt. A
+    run we abandoned on our own timeout, or one that was cancelled or expired,
+    would just hit the same limit again.
+    """
+    if run.status == "completed":
+        return None
+    if run.status == "failed":
+        code = getattr(run.last_error, "code", None)
+        return TRANSIENT if code in TRANSIENT_RUN_ERROR_CODES else PERMANENT
+    return PERMANENT
+
+
+class RetryPolicy:
+    """Decides whether a failed question gets another attempt and how long to wait first.
+
+    Only transient failures are retried, at most max_attempts attempts per
+    question, and never more than budget retries across the whole batch (None
+    means unlimited) so a systemic outage cannot multiply the batch's cost.
+    When the batch size is not known up front (streamed input), budget_ratio
+    grows the budget with the number of questions seen so far instead.
+    Backoff is exponential with full jitter.
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        base_delay: float = 2.0,
+        max_delay: float = 60.0,
+        budget: Optional[int] = None,
+        budget_ratio: Optional[float] = None,
+        min_budget: int = 3
+    ):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget
+        self.budget_ratio = budget_ratio
+        self.min_budget = min_budget
+        self.questions_seen = 0
+        self.retries_used = 0
+        self.stopped = False
+        self._lock = threading.Lock()
+
+    def should_retry(self, failure: Optional[str], attempt: int) -> bool:
+        """Return True, consuming one retry from the budget, if attempt number attempt should be retried.
+
+        Called after every attempt, including successful ones (failure None).
+        """
+        with self._lock:
+            if attempt == 1:
+                self.questions_seen += 1
+        if failure != TRANSIENT or attempt >= self.max_attempts or self.stopped:
+            return False
+        with self._lock:
+            budget = self.budget
+            if budget is None and self.budget_ratio is not None:
+                budget = max(self.min_budget, math.ceil(self.questions_seen * self.budget_ratio))
+            if budget is not None and self.retries_used >= budget:
+                print("Retry budget exhausted, not retrying")
+                return False
+            self.retries_used += 1
+            return True
+
+    def stop(self):
+        """Refuse every further retry, as when the batch is shutting down."""
+        self.stopped = True
+
+    def backoff(self, attempt: int) -> float:
+        """Seconds to wait before the attempt after attempt number attempt."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+def create_retry_policy(total_questions: Optional[int] = None) -> RetryPolicy:
+    """Build a RetryPolicy from RETRY_* environment variables.
+
+    The batch budget defaults to 10% of the questions (at least 3 retries),
+    counted as questions arrive when total_questions is unknown.
+    """
+    budget = os.getenv("RETRY_BUDGET")
+    if budget:
+        budget = int(budget)
+    elif total_questions is not None:
+        budget = max(3, math.ceil(total_questions * 0.1))
+    return RetryPolicy(
+        max_attempts=int(os.getenv("RETRY_MAX_ATTEMPTS", "3")),
+        base_delay=float(os.getenv("RETRY_BASE_DELAY_SECONDS", "2")),
+        max_delay=float(os.getenv("RETRY_MAX_DELAY_SECONDS", "60")),
+        budget=budget,
+        budget_ratio=None if budget else 0.1,
+    )
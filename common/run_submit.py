@@ -0,0 +1,56 @@
+import threading
+
+from azure.core.exceptions import HttpResponseError
+from azure.ai.agents.models import AgentThreadCreationOptions, ThreadMessageOptions
+
+CREATE_MODES = ("separate", "combined")
+
+# Responses meaning the service does not offer create_thread_and_run at all
+UNSUPPORTED_HTTP_STATUSES = (404, 405, 501)
+
+
+class CombinedCreate:
+    """Whether new questions on one Agents client start with a single create_thread_and_run call.
+
+    Keep one per client. With mode "combined" the fast path is turned off
+    for that client when its SDK has no create_thread_and_run, or after
+    max_unsupported answers in a row saying the endpoint does not offer it;
+    a single such answer only falls back for that question.
+    """
+
+    def __init__(self, mode: str = "separate", max_unsupported: int = 3):
+        if mode not in CREATE_MODES:
+            raise ValueError(f"Unknown create mode: {mode}")
+        self.mode = mode
+        self.max_unsupported = max_unsupported
+        self.available = mode == "combined"
+        self._unsupported = 0
+        self._lock = threading.Lock()
+
+    def succeeded(self):
+        """Record a successful create_thread_and_run call."""
+        with self._lock:
+            self._unsupported = 0
+
+    def failed(self, error: Exception) -> bool:
+        """Return True if the question should fall back to the three-step path after error.
+
+        A 400 falls back for this question only, since the request itself may
+        be what the service rejected. Anything else (such as throttling or a
+        5xx) is left to the caller's retry handling.
+        """
+        status = getattr(error, "status_code", None)
+        missing = isinstance(error, (AttributeError, TypeError))
+        if missing or (isinstance(error, HttpResponseError) and status in UNSUPPORTED_HTTP_STATUSES):
+            with self._lock:
+                self._unsupported += 1
+                if self.available and (missing or self._unsupported >= self.max_unsupported):
+                    self.available = False
+                    print(f"create_thread_and_run is not available ({str(error)}), using separate calls")
+            return True
+        return isinstance(error, HttpResponseError) and status == 400
+
+
+def thread_options(question: str) -> AgentThreadCreationOptions:
+    """Options for a new thread holding the question as its only user message."""
+    return AgentThreadCreationOptions(messages=[ThreadMessageOptions(role="user", content=question)])
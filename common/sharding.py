@@ -0,0 +1,125 @@
+import os
+import json
+import heapq
+import argparse
+import itertools
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from result_journal import (
+    JOURNAL_FILENAME,
+    RESULTS_FILENAME,
+    question_key,
+    read_journal_ordered,
+    write_journal_atomic,
+    write_json_atomic,
+)
+
+MANIFEST_FILENAME = "shard.json"
+
+
+class Shard:
+    """Shard index of count (1-based) of a question set split across nodes.
+
+    A question belongs to the shard picked by the hash of its normalized text,
+    so every node given the same count agrees on the split without
+    coordinating, whatever order the input is in. Exact duplicates always land
+    in the same shard.
+    """
+
+    def __init__(self, index: int, count: int):
+        if count < 1 or not 1 <= index <= count:
+            raise ValueError(f"Invalid shard {index}/{count}")
+        self.index = index
+        self.count = count
+
+    def __str__(self) -> str:
+        return f"{self.index}/{self.count}"
+
+    def owns(self, question: str) -> bool:
+        return int(question_key(question), 16) % self.count == self.index - 1
+
+
+def parse_shard(spec: str) -> Shard:
+    """argparse type for --shard i/N."""
+    try:
+        index, count = (int(part) for part in spec.split("/"))
+        return Shard(index, count)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected i/N with 1 <= i <= N, got {spec!r}")
+
+
+def select_shard(questions: Iterable[str], shard: Optional[Shard]) -> Iterator[Tuple[int, str]]:
+    """Yield (input_index, question) for the questions in shard.
+
+    input_index is the question's 1-based position in the full input, which
+    is what merged results are ordered by. Without a shard every question is
+    yielded.
+    """
+    for input_index, question in enumerate(questions, 1):
+        if shard is None or shard.owns(question):
+            yield input_index, question
+
+
+def write_shard_manifest(base_path: str, shard: Shard, input_file: str):
+    """Record which shard of which input an output directory holds."""
+    write_json_atomic(os.path.join(base_path, MANIFEST_FILENAME), {
+        "index": shard.index,
+        "count": shard.count,
+        "input_file": input_file,
+    })
+
+
+def iter_shard_results(base_path: str) -> Iterator[Dict]:
+    """Yield a shard's results by input_index from its journal, or from batch_results.json when there is none."""
+    journal_path = os.path.join(base_path, JOURNAL_FILENAME)
+    results_path = os.path.join(base_path, RESULTS_FILENAME)
+    if os.path.exists(journal_path):
+        results = read_journal_ordered(journal_path)
+    elif os.path.exists(results_path):
+        with open(results_path, 'r', encoding='utf-8') as f:
+            results = sorted(json.load(f), key=lambda r: r.get("input_index", 0))
+    else:
+        results = []
+    for result in results:
+        if "input_index" not in result:
+            raise ValueError(f"A result in {base_path} has no input_index; it predates sharding")
+        yield result
+
+
+def merge_shard_results(shard_dirs: List[str], output_dir: str) -> int:
+    """Combine the results of several shard output directories into one journal in global input order.
+
+    Every directory must hold a manifest from the same split and no shard may
+    appear twice; missing shards are reported but do not stop the merge. The
+    shards' journals are merged line by line into output_dir's journal, so no
+    shard is loaded whole. When an input position has more than one result (a
+    resumed shard), the last one wins. Returns how many results were merged.
+    """
+    count = None
+    input_file = None
+    seen: Dict[int, str] = {}
+    for shard_dir in shard_dirs:
+        manifest_path = os.path.join(shard_dir, MANIFEST_FILENAME)
+        if not os.path.exists(manifest_path):
+            raise ValueError(f"{shard_dir} has no {MANIFEST_FILENAME}; was it run with --shard?")
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if count is None:
+            count, input_file = manifest["count"], manifest["input_file"]
+        elif manifest["count"] != count:
+            raise ValueError(f"{shard_dir} is shard {manifest['index']}/{manifest['count']}, expected a split into {count}")
+        elif manifest["input_file"] != input_file:
+            print(f"Warning: {shard_dir} was run on {manifest['input_file']}, not {input_file}")
+        if manifest["index"] in seen:
+            raise ValueError(f"Shard {manifest['index']}/{count} given twice: {seen[manifest['index']]} and {shard_dir}")
+        seen[manifest["index"]] = shard_dir
+
+    missing = sorted(set(range(1, (count or 0) + 1)) - set(seen))
+    if missing:
+        print(f"Warning: shards {', '.join(f'{i}/{count}' for i in missing)} are missing; the merge is incomplete")
+
+    merged = heapq.merge(*(iter_shard_results(shard_dir) for shard_dir in shard_dirs), key=lambda r: r["input_index"])
+    latest = (list(group)[-1] for _, group in itertools.groupby(merged, key=lambda r: r["input_index"]))
+    merged_count = write_journal_atomic(os.path.join(output_dir, JOURNAL_FILENAME), latest)
+    print(f"Merged {merged_count} results from {len(seen)} of {count} shards")
+    return merged_count
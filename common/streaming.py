@@ -0,0 +1,178 @@
+import time
+import threading
+import contextvars
+from typing import Dict, List, Optional
+from azure.ai.agents import AgentsClient
+from azure.ai.agents.models import AgentEventHandler, MessageDeltaChunk, MessageRole, RunStep, ThreadMessage, ThreadRun
+from phase_timing import PhaseTimer
+from token_budget import TokenBudget, run_tokens
+
+# Serializes echoed lines so the streams of concurrent questions never interleave within a line
+_ECHO_LOCK = threading.Lock()
+
+
+class StreamingRunHandler(AgentEventHandler):
+    """Collects a streamed run's output and token timing.
+
+    Time to first token is relative to start_time (wall clock) and deltas are
+    timed on the monotonic clock. With a prefix, whole lines are echoed, each
+    starting with it.
+    """
+
+    def __init__(self, start_time: float, echo: bool = True, prefix: str = "",
+                 phase_timer: Optional[PhaseTimer] = None):
+        super().__init__()
+        self.start_time = start_time
+        # start_time moved onto the monotonic clock the deltas are timed on
+        self._monotonic_start = time.monotonic() - (time.time() - start_time)
+        self.echo = echo
+        self.prefix = prefix
+        self.phase_timer = phase_timer
+        self.first_token_time: Optional[float] = None
+        self.last_token_time: Optional[float] = None
+        self.token_gaps: List[float] = []
+        self.text_parts: List[str] = []
+        self.step_usage: Dict[str, int] = {}
+        self.run: Optional[ThreadRun] = None
+        self.message: Optional[ThreadMessage] = None
+        self.error: Optional[str] = None
+        self.detached = False
+        self._echo_line = ""
+
+    def on_message_delta(self, delta: MessageDeltaChunk):
+        if self.detached:
+            return
+        now = time.monotonic()
+        if self.first_token_time is None:
+            self.first_token_time = now
+        else:
+            self.token_gaps.append(now - self.last_token_time)
+        self.last_token_time = now
+        self.text_parts.append(delta.text)
+        if not self.echo:
+            return
+        if not self.prefix:
+            print(delta.text, end="", flush=True)
+            return
+        *lines, self._echo_line = (self._echo_line + delta.text).split("\n")
+        if lines:
+            with _ECHO_LOCK:
+                for line in lines:
+                    print(f"{self.prefix}{line}", flush=True)
+
+    def end_echo(self):
+        """Finish the echoed output: print a partial last line, or end the line of unprefixed text."""
+        if not self.echo or self.first_token_time is None:
+            return
+        if not self.prefix:
+            print()
+        elif self._echo_line:
+            with _ECHO_LOCK:
+                print(f"{self.prefix}{self._echo_line}", flush=True)
+            self._echo_line = ""
+
+    def on_thread_message(self, message: ThreadMessage):
+        # The completed message carries the full text and the citation annotations
+        if not self.detached and message.role == MessageRole.AGENT and message.status == "completed":
+            self.message = message
+
+    def on_thread_run(self, run: ThreadRun):
+        if self.detached:
+            return
+        self.run = run
+        if self.phase_timer:
+            self.phase_timer.run_status(run.status)
+
+    def on_run_step(self, step: RunStep):
+        if not self.detached and step.status == "completed":
+            self.step_usage[step.id] = run_tokens(step)
+
+    def on_error(self, data: str):
+        self.error = data
+        print(f"\nStream error: {data}")
+
+    @property
+    def time_to_first_token(self) -> Optional[float]:
+        if self.first_token_time is None:
+            return None
+        return self.first_token_time - self._monotonic_start
+
+    @property
+    def inter_token_latency(self) -> Optional[float]:
+        if not self.token_gaps:
+            return None
+        return sum(self.token_gaps) / len(self.token_gaps)
+
+    @property
+    def step_tokens(self) -> int:
+        return sum(self.step_usage.values())
+
+    @property
+    def response_text(self) -> str:
+        return "".join(self.text_parts)
+
+    def metrics(self) -> Dict:
+        """Streaming-specific metrics to merge into a result's metrics dict."""
+        return {
+            "inter_token_latency": self.inter_token_latency,
+            "stream_chunks": len(self.text_parts),
+        }
+
+
+def stream_run(
+    agents_client: AgentsClient,
+    thread_id: str,
+    agent_id: str,
+    start_time: float,
+    timeout: float,
+    echo: bool = True,
+    prefix: str = "",
+    phase_timer: Optional[PhaseTimer] = None,
+    token_budget: Optional[TokenBudget] = None
+) -> StreamingRunHandler:
+    """Create a run on the thread and consume its event stream instead of polling.
+
+    The run is cancelled, and the partial output returned, at the timeout or
+    once over token_budget's per-question cap. An error raised by the stream is re-raised.
+    """
+    handler = StreamingRunHandler(start_time, echo=echo, prefix=prefix, phase_timer=phase_timer)
+    errors: List[BaseException] = []
+
+    def cancel(reason: str):
+        print(f"\n{prefix}{reason} while streaming, aborting run.")
+        if handler.run is not None:
+            try:
+                handler.run = agents_client.runs.cancel(thread_id=thread_id, run_id=handler.run.id)
+                print(f"Run {handler.run.id} canceled")
+            except Exception as cancel_error:
+                print(f"Error canceling run: {str(cancel_error)}")
+
+    def consume():
+        try:
+            with agents_client.runs.stream(thread_id=thread_id, agent_id=agent_id, event_handler=handler) as stream:
+                for _ in stream:
+                    if handler.detached:
+                        break
+                    cap_error = (
+                        token_budget.check_tokens(handler.run, handler.step_tokens)
+                        if token_budget and handler.run is not None else None
+                    )
+                    if cap_error:
+                        cancel(cap_error)
+                        break
+        except Exception as e:
+            errors.append(e)
+
+    # The reader runs in a copy of this context, so its calls count towards the caller's count_calls()
+    reader = threading.Thread(target=contextvars.copy_context().run, args=(consume,), name="run-stream", daemon=True)
+    reader.start()
+    reader.join(timeout)
+    if reader.is_alive():
+        handler.detached = True
+        cancel(f"Timeout after {timeout}s")
+    if phase_timer:
+        phase_timer.end_run()
+    handler.end_echo()
+    if errors:
+        raise errors[0]
+    return handler
@@ -0,0 +1,87 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from batch_deadline import BatchDeadline, create_batch_deadline, parse_deadline
+
+NOW = datetime(2025, 6, 30, 17, 0)
+
+
+def completed(total_time, **metrics):
+    return {"status": "completed", "metrics": {"total_time": total_time, **metrics}}
+
+
+def test_parse_durations():
+    assert parse_deadline("5400", NOW) == 5400
+    assert parse_deadline("90m", NOW) == 5400
+    assert parse_deadline("1h30m", NOW) == 5400
+    assert parse_deadline("2h", NOW) == 7200
+    assert parse_deadline("1m30s", NOW) == 90
+
+
+def test_parse_times():
+    assert parse_deadline("18:30", NOW) == 5400
+    # A time already past today means tomorrow
+    assert parse_deadline("16:00", NOW) == 23 * 3600
+    assert parse_deadline("2025-06-30T18:00", NOW) == 3600
+
+    aware = datetime(2025, 6, 30, 17, 0, tzinfo=timezone.utc)
+    assert parse_deadline("2025-06-30T19:00+01:00", aware) == 3600
+
+
+def test_parse_rejects_garbage():
+    for value in ("", "soon", "25:99", "1x"):
+        with pytest.raises(ValueError):
+            parse_deadline(value, NOW)
+    with pytest.raises(ValueError, match="already passed"):
+        create_batch_deadline((datetime.now() - timedelta(hours=1)).isoformat())
+    assert create_batch_deadline(None) is None
+
+
+def test_time_left_is_shared_among_unfinished_questions():
+    deadline = BatchDeadline(1000, max_timeout=300, concurrency=2, min_question_seconds=60)
+    deadline.plan(20)
+    # 1000s for 20 questions two at a time
+    assert deadline.start() == pytest.approx(100, abs=1)
+
+    # Fewer questions left means a larger share, capped at max_timeout
+    deadline.plan(4)
+    assert deadline.start() == 300
+
+
+def test_share_never_drops_below_what_a_question_needs():
+    deadline = BatchDeadline(1000, max_timeout=300, min_question_seconds=60)
+    deadline.plan(100)
+    assert deadline.start() == 60
+
+    # Once runs are seen taking 100s, a question is given 1.5 times that
+    deadline.settle(completed(100))
+    assert deadline.needed_seconds() == 150
+    assert deadline.start() == 150
+
+
+def test_cache_hits_and_duplicates_do_not_move_the_mean():
+    deadline = BatchDeadline(1000, max_timeout=300, min_question_seconds=10)
+    deadline.settle(completed(100))
+    deadline.settle(completed(1, cache_hit=True))
+    deadline.settle(completed(0.5, duplicate_of="Question"))
+    deadline.settle({"status": "error", "metrics": {"total_time": 2}})
+    assert deadline.finished == 4
+    assert deadline.needed_seconds() == 150
+
+
+def test_questions_are_skipped_when_too_little_time_is_left():
+    deadline = BatchDeadline(30, max_timeout=300, min_question_seconds=60)
+    assert deadline.start() is None
+    assert deadline.start() is None
+    deadline.skip(3)
+    assert deadline.skipped == 5
+    assert deadline.summary().endswith("5 questions not started")
+
+
+def test_skipped_questions_leave_their_share_to_the_rest():
+    deadline = BatchDeadline(1000, max_timeout=1000, min_question_seconds=10)
+    deadline.plan(10)
+    assert deadline.start() == pytest.approx(100, abs=1)
+    deadline.skip(5)
+    assert deadline.start() == pytest.approx(200, abs=1)
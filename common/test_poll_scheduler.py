@@ -0,0 +1,65 @@
+import os
+import json
+import tempfile
+
+from poll_scheduler import AdaptivePollScheduler, FixedPollScheduler
+
+
+def count_polls(scheduler, duration):
+    """Number of runs.get calls the scheduler makes for a run of the given duration."""
+    elapsed = 0
+    polls = 0
+    while elapsed < duration:
+        elapsed += scheduler.next_interval(elapsed)
+        polls += 1
+    return polls
+
+
+def test_fixed_scheduler_polls_every_interval():
+    assert count_polls(FixedPollScheduler(interval=1.0), 300) == 300
+
+
+def test_adaptive_scheduler_learns_expected_duration():
+    history_file = os.path.join(tempfile.mkdtemp(), "run_durations.json")
+    scheduler = AdaptivePollScheduler(history_file=history_file, key="test")
+    for duration in (280, 300, 320):
+        scheduler.record(duration)
+
+    # History is persisted and reloaded per key
+    reloaded = AdaptivePollScheduler(history_file=history_file, key="test")
+    assert reloaded.expected_duration() == 300
+    assert AdaptivePollScheduler(history_file=history_file, key="other").expected_duration() is None
+
+    # Polls tighten near the expected completion time and stay an order of magnitude below 1/s
+    assert reloaded.next_interval(300) < reloaded.next_interval(150)
+    assert count_polls(reloaded, 300) <= 30
+
+
+def test_adaptive_scheduler_appends_history_from_several_processes():
+    history_file = os.path.join(tempfile.mkdtemp(), "run_durations.json")
+    # Two schedulers loaded before either records stand in for two processes sharing the file
+    first = AdaptivePollScheduler(history_file=history_file, key="test")
+    second = AdaptivePollScheduler(history_file=history_file, key="test")
+    first.record(100)
+    second.record(200)
+    first.record(300)
+
+    assert AdaptivePollScheduler(history_file=history_file, key="test").expected_duration() == 200
+
+
+def test_adaptive_scheduler_reads_and_compacts_legacy_history():
+    history_file = os.path.join(tempfile.mkdtemp(), "run_durations.json")
+    with open(history_file, "w", encoding="utf-8") as f:
+        json.dump({"test": [100, 200, 300]}, f)
+
+    scheduler = AdaptivePollScheduler(history_file=history_file, key="test", history_size=2)
+    assert scheduler.expected_duration() == 250
+    scheduler.record(400)
+
+    with open(history_file, encoding="utf-8") as f:
+        assert [json.loads(line) for line in f] == [
+            {"key": "test", "duration": 200},
+            {"key": "test", "duration": 300},
+            {"key": "test", "duration": 400},
+        ]
+    assert AdaptivePollScheduler(history_file=history_file, key="test", history_size=2).expected_duration() == 350
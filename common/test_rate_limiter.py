@@ -0,0 +1,135 @@
+import time
+import asyncio
+from email.utils import formatdate
+from types import SimpleNamespace
+
+import pytest
+from azure.core.exceptions import HttpResponseError
+
+from rate_limiter import RateLimiter, count_calls, retry_after_seconds
+
+
+class Response:
+    """Just enough of an HTTP response for HttpResponseError."""
+
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.reason = "Too Many Requests" if status_code == 429 else "Error"
+        self.headers = headers or {}
+
+    def text(self, encoding=None):
+        return ""
+
+
+def http_error(status_code, headers=None):
+    return HttpResponseError(message="error", response=Response(status_code, headers))
+
+
+def failing(errors, result=None):
+    """A call that raises each of errors in turn and then returns result."""
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return result
+    fn.calls = calls
+    return fn
+
+
+def test_retry_after_headers():
+    assert retry_after_seconds(http_error(429, {"retry-after-ms": "1500"})) == 1.5
+    assert retry_after_seconds(http_error(429, {"x-ms-retry-after-ms": "250"})) == 0.25
+    assert retry_after_seconds(http_error(429, {"Retry-After": "7"})) == 7
+    assert retry_after_seconds(http_error(429, {"Retry-After": "soon"})) is None
+    assert retry_after_seconds(http_error(429)) is None
+
+    # An HTTP date is turned into the seconds left until then
+    delay = retry_after_seconds(http_error(429, {"Retry-After": formatdate(time.time() + 30, usegmt=True)}))
+    assert 25 < delay <= 30
+
+
+def test_throttled_call_pauses_for_retry_after_and_is_requeued():
+    limiter = RateLimiter()
+    fn = failing([http_error(429, {"retry-after-ms": "100"})], result="done")
+    start = time.monotonic()
+    assert limiter.call("threads.create", fn) == "done"
+    assert time.monotonic() - start >= 0.1
+    assert len(fn.calls) == 2
+    assert limiter.throttled == 1
+
+
+def test_requeues_are_capped_and_other_errors_raised():
+    limiter = RateLimiter(max_requeues=2, default_retry_after=0.01)
+    fn = failing([http_error(429)] * 5)
+    with pytest.raises(HttpResponseError):
+        limiter.call("threads.create", fn)
+    assert len(fn.calls) == 3
+
+    fn = failing([http_error(500)])
+    with pytest.raises(HttpResponseError):
+        limiter.call("threads.create", fn)
+    assert len(fn.calls) == 1
+
+
+def test_failed_run_start_refunds_reserved_tokens():
+    limiter = RateLimiter(tokens_per_minute=10000, token_estimate=5000)
+    fn = failing([http_error(429, {"retry-after-ms": "1"})], result=SimpleNamespace(id="run_1"))
+    limiter.call("runs.create", fn)
+
+    # Only the run that started still holds its estimate
+    assert limiter.tokens.reserve(5000) == 0
+    assert limiter.tokens.reserve(1000) > 0
+
+
+def test_exception_refunds_reserved_tokens():
+    limiter = RateLimiter(tokens_per_minute=10000, token_estimate=5000)
+    with pytest.raises(ConnectionError):
+        limiter.call("runs.create", failing([ConnectionError("reset")]))
+    assert limiter.tokens.reserve(10000) == 0
+
+
+def test_async_call_refunds_and_requeues():
+    limiter = RateLimiter(tokens_per_minute=10000, token_estimate=5000)
+    errors = [http_error(429, {"retry-after-ms": "1"})]
+
+    async def create():
+        if errors:
+            raise errors.pop()
+        return SimpleNamespace(id="run_1")
+
+    assert asyncio.run(limiter.call_async("runs.create", create)).id == "run_1"
+    assert limiter.throttled == 1
+    assert limiter.tokens.reserve(5000) == 0
+
+
+def test_finished_run_settles_reservation_against_usage():
+    limiter = RateLimiter(tokens_per_minute=10000, token_estimate=5000)
+    limiter.call("runs.create", lambda: SimpleNamespace(id="run_1"))
+    usage = SimpleNamespace(prompt_tokens=800, completion_tokens=200)
+    limiter.call("runs.get", lambda: SimpleNamespace(id="run_1", status="completed", usage=usage))
+
+    # The estimate moves to the real cost and the unused tokens are given back
+    assert limiter.estimate_run_tokens() == 1000
+    assert limiter.tokens.reserve(9000) == 0
+
+
+def test_rate_limited_run_is_requeued_after_the_suggested_delay():
+    limiter = RateLimiter(max_requeues=1)
+    error = SimpleNamespace(code="rate_limit_exceeded", message="Rate limit reached. Try again in 2 seconds.")
+    run = SimpleNamespace(id="run_1", status="failed", last_error=error)
+    assert limiter.requeue_throttled_run(run, requeues=0)
+    assert 1.5 < limiter._paused_until - time.monotonic() <= 2
+    assert not limiter.requeue_throttled_run(run, requeues=1)
+
+    other = SimpleNamespace(id="run_2", status="failed", last_error=SimpleNamespace(code="server_error", message=""))
+    assert not limiter.requeue_throttled_run(other, requeues=0)
+
+
+def test_count_calls_includes_requeued_attempts():
+    limiter = RateLimiter(default_retry_after=0.01)
+    with count_calls() as counter:
+        limiter.call("threads.create", failing([http_error(429)], result="done"))
+        limiter.call("threads.create", lambda: "done")
+    assert counter.calls == 3
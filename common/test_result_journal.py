@@ -0,0 +1,88 @@
+import os
+import json
+import tempfile
+
+from result_journal import (
+    JOURNAL_FILENAME,
+    RESULTS_FILENAME,
+    ResultJournal,
+    compact_journal,
+    question_key,
+    read_journal,
+    read_journal_ordered,
+    result_key,
+    summarize_result,
+    write_journal_atomic,
+)
+
+
+def result(input_index, question=None, status="completed"):
+    question = question or f"Question {input_index}"
+    return {
+        "input_index": input_index,
+        "question": question,
+        "question_key": question_key(question),
+        "status": status,
+        "metrics": {"response_text": "A long answer " * 100, "citations": [{"url": "https://example.com"}], "total_tokens": 42},
+    }
+
+
+def test_journal_survives_a_torn_last_line():
+    base_path = tempfile.mkdtemp()
+    with ResultJournal(base_path) as journal:
+        journal.append(result(0))
+        journal.append(result(1))
+    journal_path = os.path.join(base_path, JOURNAL_FILENAME)
+    with open(journal_path, 'a', encoding='utf-8') as f:
+        f.write('{"input_index": 2, "quest')
+
+    # Reopening to resume trims the partial record before appending
+    with ResultJournal(base_path) as journal:
+        journal.append(result(3))
+    assert [r["input_index"] for r in read_journal(journal_path)] == [0, 1, 3]
+
+
+def test_read_journal_ordered_keeps_the_last_result_per_position():
+    base_path = tempfile.mkdtemp()
+    journal_path = os.path.join(base_path, JOURNAL_FILENAME)
+    write_journal_atomic(journal_path, [
+        result(2), result(0, status="error"), {**result(9), "input_index": None}, result(1), result(0),
+    ])
+    ordered = list(read_journal_ordered(journal_path))
+    assert [r["input_index"] for r in ordered] == [0, 1, 2, None]
+    assert ordered[0]["status"] == "completed"
+
+
+def test_compact_journal_writes_results_in_input_order():
+    base_path = tempfile.mkdtemp()
+    write_journal_atomic(os.path.join(base_path, JOURNAL_FILENAME), [result(i) for i in (3, 1, 2, 0)])
+
+    assert compact_journal(base_path, ordered=True) == 4
+    with open(os.path.join(base_path, RESULTS_FILENAME), encoding='utf-8') as f:
+        assert [r["input_index"] for r in json.load(f)] == [0, 1, 2, 3]
+
+    assert compact_journal(base_path) == 4
+    with open(os.path.join(base_path, RESULTS_FILENAME), encoding='utf-8') as f:
+        assert [r["input_index"] for r in json.load(f)] == [3, 1, 2, 0]
+
+
+def test_compact_empty_journal():
+    base_path = tempfile.mkdtemp()
+    assert compact_journal(base_path) == 0
+    with open(os.path.join(base_path, RESULTS_FILENAME), encoding='utf-8') as f:
+        assert json.load(f) == []
+
+
+def test_summary_drops_response_text_and_citations():
+    summary = summarize_result(result(0))
+    assert summary["metrics"] == {"total_tokens": 42}
+    assert summary["question_key"] == result(0)["question_key"]
+
+
+def test_resume_keys_ignore_case_and_whitespace():
+    assert question_key("What is  the\tcapital of France?") == question_key(" what is the capital of france? ")
+    assert question_key("Capital of France?") != question_key("Capital of Spain?")
+
+    # Results written before keys existed are keyed from their question
+    legacy = {"question": "Capital of France?", "metrics": {}}
+    assert result_key(legacy) == question_key("capital of france?")
@@ -0,0 +1,102 @@
+from types import SimpleNamespace
+
+from azure.core.exceptions import HttpResponseError, ServiceRequestError
+
+from question_runner import Attempt
+from retry_policy import PERMANENT, TRANSIENT, RetryPolicy, classify_exception, classify_run
+
+
+class Response:
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.reason = "Error"
+        self.headers = {}
+
+    def text(self, encoding=None):
+        return ""
+
+
+def run(status, code=None):
+    return SimpleNamespace(id="run_1", status=status, last_error=SimpleNamespace(code=code) if code else None)
+
+
+def test_classify_run():
+    assert classify_run(run("completed")) is None
+    assert classify_run(run("failed", "server_error")) == TRANSIENT
+    assert classify_run(run("failed", "rate_limit_exceeded")) == TRANSIENT
+    assert classify_run(run("failed", "invalid_prompt")) == PERMANENT
+
+    # Runs we gave up on at our own timeout, and cancelled or expired runs, would hit the same limit again
+    for status in ("queued", "in_progress", "cancelled", "expired"):
+        assert classify_run(run(status)) == PERMANENT
+
+
+def test_classify_exception():
+    for status_code in (408, 429, 500, 503):
+        assert classify_exception(HttpResponseError(response=Response(status_code))) == TRANSIENT
+    for status_code in (400, 401, 404):
+        assert classify_exception(HttpResponseError(response=Response(status_code))) == PERMANENT
+    assert classify_exception(ServiceRequestError("connection refused")) == TRANSIENT
+    assert classify_exception(ConnectionError()) == TRANSIENT
+    assert classify_exception(TimeoutError()) == TRANSIENT
+    assert classify_exception(ValueError("bad input")) == PERMANENT
+
+
+def test_only_transient_failures_are_retried_up_to_max_attempts():
+    policy = RetryPolicy(max_attempts=3)
+    assert not policy.should_retry(None, 1)
+    assert not policy.should_retry(PERMANENT, 1)
+    assert policy.should_retry(TRANSIENT, 1)
+    assert policy.should_retry(TRANSIENT, 2)
+    assert not policy.should_retry(TRANSIENT, 3)
+    assert policy.retries_used == 2
+
+
+def test_batch_budget_limits_retries_across_questions():
+    policy = RetryPolicy(max_attempts=5, budget=2)
+    assert policy.should_retry(TRANSIENT, 1)
+    assert policy.should_retry(TRANSIENT, 1)
+    assert not policy.should_retry(TRANSIENT, 1)
+    assert policy.retries_used == 2
+
+
+def test_budget_ratio_grows_with_questions_seen():
+    policy = RetryPolicy(max_attempts=5, budget_ratio=0.1, min_budget=1)
+    assert policy.should_retry(TRANSIENT, 1)
+    assert not policy.should_retry(TRANSIENT, 2)
+
+    # Nineteen more questions raise the budget to two retries
+    for _ in range(19):
+        policy.should_retry(None, 1)
+    assert policy.should_retry(TRANSIENT, 2)
+    assert not policy.should_retry(TRANSIENT, 3)
+
+
+def test_stop_refuses_further_retries():
+    policy = RetryPolicy()
+    policy.stop()
+    assert not policy.should_retry(TRANSIENT, 1)
+
+
+def test_backoff_is_bounded():
+    policy = RetryPolicy(base_delay=2.0, max_delay=5.0)
+    assert all(0 <= policy.backoff(1) <= 2.0 for _ in range(100))
+    assert all(0 <= policy.backoff(10) <= 5.0 for _ in range(100))
+
+
+def test_attempt_failure_reason():
+    attempt = Attempt()
+    assert attempt.failure_reason() is None
+
+    attempt.failure = PERMANENT
+    attempt.run = run("in_progress")
+    assert attempt.failure_reason() == "timed out while in_progress"
+    attempt.run = run("failed", "server_error")
+    assert attempt.failure_reason() == "failed: server_error"
+    attempt.run = run("expired")
+    assert attempt.failure_reason() == "expired"
+
+    attempt.cap_error = "Token cap of 1000 reached"
+    assert attempt.failure_reason() == "Token cap of 1000 reached"
+    attempt.error = ConnectionError("reset")
+    assert attempt.failure_reason() == "ConnectionError: reset"
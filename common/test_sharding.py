@@ -0,0 +1,81 @@
+import os
+import argparse
+import tempfile
+
+import pytest
+
+from result_journal import JOURNAL_FILENAME, read_journal, write_journal_atomic
+from sharding import Shard, merge_shard_results, parse_shard, select_shard, write_shard_manifest
+
+QUESTIONS = [f"Question about subject {i}" for i in range(200)]
+
+
+def test_shards_partition_the_input():
+    shards = [list(select_shard(QUESTIONS, Shard(i, 3))) for i in (1, 2, 3)]
+    indices = sorted(input_index for shard in shards for input_index, _ in shard)
+    assert indices == list(range(1, len(QUESTIONS) + 1))
+    assert all(shard for shard in shards)
+
+    # input_index is the 1-based position in the full input
+    for input_index, question in shards[0]:
+        assert QUESTIONS[input_index - 1] == question
+
+
+def test_shard_choice_ignores_input_order_and_trivial_differences():
+    shard = Shard(2, 4)
+    owned = {question for _, question in select_shard(QUESTIONS, shard)}
+    assert owned == {question for _, question in select_shard(reversed(QUESTIONS), shard)}
+    assert all(shard.owns(f"  {question.upper()} ") for question in owned)
+
+
+def test_no_shard_selects_everything():
+    assert [i for i, _ in select_shard(QUESTIONS[:3], None)] == [1, 2, 3]
+
+
+def test_parse_shard():
+    assert str(parse_shard("2/5")) == "2/5"
+    for spec in ("0/3", "4/3", "1", "a/b"):
+        with pytest.raises(argparse.ArgumentTypeError):
+            parse_shard(spec)
+
+
+def write_shard(index, count, results, input_file="questions.jsonl"):
+    shard_dir = tempfile.mkdtemp()
+    write_shard_manifest(shard_dir, Shard(index, count), input_file)
+    write_journal_atomic(os.path.join(shard_dir, JOURNAL_FILENAME), results)
+    return shard_dir
+
+
+def result(input_index, status="completed"):
+    return {"input_index": input_index, "question": f"Question {input_index}", "status": status}
+
+
+def test_merge_orders_results_globally_and_keeps_the_last_per_position():
+    shard_1 = write_shard(1, 2, [result(3), result(1, "error"), result(1)])
+    shard_2 = write_shard(2, 2, [result(4), result(2)])
+    output_dir = tempfile.mkdtemp()
+
+    assert merge_shard_results([shard_2, shard_1], output_dir) == 4
+    merged = list(read_journal(os.path.join(output_dir, JOURNAL_FILENAME)))
+    assert [r["input_index"] for r in merged] == [1, 2, 3, 4]
+    assert merged[0]["status"] == "completed"
+
+
+def test_merge_reports_missing_shards(capsys):
+    assert merge_shard_results([write_shard(1, 3, [result(1)])], tempfile.mkdtemp()) == 1
+    assert "shards 2/3, 3/3 are missing" in capsys.readouterr().out
+
+
+def test_merge_rejects_mismatched_shards():
+    with pytest.raises(ValueError, match="expected a split into 2"):
+        merge_shard_results([write_shard(1, 2, []), write_shard(2, 3, [])], tempfile.mkdtemp())
+    with pytest.raises(ValueError, match="given twice"):
+        merge_shard_results([write_shard(1, 2, []), write_shard(1, 2, [])], tempfile.mkdtemp())
+    with pytest.raises(ValueError, match="no shard.json"):
+        merge_shard_results([tempfile.mkdtemp()], tempfile.mkdtemp())
+
+
+def test_merge_rejects_results_without_input_index():
+    shard_dir = write_shard(1, 1, [{"question": "Question", "status": "completed"}])
+    with pytest.raises(ValueError, match="predates sharding"):
+        merge_shard_results([shard_dir], tempfile.mkdtemp())
@@ -0,0 +1,111 @@
+import asyncio
+from types import SimpleNamespace
+
+from token_budget import ADMIT, STOP, WAIT, TokenBudget
+
+
+def usage(tokens):
+    return SimpleNamespace(prompt_tokens=tokens, completion_tokens=0)
+
+
+def run(status="in_progress", tokens=None, run_id="run_1"):
+    return SimpleNamespace(id=run_id, thread_id="thread_1", status=status, usage=usage(tokens) if tokens else None)
+
+
+def finished(tokens):
+    return {"status": "completed", "metrics": {"total_tokens": tokens}}
+
+
+class StepsClient:
+    """Stands in for an AgentsClient whose run_steps.list reports steps of the given sizes."""
+
+    def __init__(self, *step_tokens):
+        self.steps = [SimpleNamespace(usage=usage(tokens)) for tokens in step_tokens]
+        self.calls = 0
+        self.run_steps = SimpleNamespace(list=self.list)
+
+    def list(self, thread_id, run_id):
+        self.calls += 1
+        return self.steps
+
+
+def test_admit_projects_spend_from_the_average_run():
+    budget = TokenBudget(max_total_tokens=10000, token_estimate=3000)
+    assert budget.admit() == ADMIT
+    assert budget.admit() == ADMIT
+    assert budget.admit() == ADMIT
+    # A fourth question in flight would project past the budget
+    assert budget.admit() == WAIT
+
+    for _ in range(3):
+        budget.settle(finished(2000))
+    assert budget.average_tokens() == 2000
+    assert budget.admit() == ADMIT
+    budget.settle(finished(2000))
+
+    # 8000 spent and 2000 expected for the next: 10000 is still within budget, then nothing fits
+    assert budget.admit() == ADMIT
+    budget.settle(finished(2500))
+    assert budget.admit() == STOP
+    assert budget.admit() == STOP
+    assert budget.exhausted
+    assert budget.skipped == 2
+
+
+def test_skip_counts_questions_never_offered_to_admit():
+    budget = TokenBudget(max_total_tokens=100)
+    budget.skip(4)
+    assert budget.skipped == 4
+    assert budget.summary().endswith("4 questions not started")
+
+
+def test_no_total_limit_always_admits():
+    budget = TokenBudget(max_tokens_per_question=1000)
+    assert all(budget.admit() == ADMIT for _ in range(100))
+
+
+def test_check_tokens_enforces_the_per_question_cap():
+    budget = TokenBudget(max_tokens_per_question=1000)
+    assert budget.check_tokens(run(), 1000) is None
+    error = budget.check_tokens(run(), 1001)
+    assert "over the per-question cap of 1000" in error
+    assert budget.over_cap_error(run()) == error
+    assert budget.over_cap_error(run()) is None
+
+    # Finished runs are not watched, and the run's own usage counts when it is larger
+    assert budget.check_tokens(run("completed"), 5000) is None
+    assert budget.check_tokens(run(tokens=2000), 0) is not None
+
+
+def test_steps_are_listed_once_per_interval():
+    client = StepsClient(600, 600)
+    budget = TokenBudget(max_tokens_per_question=1000, step_check_seconds=3600)
+    for _ in range(5):
+        assert budget.check_run(client, run()) is None
+    assert client.calls == 0
+
+    budget = TokenBudget(max_tokens_per_question=1000, step_check_seconds=0)
+    assert "1200 tokens" in budget.check_run(client, run())
+    assert client.calls == 1
+
+
+def test_runs_reporting_usage_are_not_listed():
+    client = StepsClient(600)
+    budget = TokenBudget(max_tokens_per_question=1000, step_check_seconds=0)
+    assert budget.check_run(client, run(tokens=500)) is None
+    assert budget.check_run(client, run("completed")) is None
+    assert client.calls == 0
+
+    # Without a per-question cap nothing is listed either
+    assert TokenBudget(max_total_tokens=1000, step_check_seconds=0).check_run(client, run()) is None
+    assert client.calls == 0
+
+
+def test_check_run_async_lists_steps():
+    async def steps():
+        for tokens in (700, 700):
+            yield SimpleNamespace(usage=usage(tokens))
+
+    client = SimpleNamespace(run_steps=SimpleNamespace(list=lambda thread_id, run_id: steps()))
+    budget = TokenBudget(max_tokens_per_question=1000, step_check_seconds=0)
+    assert "1400 tokens" in asyncio.run(budget.check_run_async(client, run()))
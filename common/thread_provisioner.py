@@ -0,0 +1,147 @@
+import os
+import threading
+import concurrent.futures
+from collections import deque
+from typing import Any, Optional
+
+
+class ThreadProvisioner:
+    """Keeps a number of empty agent threads created ahead of time.
+
+    Background workers top the pool up to size threads, so acquire() hands
+    one out without a threads.create round trip on the caller's critical
+    path. When the pool is empty acquire() falls back to creating a thread
+    inline. With limit, no more than limit threads are pre-created in all.
+    Threads still unused when close() is called are deleted.
+    """
+
+    def __init__(
+        self,
+        agents_client: Any,
+        size: int = 4,
+        workers: int = 2,
+        retry_delay: float = 5.0,
+        limit: Optional[int] = None
+    ):
+        self.agents_client = agents_client
+        self.size = size
+        self.limit = limit
+        self.retry_delay = retry_delay
+        self.hits = 0
+        self.misses = 0
+        self._ready = deque()
+        self._creating = 0
+        self._created = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._workers = [
+            threading.Thread(target=self._fill, name=f"thread-provisioner-{n}", daemon=True)
+            for n in range(max(1, min(workers, size)))
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def _fill(self):
+        while True:
+            with self._cond:
+                while not self._closed and not self._wants_thread():
+                    self._cond.wait()
+                if self._closed:
+                    return
+                self._creating += 1
+                self._created += 1
+            try:
+                thread_id = self.agents_client.threads.create().id
+            except Exception as e:
+                print(f"Could not pre-create a thread: {str(e)}")
+                with self._cond:
+                    self._creating -= 1
+                    self._created -= 1
+                    self._cond.wait(self.retry_delay)
+                continue
+            with self._cond:
+                self._creating -= 1
+                if not self._closed:
+                    self._ready.append(thread_id)
+                    continue
+            # Closed while the thread was being created
+            self._delete(thread_id)
+            return
+
+    def _wants_thread(self) -> bool:
+        if self.limit is not None and self._created >= self.limit:
+            return False
+        return len(self._ready) + self._creating < self.size
+
+    def try_acquire(self) -> Optional[str]:
+        """Return the id of a pre-created thread, or None (counted as a miss) when none is ready."""
+        with self._cond:
+            if not self._ready:
+                self.misses += 1
+                return None
+            self.hits += 1
+            thread_id = self._ready.popleft()
+            self._cond.notify_all()
+            return thread_id
+
+    def acquire(self) -> str:
+        """Return the id of an empty thread, pre-created when one is ready."""
+        return self.try_acquire() or self.agents_client.threads.create().id
+
+    def _delete(self, thread_id: str):
+        try:
+            self.agents_client.threads.delete(thread_id)
+        except Exception as e:
+            print(f"Could not delete unused thread {thread_id}: {str(e)}")
+
+    def close(self):
+        """Stop pre-creating threads and delete the ones that were never handed out."""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            unused = list(self._ready)
+            self._ready.clear()
+            self._cond.notify_all()
+        if unused:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=min(8, len(unused))) as executor:
+                list(executor.map(self._delete, unused))
+        # Workers still creating a thread delete it themselves once it arrives
+        for worker in self._workers:
+            worker.join(timeout=10.0)
+        print(f"Thread pool: {self.hits} pre-warmed, {self.misses} created on demand, {len(unused)} unused deleted")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def new_thread_id(agents_client: Any, provisioner: Optional[ThreadProvisioner] = None) -> str:
+    """Take a thread from the provisioner when there is one, otherwise create it."""
+    if provisioner is not None:
+        return provisioner.acquire()
+    return agents_client.threads.create().id
+
+
+def create_thread_provisioner(
+    agents_client: Any,
+    size: Optional[int] = None,
+    default_size: int = 2,
+    limit: Optional[int] = None
+) -> Optional[ThreadProvisioner]:
+    """Start a ThreadProvisioner of size threads; None when size is 0.
+
+    size defaults to PREWARM_THREADS, then to default_size; PREWARM_WORKERS
+    sets how many threads are created in parallel. agents_client must be a
+    sync client; async callers take threads with try_acquire().
+    """
+    if size is None:
+        size = int(os.getenv("PREWARM_THREADS", str(default_size)))
+    if limit is not None:
+        size = min(size, limit)
+    if size <= 0:
+        return None
+    print(f"Pre-warming a pool of {size} agent threads")
+    return ThreadProvisioner(agents_client, size=size, workers=int(os.getenv("PREWARM_WORKERS", "2")), limit=limit)
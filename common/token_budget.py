@@ -0,0 +1,187 @@
+import os
+import time
+import threading
+from typing import Any, Dict, Iterable, Optional
+
+# Dispatch decisions returned by TokenBudget.admit
+ADMIT = "admit"
+WAIT = "wait"
+STOP = "stop"
+
+ACTIVE_RUN_STATUSES = ("queued", "in_progress")
+BUDGET_EXHAUSTED = "Not started: the token budget was exhausted"
+
+
+def run_tokens(run: Any) -> int:
+    """Total tokens a run (or run step) has reported so far (0 when it has no usage yet)."""
+    usage = getattr(run, "usage", None)
+    if usage is None:
+        return 0
+    return (getattr(usage, "prompt_tokens", 0) or 0) + (getattr(usage, "completion_tokens", 0) or 0)
+
+
+def step_tokens(steps: Iterable[Any]) -> int:
+    """Tokens reported by a run's steps so far.
+
+    The service reports a run's usage only once the run ends, but each step
+    reports its own as it completes, so this is what an active run has
+    spent up to now.
+    """
+    return sum(run_tokens(step) for step in steps)
+
+
+class TokenBudget:
+    """Caps the tokens a batch may spend, in total and per question.
+
+    admit() decides whether the next question may start, and check_run and
+    check_tokens tell when an active run is over the per-question cap.
+    Either limit may be None.
+    """
+
+    def __init__(
+        self,
+        max_total_tokens: Optional[int] = None,
+        max_tokens_per_question: Optional[int] = None,
+        token_estimate: int = 5000,
+        step_check_seconds: float = 10.0
+    ):
+        self.max_total_tokens = max_total_tokens
+        self.max_tokens_per_question = max_tokens_per_question
+        self.token_estimate = min(token_estimate, max_tokens_per_question or token_estimate)
+        self.step_check_seconds = step_check_seconds
+        self.spent = 0
+        self.runs_settled = 0
+        self.in_flight = 0
+        self.skipped = 0
+        self.exhausted = False
+        self._capped: Dict[str, str] = {}
+        self._step_checks: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def average_tokens(self) -> float:
+        """Mean tokens per run so far, or the estimate before any run has reported usage."""
+        with self._lock:
+            return self.spent / self.runs_settled if self.runs_settled else self.token_estimate
+
+    def admit(self) -> str:
+        """Decide whether the next question may be dispatched: ADMIT, WAIT or STOP.
+
+        An admitted question counts as in flight until settle() is called for it,
+        and each STOP counts one question as skipped.
+        """
+        average = self.average_tokens()
+        with self._lock:
+            if self.exhausted:
+                self.skipped += 1
+                return STOP
+            if self.max_total_tokens is not None:
+                projected = self.spent + (self.in_flight + 1) * average
+                if projected > self.max_total_tokens:
+                    if self.in_flight:
+                        return WAIT
+                    self.exhausted = True
+                    self.skipped += 1
+                    print(f"Token budget exhausted: {self.spent} of {self.max_total_tokens} tokens spent, "
+                          f"about {average:.0f} needed per question; no more questions will be started")
+                    return STOP
+            self.in_flight += 1
+            return ADMIT
+
+    def skip(self, count: int):
+        """Record count more questions left unstarted without asking admit(), as when a batch stops early."""
+        with self._lock:
+            self.skipped += count
+
+    def settle(self, result: Dict):
+        """Record the tokens an admitted question used once it has finished."""
+        tokens = result["metrics"].get("total_tokens") or 0
+        with self._lock:
+            self.in_flight -= 1
+            self.spent += tokens
+            if tokens:
+                self.runs_settled += 1
+
+    def watches(self, run: Any) -> bool:
+        """Whether the per-question cap applies to run: a cap is set and the run is active."""
+        return self.max_tokens_per_question is not None and run.status in ACTIVE_RUN_STATUSES
+
+    def check_tokens(self, run: Any, tokens: int) -> Optional[str]:
+        """Why an active run that has used tokens must be cancelled for exceeding the cap, or None."""
+        if not self.watches(run):
+            return None
+        tokens = max(tokens, run_tokens(run))
+        if tokens <= self.max_tokens_per_question:
+            return None
+        error = f"Run used {tokens} tokens, over the per-question cap of {self.max_tokens_per_question}"
+        with self._lock:
+            self._capped[run.id] = error
+        return error
+
+    def steps_due(self, run: Any) -> bool:
+        """Whether check_run should list an active run's steps now.
+
+        The first listing comes step_check_seconds after the run is first
+        seen and each later one step_check_seconds after the last, so long
+        runs cost one extra call per interval rather than per poll. A run
+        that already reports its own usage is never listed.
+        """
+        if not self.watches(run) or run_tokens(run):
+            with self._lock:
+                self._step_checks.pop(run.id, None)
+            return False
+        now = time.monotonic()
+        with self._lock:
+            last = self._step_checks.setdefault(run.id, now)
+            if now - last < self.step_check_seconds:
+                return False
+            self._step_checks[run.id] = now
+            return True
+
+    def check_run(self, agents_client: Any, run: Any) -> Optional[str]:
+        """Check an active run's usage, listing its steps with one run_steps.list call when steps_due."""
+        tokens = 0
+        if self.steps_due(run):
+            tokens = step_tokens(agents_client.run_steps.list(thread_id=run.thread_id, run_id=run.id))
+        return self.check_tokens(run, tokens)
+
+    async def check_run_async(self, agents_client: Any, run: Any) -> Optional[str]:
+        """check_run for an azure.ai.agents.aio AgentsClient."""
+        tokens = 0
+        if self.steps_due(run):
+            steps = agents_client.run_steps.list(thread_id=run.thread_id, run_id=run.id)
+            tokens = step_tokens([step async for step in steps])
+        return self.check_tokens(run, tokens)
+
+    def over_cap_error(self, run: Any) -> Optional[str]:
+        """Why run was cancelled for exceeding the per-question cap, or None (clears the run's records)."""
+        if run is None:
+            return None
+        with self._lock:
+            self._step_checks.pop(run.id, None)
+            return self._capped.pop(run.id, None)
+
+    def summary(self) -> str:
+        limit = f" of {self.max_total_tokens}" if self.max_total_tokens is not None else ""
+        skipped = f"; {self.skipped} questions not started" if self.skipped else ""
+        return f"Token budget: {self.spent}{limit} tokens spent over {self.runs_settled} runs{skipped}"
+
+
+def create_token_budget(
+    max_total_tokens: Optional[int] = None,
+    max_tokens_per_question: Optional[int] = None
+) -> Optional[TokenBudget]:
+    """Build a TokenBudget, or None when neither limit is set.
+
+    The projection starts from RATE_LIMIT_TOKEN_ESTIMATE tokens per run, the
+    same estimate the rate limiter uses before real usage is known. An
+    active run's steps are listed at most every TOKEN_CAP_CHECK_SECONDS
+    (default 10).
+    """
+    if max_total_tokens is None and max_tokens_per_question is None:
+        return None
+    return TokenBudget(
+        max_total_tokens=max_total_tokens,
+        max_tokens_per_question=max_tokens_per_question,
+        token_estimate=int(os.getenv("RATE_LIMIT_TOKEN_ESTIMATE", "5000")),
+        step_check_seconds=float(os.getenv("TOKEN_CAP_CHECK_SECONDS", "10")),
+    )
@@ -1,8 +1,10 @@
 import os
+import sys
 import json
 import time
 from datetime import datetime
 from typing import Dict, List, Optional, Tuple
+import functools
 import concurrent.futures
 import re
 
@@ -11,6 +13,14 @@ from azure.identity import DefaultAzureCredential
 from azure.ai.agents import AgentsClient
 from azure.ai.agents.models import BingGroundingTool, MessageRole, BingCustomSearchTool
 
+# Helpers shared by the research runners live in ../common
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+from poll_scheduler import PollScheduler, FixedPollScheduler, create_poll_scheduler
+from rate_limiter import RateLimiter, create_rate_limiter
+from graceful_shutdown import GracefulShutdown, create_graceful_shutdown, print_incomplete
+from connection_cache import ConnectionCache, create_connection_cache
+from preflight import PROJECT_SCOPE, SharedTokenCredential, run_preflight
+
 
 def load_search_data(json_path: str) -> List[Dict]:
     """Load search simulation data from JSON file."""
@@ -163,7 +173,26 @@ def get_or_create_agent_for_role(agents_client: AgentsClient, role_name: str, in
     return agent, True
 
 
-def build_role_tools(project_client: AIProjectClient) -> dict:
+def custom_connection_for_role(role: str) -> Tuple[Optional[str], Optional[str]]:
+    """Bing custom search connection name and instance name configured for a role (see build_role_tools)."""
+    # First try role-specific naming convention, then the legacy one, then the defaults
+    conn_env = (os.environ.get(f"BING_{role.upper()}_CONNECTION_NAME") or
+                os.environ.get(f"BING_CUSTOM_CONNECTION_NAME_{role.upper()}") or
+                os.environ.get("BING_CUSTOM_CONNECTION_NAME"))
+    instance_env = (os.environ.get(f"BING_{role.upper()}_INSTANCE_NAME") or
+                    os.environ.get(f"BING_CUSTOM_INSTANCE_NAME_{role.upper()}") or
+                    os.environ.get("BING_CUSTOM_INSTANCE_NAME"))
+    return conn_env, instance_env
+
+
+def role_connection_name(role: str) -> Optional[str]:
+    """Name of the connection a role's tool uses, or None."""
+    if role == 'all_attributes':
+        return os.environ.get("BING_GROUNDED_CONNECTION_NAME")
+    return custom_connection_for_role(role)[0]
+
+
+def build_role_tools(project_client: AIProjectClient, connection_cache: Optional[ConnectionCache] = None) -> dict:
     """Construct tool instances for each agent role, using distinct Bing custom configs per role.
     
     Environment variables for custom role-specific Bing configurations:
@@ -186,35 +215,28 @@ def build_role_tools(project_client: AIProjectClient) -> dict:
       - If role-specific variables are missing, falls back to:
       - BING_CUSTOM_CONNECTION_NAME - Default connection name
       - BING_CUSTOM_INSTANCE_NAME - Default instance name
+    
+    Connection ids come from connection_cache when given (otherwise they are
+    resolved for this call only); the connections not cached are resolved
+    concurrently.
     """
     roles = {}
+    if connection_cache is None:
+        connection_cache = ConnectionCache(None, endpoint="")
+
+    # Resolve every configured connection at once; failures are reported per role below
+    conn_names = {role_connection_name(role) for role in ('all_attributes', 'ingredients', 'nutrition', 'reviews')}
+    conn_names.discard(None)
+    resolved = {}
+    if conn_names:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(conn_names)) as executor:
+            resolved = {name: executor.submit(connection_cache.resolve, project_client, name) for name in conn_names}
 
     def _get_custom_tool_for_role(role: str):
-        # First try role-specific naming convention
-        primary_conn_var = f"BING_{role.upper()}_CONNECTION_NAME"
-        primary_instance_var = f"BING_{role.upper()}_INSTANCE_NAME"
-        
-        # Fall back to legacy naming convention
-        legacy_conn_var = f"BING_CUSTOM_CONNECTION_NAME_{role.upper()}"
-        legacy_instance_var = f"BING_CUSTOM_INSTANCE_NAME_{role.upper()}"
-        
-        # Final fallback to default vars
-        default_conn_var = "BING_CUSTOM_CONNECTION_NAME"
-        default_instance_var = "BING_CUSTOM_INSTANCE_NAME"
-        
-        # Try each naming convention in order of preference
-        conn_env = (os.environ.get(primary_conn_var) or 
-                    os.environ.get(legacy_conn_var) or 
-                    os.environ.get(default_conn_var))
-        
-        instance_env = (os.environ.get(primary_instance_var) or 
-                       os.environ.get(legacy_instance_var) or 
-                       os.environ.get(default_instance_var))
-        
+        conn_env, instance_env = custom_connection_for_role(role)
         if conn_env:
             try:
-                connection = project_client.connections.get(name=conn_env)
-                conn_id = connection.id
+                conn_id = resolved[conn_env].result()
                 print(f"Resolved connection for {role}: {conn_id} (instance: {instance_env})")
                 print(f"Using: Connection={conn_env}, Instance={instance_env}")
                 return BingCustomSearchTool(connection_id=conn_id, instance_name=instance_env)
@@ -229,9 +251,9 @@ def build_role_tools(project_client: AIProjectClient) -> dict:
     grounding_conn_name = os.environ.get("BING_GROUNDED_CONNECTION_NAME")
     if grounding_conn_name:
         try:
-            connection = project_client.connections.get(name=grounding_conn_name)
-            print(f"Resolved Bing Grounding connection: {connection.id} (name: {grounding_conn_name})")
-            roles['all_attributes'] = BingGroundingTool(connection_id=connection.id)
+            conn_id = resolved[grounding_conn_name].result()
+            print(f"Resolved Bing Grounding connection: {conn_id} (name: {grounding_conn_name})")
+            roles['all_attributes'] = BingGroundingTool(connection_id=conn_id)
         except Exception as e:
             print(f"Could not resolve Bing Grounding connection '{grounding_conn_name}': {e}")
             print("Falling back to default BingGroundingTool without explicit connection")
@@ -303,16 +325,30 @@ def process_batch_bing_search_for_agent(
     agent_id: str,
     thread_id: str,
     output_base_path: str,
-    role: str
+    role: str,
+    poll_scheduler: Optional[PollScheduler] = None,
+    rate_limiter: Optional[RateLimiter] = None,
+    shutdown: Optional[GracefulShutdown] = None
 ) -> List[Dict]:
-    """Run a per-role processing pass over the products, extract citations, attributes, and save outputs."""
+    """Run a per-role processing pass over the products, extract citations, attributes, and save outputs.
+
+    With a rate_limiter, a run that fails on a rate limit is started again on the same thread.
+    Once shutdown is requested no further product is started; the outputs are
+    still saved and the products left unfinished are listed.
+    """
     os.makedirs(output_base_path, exist_ok=True)
+    poll_scheduler = poll_scheduler or FixedPollScheduler()
 
     results = []
+    incomplete = []
 
     for i, product in enumerate(products, 1):
+        if shutdown and shutdown.requested.is_set():
+            incomplete.extend((n, f"[{role}] UPC {p['search_params']['upc']}") for n, p in enumerate(products[i - 1:], i))
+            break
         print(f"\n[{role}] Processing product {i}/{len(products)}: UPC={product['search_params']['upc']}")
 
+        run = None
         try:
             # Create role-specific prompt - passing the role parameter
             prompt = create_search_prompt(product, role)
@@ -325,23 +361,35 @@ def process_batch_bing_search_for_agent(
             run = agents_client.runs.create(thread_id=thread_id, agent_id=agent_id)
             timeout = int(os.getenv("BATCH_TIMEOUT_SECONDS", "120"))
             heartbeat_interval = 10
-            loop_seconds = 0
+            # Measured on the monotonic clock so slow runs.get calls count towards the timeout
+            started = time.monotonic()
+            elapsed = 0.0
+            next_heartbeat = heartbeat_interval
+            requeues = 0
 
             while run.status in ("queued", "in_progress"):
-                time.sleep(1)
-                loop_seconds += 1
-                if loop_seconds % heartbeat_interval == 0:
-                    print(f"[{role}] Still processing product {i}, elapsed {loop_seconds}s")
-                if loop_seconds >= timeout:
+                interval = min(poll_scheduler.next_interval(elapsed), max(timeout - elapsed, 0))
+                time.sleep(interval)
+                elapsed = time.monotonic() - started
+                if elapsed >= next_heartbeat:
+                    print(f"[{role}] Still processing product {i}, elapsed {elapsed:.0f}s")
+                    next_heartbeat = (elapsed // heartbeat_interval + 1) * heartbeat_interval
+                if elapsed >= timeout:
                     print(f"[{role}] Timeout after {timeout}s for product {i}, aborting run.")
                     break
                 run = agents_client.runs.get(thread_id=thread_id, run_id=run.id)
+                if rate_limiter is not None and rate_limiter.requeue_throttled_run(run, requeues):
+                    requeues += 1
+                    run = agents_client.runs.create(thread_id=thread_id, agent_id=agent_id)
+                    continue
 
                 response = agents_client.messages.get_last_message_by_role(thread_id=thread_id, role=MessageRole.AGENT)
                 if response and response.text_messages:
                     print(f"[{role}] Partial response so far:\n{response.text_messages[-1].text.value}\n")
                     response_text = "\n".join(t.text.value for t in response.text_messages)
 
+            if run.status == "completed":
+                poll_scheduler.record(time.monotonic() - started)
 
             discovered = extract_attributes(response_text)
 
@@ -416,6 +464,15 @@ def process_batch_bing_search_for_agent(
                 "citations": [],
                 "role": role,
             })
+        finally:
+            if rate_limiter is not None:
+                rate_limiter.release_run(run)
+
+        if shutdown and shutdown.requested.is_set() and results[-1]["status"] != "completed":
+            incomplete.append((i, f"[{role}] UPC {product['search_params']['upc']}"))
+
+    if shutdown and shutdown.requested.is_set():
+        print_incomplete(incomplete)
 
     out_json = f"{output_base_path}/{role}_batch_search_results.json"
     with open(out_json, 'w', encoding='utf-8') as f:
@@ -434,12 +491,21 @@ def process_batch_bing_search_for_agent(
 
 def main():
     try:
+        # Every client shares one token per scope
+        endpoint = os.environ["PROJECT_ENDPOINT_MULTI_AGENT_EXPERIMENTS"]
+        credential = SharedTokenCredential(DefaultAzureCredential())
         project_client = AIProjectClient(
-            endpoint=os.environ["PROJECT_ENDPOINT_MULTI_AGENT_EXPERIMENTS"],
-            credential=DefaultAzureCredential(),
+            endpoint=endpoint,
+            credential=credential,
         )
+        # Connection ids are cached on disk (CONNECTION_CACHE_FILE / CONNECTION_CACHE_TTL_SECONDS)
+        connection_cache = create_connection_cache(endpoint)
 
-        role_tools = build_role_tools(project_client)
+        # The token is fetched while the role connections are resolved
+        role_tools = run_preflight({
+            "credential": lambda: credential.get_token(PROJECT_SCOPE),
+            "connections": lambda: build_role_tools(project_client, connection_cache),
+        })["connections"]
 
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         top_output_dir = f"multi_agent_with_bing_results_{timestamp}"
@@ -450,6 +516,12 @@ def main():
 
         with project_client:
             with project_client.agents as agents_client:
+                # All role workers share one dispatcher so together they stay under AGENTS_RPM / AGENTS_TPM
+                rate_limiter = create_rate_limiter()
+                agents_client = rate_limiter.wrap(agents_client)
+                # SIGINT/SIGTERM stop every role worker and cancel their runs instead of killing the process
+                shutdown = create_graceful_shutdown()
+
                 role_instructions = {
                     'all_attributes': 
                         "You are an exhaustive product attribute discovery agent. When given product info, find every attribute available: title, brand, full ingredients, nutrition facts, packaging, weights, SKUs, flavors, certifications, and customer feedback. ALWAYS include complete URLs for your sources - not just reference numbers. For every piece of information, include the full URL you found it on. Format citations as 'Source: https://example.com' directly after the information.",
@@ -465,23 +537,51 @@ def main():
                     
                 }
 
-                agents_by_role = {}
-                for role, instruction in role_instructions.items():
+                def setup_role(role: str, instruction: str) -> Dict:
                     tool = role_tools.get(role)
-                    agent, is_new = get_or_create_agent_for_role(agents_client, role, instruction, tool)
-                    agents_by_role[role] = {
+                    try:
+                        agent, is_new = get_or_create_agent_for_role(agents_client, role, instruction, tool)
+                    except Exception as e:
+                        conn_name = role_connection_name(role)
+                        if not conn_name or not connection_cache.was_cached(conn_name):
+                            raise
+                        print(f"Could not set up role '{role}' with the cached id of connection '{conn_name}' ({e}); resolving it again")
+                        connection_cache.invalidate(conn_name)
+                        tool = build_role_tools(project_client, connection_cache).get(role)
+                        agent, is_new = get_or_create_agent_for_role(agents_client, role, instruction, tool)
+                    thread = agents_client.threads.create()
+                    print(f"Created thread for role '{role}': {thread.id}")
+                    return {
                         'agent': agent,
                         'tool': tool,
                         'is_new': is_new,
+                        'thread_id': thread.id,
                     }
 
-                threads_by_role = {}
-                for role, meta in agents_by_role.items():
-                    thread = agents_client.threads.create()
-                    threads_by_role[role] = thread.id
-                    print(f"Created thread for role '{role}': {thread.id}")
-
-                with concurrent.futures.ThreadPoolExecutor(max_workers=len(agents_by_role)) as executor:
+                # Role agents are looked up (or created) and given a thread concurrently,
+                # while the connection ids served from the cache are checked
+                conn_names = {role_connection_name(role) for role in role_instructions} - {None}
+                agents_by_role = run_preflight({
+                    **{role: functools.partial(setup_role, role, instruction)
+                       for role, instruction in role_instructions.items()},
+                    "connection_check": lambda: connection_cache.revalidate(project_client, conn_names),
+                })
+                changed = agents_by_role.pop("connection_check")
+                if changed:
+                    # A recreated connection keeps its name, so point the agents using it at the current id
+                    role_tools = build_role_tools(project_client, connection_cache)
+                    for role, meta in agents_by_role.items():
+                        tool = role_tools.get(role)
+                        if role_connection_name(role) not in changed or tool is None:
+                            continue
+                        if meta['tool'] is None or tool.definitions != meta['tool'].definitions:
+                            meta['agent'] = agents_client.update_agent(meta['agent'].id, tools=tool.definitions)
+                            meta['tool'] = tool
+                            print(f"Updated the agent for role '{role}' to the current id of connection '{role_connection_name(role)}'")
+                threads_by_role = {role: meta['thread_id'] for role, meta in agents_by_role.items()}
+
+                agents_client = shutdown.wrap(agents_client)
+                with shutdown, concurrent.futures.ThreadPoolExecutor(max_workers=len(agents_by_role)) as executor:
                     future_to_role = {}
                     for role, meta in agents_by_role.items():
                         out_dir = os.path.join(top_output_dir, role)
@@ -495,6 +595,9 @@ def main():
                             threads_by_role[role],
                             out_dir,
                             role,
+                            create_poll_scheduler(key=f"bing_{role}"),
+                            rate_limiter,
+                            shutdown,
                         )
                         future_to_role[future] = role
 
@@ -512,7 +615,11 @@ def main():
                 with open(combined_file, 'w', encoding='utf-8') as f:
                     json.dump(all_agent_results, f, indent=2)
 
-                print(f"Multi-agent processing complete. Results saved in {top_output_dir}/")
+                status = "stopped" if shutdown.requested.is_set() else "complete"
+                print(f"Multi-agent processing {status}. Results saved in {top_output_dir}/")
+
+        if shutdown.requested.is_set():
+            sys.exit(shutdown.exit_code)
 
     except Exception as e:
         print(f"Error in multi-agent main: {str(e)}")